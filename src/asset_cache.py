@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+所有浏览器共用的磁盘静态资源缓存（context.route）：
+  - 挂了 route 之后 Playwright 不用浏览器自己的 HTTP 缓存，每个新浏览器 / 新 context 都会经代理重新下载 JS / CSS bundle；
+    这里把带内容 hash 的不可变资源（ASSET_CACHE_URL_PATTERN，或响应头 Cache-Control: immutable）存到本地，
+    之后所有 worker、所有进程、以后每次运行都直接 route.fulfill，不再经过代理
+  - 内容寻址：文件按 sha256 存在 blobs/ 下，URL -> sha256 的索引放在 SQLite（WAL，多进程共用）
+  - 总大小超过 ASSET_CACHE_MAX_MB 时按最近使用时间淘汰（LRU），被淘汰且没有别的索引引用的文件一起删掉；
+    总大小在内存里累加，只有超过上限时才查库 / 删文件
+  - sync route 没命中就自己下载、存好：不跨线程等别人的下载（route.fetch() 等待期间 sync API 会在同一线程里处理
+    其他 route，两个 worker 互相等对方的 URL 会一起卡住）；冷启动时同一个 bundle 多下几次也不贵
+  - async route 在同一个事件循环里去重：同一个 URL 同时只下载一次，其他协程最多等 ASSET_FETCH_WAIT 秒再查一次缓存
+  - 只接管 GET 的 ASSET_CACHE_TYPES 类型请求；文档、XHR / fetch（每笔 tx 的数据）照常走代理
+  - 装在 context 上，page 上的资源过滤先执行，被它拦掉的不会到这里
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+from threading import Lock, get_ident
+
+from metrics import METRICS
+
+ASSET_CACHE = os.getenv("ASSET_CACHE", "1") == "1"
+ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", "data/asset_cache")
+ASSET_CACHE_MAX_MB = float(os.getenv("ASSET_CACHE_MAX_MB", "200"))
+ASSET_CACHE_TYPES = tuple(
+    t.strip().lower() for t in os.getenv("ASSET_CACHE_TYPES", "script,stylesheet,font,image").split(",") if t.strip()
+)
+# 文件名里带内容 hash 的构建产物（app.3f9a1c2e.js、/_next/static/...），内容变了 URL 一定变
+ASSET_CACHE_URL_PATTERN = re.compile(os.getenv(
+    "ASSET_CACHE_URL_PATTERN",
+    r"/_next/static/|[.-][0-9a-f]{8,}\.(?:js|mjs|css|woff2?|ttf|png|svg|webp)(?:\?|$)",
+))
+
+# 回放时保留的响应头（body 已经解压过，编码 / 长度类的头不能照搬）
+_KEEP_HEADERS = ("content-type", "cache-control", "access-control-allow-origin", "timing-allow-origin")
+_TOUCH_INTERVAL = 60.0   # 命中时最多每分钟更新一次最近使用时间，避免每个请求都写库（LRU 精度到分钟）
+ASSET_FETCH_WAIT = float(os.getenv("ASSET_FETCH_WAIT", "15"))   # async：等别的协程下载同一个 URL 最多等多久（秒）
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    url        TEXT PRIMARY KEY,
+    sha256     TEXT NOT NULL,
+    size       INTEGER NOT NULL,
+    headers    TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used  REAL NOT NULL
+)
+"""
+
+
+def is_immutable(url: str, headers: dict | None = None) -> bool:
+    if ASSET_CACHE_URL_PATTERN.search(url):
+        return True
+    return "immutable" in (headers or {}).get("cache-control", "").lower()
+
+
+class AssetCache:
+    """
+    线程安全，一个进程一个实例（asset_store()），所有 worker 共用：
+
+        store = asset_store()
+        store.install(context)                # sync context
+        await store.install_async(context)    # async context
+    """
+
+    def __init__(self, path: str = ASSET_CACHE_DIR, max_bytes: float = ASSET_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.blob_dir = os.path.join(path, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.conn = sqlite3.connect(
+            os.path.join(path, "index.sqlite"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(_SCHEMA)
+        # 索引里的总大小（本进程的写入累加上去；淘汰时按库里的实际值校正，其他进程的写入到那时才算进来）
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM assets").fetchone()[0]
+        # async：正在下载的 URL -> 下载完成的 Event；下载结束就删掉
+        self._fetching_async: dict[str, asyncio.Event] = {}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # ---------- 存储 ----------
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def get(self, url: str) -> tuple[bytes, dict] | None:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT sha256, headers, last_used FROM assets WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            digest, headers, last_used = row
+            if now - last_used > _TOUCH_INTERVAL:
+                self.conn.execute("UPDATE assets SET last_used = ? WHERE url = ?", (now, url))
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                body = f.read()
+        except OSError:
+            # 文件被别的进程淘汰掉了：当作没命中
+            with self.lock:
+                self.conn.execute("DELETE FROM assets WHERE url = ?", (url,))
+            return None
+        return body, json.loads(headers)
+
+    def put(self, url: str, body: bytes, headers: dict):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 多个线程可能同时存同一个文件（sync route 不去重），临时文件按进程 + 线程区分
+            tmp = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+        kept = {k: v for k, v in headers.items() if k.lower() in _KEEP_HEADERS}
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM assets WHERE url = ?", (url,)).fetchone()
+            self.conn.execute(
+                "INSERT INTO assets (url, sha256, size, headers, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET sha256=excluded.sha256, size=excluded.size, "
+                "headers=excluded.headers, last_used=excluded.last_used",
+                (url, digest, len(body), json.dumps(kept), now, now),
+            )
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            over = self.total_bytes > self.max_bytes
+        METRICS.incr("asset_cache_stored_bytes_total", len(body))
+        if over:
+            self.evict()
+
+    def evict(self):
+        """按 last_used 从旧到新删索引，直到总大小回到上限的 90%；被删的文件没有别的索引引用时一起删掉"""
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM assets").fetchone()[0]
+            self.total_bytes = total
+            if total <= self.max_bytes:
+                return
+            target = self.max_bytes * 0.9
+            dropped: list[tuple[str, str]] = []
+            for url, digest, size in self.conn.execute(
+                "SELECT url, sha256, size FROM assets ORDER BY last_used"
+            ).fetchall():
+                if total <= target:
+                    break
+                dropped.append((url, digest))
+                total -= size
+            self.conn.executemany("DELETE FROM assets WHERE url = ?", [(u,) for u, _ in dropped])
+            self.total_bytes = total
+            orphans = {
+                digest for _, digest in dropped
+                if self.conn.execute("SELECT 1 FROM assets WHERE sha256 = ? LIMIT 1", (digest,)).fetchone() is None
+            }
+
+        removed = 0
+        for digest in orphans:
+            try:
+                os.remove(self._blob_path(digest))
+                removed += 1
+            except OSError:
+                pass
+        METRICS.incr("asset_cache_evictions_total", len(dropped))
+        logging.info("[asset-cache] evicted %d entries (%d files), size now %.1f MB",
+                     len(dropped), removed, total / 1024 / 1024)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            count, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM assets").fetchone()
+        return {"entries": count, "mb": round(size / 1024 / 1024, 1)}
+
+    # ---------- route ----------
+    @staticmethod
+    def wants(request) -> bool:
+        return request.method == "GET" and request.resource_type in ASSET_CACHE_TYPES
+
+    def _hit(self, url: str) -> dict | None:
+        hit = self.get(url)
+        if hit is None:
+            return None
+        body, headers = hit
+        METRICS.incr("asset_cache_hits_total")
+        METRICS.incr("asset_cache_hit_bytes_total", len(body))
+        return {"status": 200, "headers": headers, "body": body}
+
+    def _store(self, url: str, status: int, headers: dict, body: bytes):
+        METRICS.incr("asset_cache_misses_total")
+        if status == 200 and is_immutable(url, headers):
+            self.put(url, body, headers)
+
+    def _handle(self, route):
+        req = route.request
+        if not self.wants(req):
+            route.fallback()
+            return
+        url = req.url
+        hit = self._hit(url)
+        if hit is not None:
+            route.fulfill(**hit)
+            return
+        try:
+            # route.fetch 用的是这个 context 的网络设置（同一个代理）；不跨线程去重，见模块说明
+            resp = route.fetch()
+            body = resp.body()
+        except Exception as e:
+            logging.debug("[asset-cache] fetch %s failed: %s", url, repr(e))
+            route.fallback()
+            return
+        self._store(url, resp.status, resp.headers, body)
+        route.fulfill(response=resp, body=body)
+
+    async def _handle_async(self, route):
+        req = route.request
+        if not self.wants(req):
+            await route.fallback()
+            return
+        url = req.url
+        hit = self._hit(url)
+        if hit is not None:
+            await route.fulfill(**hit)
+            return
+        pending = self._fetching_async.get(url)
+        if pending is None:
+            self._fetching_async[url] = asyncio.Event()
+        else:
+            try:
+                await asyncio.wait_for(pending.wait(), ASSET_FETCH_WAIT)
+            except asyncio.TimeoutError:
+                pass
+            hit = self._hit(url)
+            if hit is not None:
+                await route.fulfill(**hit)
+                return
+        try:
+            resp = await route.fetch()
+            body = await resp.body()
+        except Exception as e:
+            logging.debug("[asset-cache] fetch %s failed: %s", url, repr(e))
+            await route.fallback()
+            return
+        else:
+            self._store(url, resp.status, resp.headers, body)
+        finally:
+            if pending is None:
+                self._fetching_async.pop(url).set()
+        await route.fulfill(response=resp, body=body)
+
+    def install(self, context):
+        context.route("**/*", self._handle)
+
+    async def install_async(self, context):
+        await context.route("**/*", self._handle_async)
+
+
+_STORE: AssetCache | None = None
+_STORE_LOCK = Lock()
+
+
+def asset_store() -> AssetCache | None:
+    """进程内共用的实例，第一次用到时才建目录、开库；ASSET_CACHE=0 时返回 None"""
+    global _STORE
+    if not ASSET_CACHE:
+        return None
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = AssetCache()
+        return _STORE
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+离线 benchmark：不需要线上站点、代理和 Dune
+  - 起一个本地 usdc.range.org 替身（fake_range_server，可配延迟 / 抖动 / 失败率）
+  - rpc 引擎再起一个 JSON-RPC 替身（fake_rpc_server），foreign_rate 比例的源链是 Solana，交给 HTTP 兜底
+  - 用 FakeDune 替换 main.DUNE（返回生成的 N 个 tx_hash，上传只计数）
+  - 跑指定引擎，输出 tx/s、单笔 p50/p95/p99、峰值 RSS（含所有子进程，即 Chromium）
+
+用法：
+    python src/bench.py --hashes 200 --workers 5 --engine thread
+    python src/bench.py --hashes 1000 --workers 50 --engine async --latency 0.3 --jitter 0.2 --failure-rate 0.05
+    python src/bench.py --hashes 5000 --workers 64 --engine http
+    python src/bench.py --hashes 5000 --workers 8 --engine listing
+    python src/bench.py --hashes 5000 --workers 32 --engine stream --dune-page-size 500
+    python src/bench.py --hashes 5000 --workers 8 --engine rpc --foreign-rate 0.1
+"""
+import os
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+from threading import Thread, Event
+
+
+class FakeDune:
+    """
+    DuneClient 替身：run_query_dataframe 返回给定的 hash（带 fake_range_server 同样算法生成的 block_time），
+    execute_query / get_execution_status / get_execution_results 模拟分页读取，insert_table 只记字节数
+    """
+
+    def __init__(self, hashes: list[str], column: str, time_column: str):
+        from fake_range_server import synthetic_block_time
+        self.hashes = hashes
+        self.column = column
+        self.time_column = time_column
+        self.times = [synthetic_block_time(h) for h in hashes]
+        self.uploaded_bytes = 0
+
+    def run_query_dataframe(self, query, performance=None, **kwargs):
+        import pandas as pd
+        return pd.DataFrame({self.column: self.hashes, self.time_column: self.times})
+
+    def execute_query(self, query, performance=None):
+        from types import SimpleNamespace
+        return SimpleNamespace(execution_id="bench")
+
+    def get_execution_status(self, job_id):
+        from types import SimpleNamespace
+        from dune_client.models import ExecutionState
+        return SimpleNamespace(state=ExecutionState.COMPLETED)
+
+    def get_execution_results(self, job_id, limit=None, offset=None, columns=None, **kwargs):
+        from types import SimpleNamespace
+        offset = offset or 0
+        end = offset + (limit or len(self.hashes))
+        rows = [
+            {self.column: h, self.time_column: t} for h, t in zip(self.hashes[offset:end], self.times[offset:end])
+        ]
+        return SimpleNamespace(get_rows=lambda: rows, next_offset=end if end < len(self.hashes) else None)
+
+    def insert_table(self, namespace, table_name, data, content_type):
+        self.uploaded_bytes += len(data.read())
+
+
+def _tree_rss_bytes(root_pid: int) -> int:
+    """root_pid 及其所有子孙进程的 RSS 之和（读 /proc，仅 Linux）"""
+    children: dict[int, list[int]] = {}
+    rss: dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+            # comm 里可能有空格，从最后一个 ')' 之后开始切
+            fields = stat[stat.rindex(")") + 2:].split()
+            pid, ppid = int(entry), int(fields[1])
+            rss[pid] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+            children.setdefault(ppid, []).append(pid)
+        except (OSError, ValueError, IndexError):
+            continue
+
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total
+
+
+class RssSampler(Thread):
+    def __init__(self, interval: float = 0.2):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, _tree_rss_bytes(os.getpid()))
+            self.stopped.wait(self.interval)
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+def random_hashes(n: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+    return ["0x%064x" % rnd.getrandbits(256) for _ in range(n)]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run(args) -> dict:
+    # main / range_api 在 import 时读取配置，所以端口和环境变量必须在 import 之前定好
+    port = _free_port()
+    rpc_port = _free_port()
+    workdir = tempfile.mkdtemp(prefix="cctp-bench-")
+    os.environ.update({
+        "RANGE_BASE_URL": f"http://127.0.0.1:{port}",
+        "PROXY_SERVER": "",
+        "ERROR_LOG_PATH": os.path.join(workdir, "bench.log"),
+        "RUN_REPORT_PATH": os.path.join(workdir, "run_report.json"),
+        "RESULT_CACHE": "0",
+        "STREAMING": "0",
+        "HTTP_RESOLVER": "1",
+        "N_BROWSERS": str(args.workers),
+        "ASYNC_CONCURRENCY": str(args.workers),
+        "HTTP_CONCURRENCY": str(args.workers),
+        "SELECTOR_TIMEOUT": str(args.selector_timeout),
+        "DUNE_PAGE_SIZE": str(args.dune_page_size),
+        "DUNE_MAX_AGE_HOURS": "0",
+        "RPC_RESOLVER": "1" if args.engine == "rpc" else "0",
+        "RPC_ENDPOINTS": f"0=http://127.0.0.1:{rpc_port}/0,3=http://127.0.0.1:{rpc_port}/3",
+        "RPC_CONCURRENCY": str(args.workers),
+    })
+    import main
+    from metrics import METRICS
+    from fake_range_server import start_fake_server
+    import fake_rpc_server
+
+    main.setup_logging()
+    hashes = random_hashes(args.hashes, args.seed)
+    server, _ = start_fake_server(
+        port=port,
+        listing_hashes=hashes if args.engine == "listing" else None,
+        synthetic=True,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        render_ms=args.render_ms,
+        throttle_rps=args.throttle_rps,
+    )
+
+    rpc_server = None
+    if args.engine == "rpc":
+        rpc_server, _ = fake_rpc_server.start_fake_server(
+            port=rpc_port, synthetic=True, foreign_rate=args.foreign_rate, latency=args.latency,
+        )
+
+    main.DUNE = FakeDune(hashes, main.DUNE_HASH_COLUMN, main.DUNE_TIME_COLUMN)
+
+    sampler = RssSampler()
+    sampler.start()
+    t0 = time.time()
+
+    df_hash = main.load_dune_hashes() if args.engine != "stream" else None
+    if args.engine == "stream":
+        # Dune 分页 -> HTTP -> 有界队列 -> 浏览器（HTTP 失败的才开浏览器）
+        ok = len(main.stream_cctp_df(main.iter_dune_hashes()))
+        latency_metric = "http_resolve_seconds"
+    elif args.engine == "http":
+        records, _ = main.resolve_via_http(df_hash[main.DUNE_HASH_COLUMN].tolist())
+        ok = len(records)
+        latency_metric = "http_resolve_seconds"
+    elif args.engine == "rpc":
+        # 链上解码，源链不支持的（Solana）走 HTTP
+        records, _ = main.resolve_without_browser(df_hash[main.DUNE_HASH_COLUMN].tolist())
+        ok = len(records)
+        latency_metric = "rpc_batch_seconds"
+    elif args.engine == "listing":
+        records, _ = main.resolve_via_listing(df_hash[main.DUNE_HASH_COLUMN].tolist(), main.dune_window(df_hash))
+        ok = len(records)
+        latency_metric = "listing_page_seconds"
+    elif args.engine == "async":
+        ok = len(main.build_cctp_df_async(df_hash))
+        latency_metric = "tx_seconds"
+    else:
+        ok = len(main.build_cctp_df(df_hash))
+        latency_metric = "tx_seconds"
+
+    elapsed = time.time() - t0
+    peak_rss = sampler.stop()
+    server.shutdown()
+    if rpc_server:
+        rpc_server.shutdown()
+
+    report = METRICS.report()
+    hist = report["histograms"].get(latency_metric, {})
+    return {
+        "engine": args.engine,
+        "hashes": args.hashes,
+        "workers": args.workers,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "failure_rate": args.failure_rate,
+        "ok": ok,
+        "failed": args.hashes - ok,
+        "throttled": report["counters"].get("throttled_total", 0),
+        "elapsed_seconds": round(elapsed, 3),
+        "tx_per_second": round(ok / elapsed, 3) if elapsed else 0.0,
+        "p50_seconds": hist.get("p50", 0.0),
+        "p95_seconds": hist.get("p95", 0.0),
+        "p99_seconds": hist.get("p99", 0.0),
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for the CCTP resolver")
+    parser.add_argument("--hashes", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=5)
+    parser.add_argument("--engine", choices=["thread", "async", "http", "listing", "stream", "rpc"], default="thread")
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--render-ms", type=int, default=50)
+    parser.add_argument("--selector-timeout", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--throttle-rps", type=int, default=0, help="fake site answers 429 above this rate")
+    parser.add_argument("--foreign-rate", type=float, default=0.1, help="fraction of rpc engine transfers from Solana")
+    parser.add_argument("--dune-page-size", type=int, default=1000, help="page size of the stream engine")
+    parser.add_argument("--out", help="also write the result JSON to this path")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+browser_worker 持有的浏览器会话（page / context 生命周期管理）：
+  - 第一次要 page 时才启动 Playwright + Browser（也可以用 start() 提前在后台拉起）
+  - 每个浏览器的第一个 context 先预热（打开站点首页：连接、cookie、JS bundle），和正式请求一样先过 RATE_LIMITER；
+    之后回收重建的 context 不再预热（每次回收都多一次首页请求，对站点和代理都是额外负担）
+  - 浏览器起不来时按退避重试启动（BROWSER_LAUNCH_ATTEMPTS 次）；本进程还从来没起来过一个浏览器（没装 Chromium、
+    缺系统库……），或者连续失败到上限，才抛 BrowserLaunchError：和具体 tx 无关，worker 据此停掉整个浏览器阶段，
+    不再让每笔 tx 各自超时
+  - page 导航 PAGE_MAX_NAVIGATIONS 次后，或出现一次失败（超时 / 页面卡死）后，整个 context 回收重建
+  - browser 崩溃 / 断开时原地重启，worker 线程和它手上的 tx 都不丢
+  - 有代理池时每个 context 租一个代理（new_context(proxy=...)），context 回收时归还；
+    失败后重建的 context 优先换一个代理
+
+注意：page 上挂了 route（资源过滤）时 Playwright 会关闭 HTTP 缓存，
+预热只剩下连接和 cookie 的收益，JS bundle 的复用靠 context 上挂的磁盘资源缓存（asset_cache，所有 worker 共用）。
+"""
+from __future__ import annotations
+
+import os
+import time
+import logging
+from typing import TYPE_CHECKING
+
+from range_api import RANGE_BASE_URL
+from rate_limiter import RATE_LIMITER
+from resource_filter import ResourceFilter, RESOURCE_FILTER
+from asset_cache import asset_store
+from metrics import METRICS
+from proxy_pool import ProxyPool, Proxy
+
+if TYPE_CHECKING:
+    from playwright.sync_api import Page
+
+PAGE_MAX_NAVIGATIONS = int(os.getenv("PAGE_MAX_NAVIGATIONS", "50"))   # 一个 context 最多导航多少次后回收
+PREWARM = os.getenv("PREWARM", "1") == "1"
+PREWARM_URL = os.getenv("PREWARM_URL", RANGE_BASE_URL + "/")
+PREWARM_TIMEOUT = float(os.getenv("PREWARM_TIMEOUT", "20.0"))
+BROWSER_LAUNCH_ATTEMPTS = int(os.getenv("BROWSER_LAUNCH_ATTEMPTS", "4"))       # 启动过浏览器之后，重启最多连续试几次
+BROWSER_LAUNCH_BACKOFF = float(os.getenv("BROWSER_LAUNCH_BACKOFF", "2.0"))    # 第一次重试前等几秒，之后翻倍（最多 30 秒）
+
+# 本进程是否成功启动过浏览器：启动过说明环境没问题，之后的启动失败（崩溃后重启）按退避重试
+_LAUNCHED_ONCE = False
+
+
+class BrowserLaunchError(Exception):
+    """浏览器启动不了（不是某一笔 tx 的问题）：本进程从没启动成功过，或者重启连续失败到上限"""
+    pass
+
+
+class BrowserSession:
+    """
+    session = BrowserSession(name, proxy_pool)
+    session.start()              # 可选：提前启动浏览器、建好第一个 context
+    page = session.page()        # 拿到一个可用的 page（必要时启动 / 重启 / 重建）
+    session.mark_ok(latency)     # 本次导航成功
+    session.mark_failed(e)       # 本次导航失败 -> 回收 context，下一次重试拿到新的 page（和新的代理）
+    session.close()
+    """
+
+    def __init__(
+        self,
+        name: str,
+        proxy_pool: ProxyPool | None = None,
+        max_navigations: int = PAGE_MAX_NAVIGATIONS,
+    ):
+        self.name = name
+        self.proxy_pool = proxy_pool
+        self.proxy: Proxy | None = None          # 当前 context 租用的代理
+        self._avoid: set[str] = set()             # 下次租代理时尽量避开的（刚失败的）
+        self.max_navigations = max_navigations
+        self.resource_filter = ResourceFilter() if RESOURCE_FILTER else None
+        self.asset_cache = asset_store()
+
+        self._pw_cm = None
+        self.pw = None
+        self.browser = None
+        self.context = None
+        self._page: Page | None = None
+        self.navigations = 0
+        self.prewarmed = False                    # 当前这个浏览器是否已经预热过
+
+    # ---------- browser ----------
+    def _launch_once(self):
+        if self.pw is None:
+            # playwright 只在真正要开浏览器的进程 / 线程里加载
+            from playwright.sync_api import sync_playwright
+            from playwright_stealth import Stealth
+
+            self._pw_cm = Stealth().use_sync(sync_playwright())
+            self.pw = self._pw_cm.__enter__()
+        with METRICS.timer("browser_launch_seconds"):
+            # 代理挂在 context 上，browser 本身不挂
+            self.browser = self.pw.chromium.launch(headless=True)
+
+    def _stop_playwright(self):
+        if self._pw_cm is not None:
+            try:
+                self._pw_cm.__exit__(None, None, None)
+            except Exception:
+                pass
+            self._pw_cm = None
+            self.pw = None
+
+    def _launch(self):
+        global _LAUNCHED_ONCE
+        attempt = 1
+        while True:
+            try:
+                self._launch_once()
+                break
+            except Exception as e:
+                METRICS.incr("browser_launch_failures_total")
+                if not _LAUNCHED_ONCE or attempt >= BROWSER_LAUNCH_ATTEMPTS:
+                    raise BrowserLaunchError(f"browser launch failed (attempt {attempt}): {e}") from e
+                delay = min(BROWSER_LAUNCH_BACKOFF * 2 ** (attempt - 1), 30.0)
+                logging.warning("%s browser launch failed (attempt %d), retrying in %.0fs: %s",
+                                self.name, attempt, delay, repr(e))
+                # playwright 驱动可能跟着浏览器一起挂了：下次连驱动一起重新拉起
+                self._stop_playwright()
+                time.sleep(delay)
+                attempt += 1
+        _LAUNCHED_ONCE = True
+        self.prewarmed = False
+        logging.info("%s browser launched", self.name)
+
+    def _ensure_browser(self):
+        if self.browser is not None and self.browser.is_connected():
+            return
+        if self.browser is not None:
+            logging.warning("%s browser disconnected, restarting in place", self.name)
+            METRICS.incr("browser_restarts_total")
+            self._drop_context()
+            try:
+                self.browser.close()
+            except Exception:
+                pass
+            self.browser = None
+        self._launch()
+
+    # ---------- context / page ----------
+    def _new_context(self):
+        if self.proxy_pool:
+            self.proxy = self.proxy_pool.lease(exclude=self._avoid)
+            logging.info("%s leased proxy %s", self.name, self.proxy.server)
+        self.context = self.browser.new_context(
+            proxy=self.proxy.playwright_config() if self.proxy else None
+        )
+        if self.asset_cache:
+            self.asset_cache.install(self.context)
+        page = self.context.new_page()
+        if self.resource_filter:
+            self.resource_filter.install(page)
+        self.navigations = 0
+
+        if PREWARM and not self.prewarmed:
+            self.prewarmed = True
+            try:
+                RATE_LIMITER.acquire()
+                with METRICS.timer("prewarm_seconds"):
+                    page.goto(PREWARM_URL, wait_until="load", timeout=PREWARM_TIMEOUT * 1000)
+            except Exception as e:
+                # 预热失败不影响正式查询
+                logging.warning("%s prewarm failed: %s", self.name, repr(e))
+        self._page = page
+
+    def _drop_context(self):
+        if self.context is not None:
+            try:
+                self.context.close()
+            except Exception:
+                pass
+        self.context = None
+        self._page = None
+        if self.proxy is not None:
+            self.proxy_pool.release(self.proxy)
+            self.proxy = None
+
+    def page(self) -> Page:
+        self._ensure_browser()
+        if self._page is None or self._page.is_closed():
+            self._drop_context()
+            self._new_context()
+        return self._page
+
+    def start(self):
+        """提前启动浏览器并建好第一个 context；失败只告警，第一次 page() 时会再试"""
+        try:
+            self.page()
+        except Exception as e:
+            logging.warning("%s prelaunch failed: %s", self.name, repr(e))
+
+    def recycle(self, reason: str):
+        logging.info("%s recycling context after %d navigations (%s)", self.name, self.navigations, reason)
+        METRICS.incr("page_recycles_total")
+        self._drop_context()
+
+    def mark_ok(self, latency: float | None = None):
+        self.navigations += 1
+        self._avoid = set()
+        if self.proxy is not None:
+            self.proxy_pool.record(self.proxy, ok=True, latency=latency)
+        if self.navigations >= self.max_navigations:
+            self.recycle("max navigations")
+
+    def mark_failed(self, error: Exception, latency: float | None = None):
+        self.navigations += 1
+        if self.proxy is not None:
+            self.proxy_pool.record(self.proxy, ok=False, latency=latency)
+            self._avoid = {self.proxy.server}
+        self.recycle(f"failure: {type(error).__name__}")
+
+    def close(self):
+        self._drop_context()
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except Exception:
+                pass
+            self.browser = None
+            logging.info("%s browser closed", self.name)
+        self._stop_playwright()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+浏览器池的自适应并发（AIMD）：
+  - 每个 worker 处理一笔 tx 前 acquire()，处理完 release(耗时, 是否成功)
+  - 每攒够 window 个样本评估一次：
+      失败率 > max_error_rate 或 p95 > target_p95  -> 并发乘以 backoff（乘性减）
+      否则                                         -> 并发 +1（加性增）
+  - 并发始终在 [floor, ceiling] 之间
+"""
+import os
+import logging
+from threading import Condition
+
+from metrics import percentile
+
+ADAPTIVE = os.getenv("ADAPTIVE", "0") == "1"
+ADAPTIVE_MIN_WORKERS = int(os.getenv("ADAPTIVE_MIN_WORKERS", "1"))
+ADAPTIVE_MAX_WORKERS = int(os.getenv("MAX_WORKERS", "16"))
+ADAPTIVE_WINDOW = int(os.getenv("ADAPTIVE_WINDOW", "20"))                   # 每多少个样本调整一次
+ADAPTIVE_TARGET_P95 = float(os.getenv("ADAPTIVE_TARGET_P95", "20.0"))      # 单笔 tx 耗时 p95 上限（秒）
+ADAPTIVE_MAX_ERROR_RATE = float(os.getenv("ADAPTIVE_MAX_ERROR_RATE", "0.2"))
+ADAPTIVE_BACKOFF = float(os.getenv("ADAPTIVE_BACKOFF", "0.5"))
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        initial: int,
+        floor: int = ADAPTIVE_MIN_WORKERS,
+        ceiling: int = ADAPTIVE_MAX_WORKERS,
+        window: int = ADAPTIVE_WINDOW,
+        target_p95: float = ADAPTIVE_TARGET_P95,
+        max_error_rate: float = ADAPTIVE_MAX_ERROR_RATE,
+        backoff: float = ADAPTIVE_BACKOFF,
+    ):
+        self.floor = max(1, floor)
+        self.ceiling = max(self.floor, ceiling)
+        self.limit = min(max(initial, self.floor), self.ceiling)
+        self.window = window
+        self.target_p95 = target_p95
+        self.max_error_rate = max_error_rate
+        self.backoff = backoff
+
+        self.cond = Condition()
+        self.active = 0
+        self.latencies: list[float] = []
+        self.errors = 0
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit:
+                self.cond.wait()
+            self.active += 1
+
+    def release(self, latency: float | None = None, ok: bool = True):
+        with self.cond:
+            self.active -= 1
+            if latency is not None:
+                self.latencies.append(latency)
+                if not ok:
+                    self.errors += 1
+                if len(self.latencies) >= self.window:
+                    self._adjust()
+            self.cond.notify_all()
+
+    def _adjust(self):
+        p50 = percentile(self.latencies, 50)
+        p95 = percentile(self.latencies, 95)
+        error_rate = self.errors / len(self.latencies)
+        old = self.limit
+
+        if error_rate > self.max_error_rate or p95 > self.target_p95:
+            self.limit = max(self.floor, int(self.limit * self.backoff))
+        else:
+            self.limit = min(self.ceiling, self.limit + 1)
+
+        logging.info(
+            "[adaptive] p50=%.2fs p95=%.2fs error_rate=%.2f -> workers %d -> %d",
+            p50,
+            p95,
+            error_rate,
+            old,
+            self.limit,
+        )
+        self.latencies = []
+        self.errors = 0
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+一次 evaluate 取出 sender / receiver（替代 wait_for_selector ×2 + inner_text ×2 四次往返）：
+  - 注入的脚本先查一遍，没有就挂 MutationObserver，DOM 一变就再查，两个字段都拿到后一起返回
+  - 每个字段按顺序试：主 selector -> 备用 selector（*_FALLBACK_SELECTORS）-> 文本锚点（标签文字的下一个兄弟节点）
+  - 取到的文字必须像一个值（EXTRACT_VALUE_PATTERN：tx hash / 签名 / Unavailable），否则当作没取到，
+    免得结构性的备用 selector 取到别的文字；文本锚点只用明确的标签（不用单独的 "Source" / "Destination"）
+  - 页面写着查无此交易 / 验证页时立刻返回，不等超时
+  - 页面上已经能看到数据（完整的 tx hash，或者像 hash / 签名的文字）、DOM 静止 LAYOUT_SETTLE_MS 后仍然取不到
+    -> LayoutChangedError，只再试一次（selector 失效不会再表现成一串慢超时）；
+    只有标签、数据还没出来（代理慢、XHR 还在路上）时一直等到超时，按超时处理
+"""
+import os
+import logging
+
+from retry_scheduler import TxNotFound, NotIndexedYet, Throttled, LayoutChangedError
+from metrics import METRICS
+
+
+def _split(value: str, sep: str = ",") -> list[str]:
+    return [v.strip() for v in value.split(sep) if v.strip()]
+
+
+# 备用 selector 用 || 分隔（CSS 里本身有逗号）
+SENDER_FALLBACK_SELECTORS = _split(os.getenv(
+    "SENDER_FALLBACK_SELECTORS", "div.gap-9 > div:nth-child(1) div.items-center > div > div > div:nth-child(2)"
+), "||")
+RECEIVER_FALLBACK_SELECTORS = _split(os.getenv(
+    "RECEIVER_FALLBACK_SELECTORS", "div.gap-9 > div:nth-child(2) div.items-center > div > div > div:nth-child(2)"
+), "||")
+# 文本锚点：文字完全等于这些标签（不区分大小写）的叶子节点，值取它后面紧挨着的叶子兄弟节点
+SENDER_LABELS = _split(os.getenv("SENDER_LABELS", "Source Tx Hash,Source Transaction Hash,Source Tx"))
+RECEIVER_LABELS = _split(os.getenv(
+    "RECEIVER_LABELS", "Destination Tx Hash,Destination Transaction Hash,Destination Tx"
+))
+LAYOUT_SETTLE_MS = int(os.getenv("LAYOUT_SETTLE_MS", "1500"))
+# 字段值的样子（JS 正则语法）：0x + 64 位 hex、不带 0x 的 64 位 hex / base58 签名 / 其他链的 id（页面可能转成大写）、
+# 中间被省略成 ... 的长签名、Unavailable
+EXTRACT_VALUE_PATTERN = os.getenv(
+    "EXTRACT_VALUE_PATTERN",
+    r"^(?:0[xX][0-9a-fA-F]{64}|[0-9A-Za-z]{32,100}|[0-9A-Za-z]{6,}(?:\.{3}|\u2026)[0-9A-Za-z]{6,}|Unavailable)$",
+)
+
+EXTRACT_JS = """
+async (arg) => {
+  const textOf = (el) => ((el && (el.innerText || el.textContent)) || "").trim();
+  const valueRe = new RegExp(arg.valuePattern);
+  const valueOf = (el) => {
+    const value = textOf(el);
+    return value && valueRe.test(value) ? value : "";
+  };
+  let last = Date.now();
+  // 页面上像 hash / 签名的文字：有这种数据却一个字段都对不上，才算页面结构变了
+  const shapedRe = /(?:0x)?[0-9a-f]{64}|[1-9A-HJ-NP-Za-km-z]{43,88}/i;
+
+  const bySelectors = (selectors) => {
+    for (let i = 0; i < selectors.length; i++) {
+      let el = null;
+      try { el = document.querySelector(selectors[i]); } catch (e) { continue; }
+      const value = valueOf(el);
+      if (value) return { value: value, via: i === 0 ? "primary" : "selector#" + i };
+    }
+    return null;
+  };
+
+  const byLabel = (labels) => {
+    const wanted = labels.map((l) => l.toLowerCase());
+    const all = document.body ? document.body.querySelectorAll("*") : [];
+    for (const el of all) {
+      if (el.childElementCount) continue;
+      const label = textOf(el).toLowerCase();
+      if (!wanted.includes(label)) continue;
+      const sib = el.nextElementSibling;
+      const value = sib && !sib.childElementCount ? valueOf(sib) : "";
+      if (value) return { value: value, via: "label:" + label };
+    }
+    return null;
+  };
+
+  const check = (final) => {
+    const out = {};
+    let missing = false;
+    for (const name of Object.keys(arg.fields)) {
+      const f = arg.fields[name];
+      const hit = bySelectors(f.selectors) || byLabel(f.labels);
+      if (hit) out[name] = hit; else missing = true;
+    }
+    if (!missing) return { status: "ok", fields: out };
+
+    const text = (document.body ? document.body.innerText || "" : "").toLowerCase();
+    if (arg.challenge.some((m) => text.includes(m))) return { status: "throttled" };
+    if (arg.notFound.some((m) => text.includes(m))) return { status: "not_found" };
+    const rendered = Object.keys(out).length > 0 || text.includes(arg.hash) || shapedRe.test(text);
+    if (rendered && (final || Date.now() - last >= arg.settleMs)) {
+      return { status: "layout_changed", found: Object.keys(out) };
+    }
+    return final ? { status: "timeout" } : null;
+  };
+
+  const first = check(false);
+  if (first) return first;
+
+  return await new Promise((resolve) => {
+    let settled = false;
+    let pending = false;
+    const finish = (res) => {
+      if (settled) return;
+      settled = true;
+      observer.disconnect();
+      clearInterval(tick);
+      clearTimeout(timer);
+      resolve(res);
+    };
+    const run = (final) => {
+      pending = false;
+      if (settled) return;
+      const res = check(final);
+      if (res) finish(res);
+    };
+    const observer = new MutationObserver(() => {
+      last = Date.now();
+      if (!pending) { pending = true; setTimeout(() => run(false), 25); }
+    });
+    observer.observe(document.documentElement, { childList: true, subtree: true, characterData: true });
+    const tick = setInterval(() => run(false), Math.max(100, arg.settleMs / 2));
+    const timer = setTimeout(() => run(true), arg.timeoutMs);
+  });
+}
+"""
+
+
+def field_specs(sender_selector: str, receiver_selector: str) -> dict:
+    return {
+        "sender": {"selectors": [sender_selector] + SENDER_FALLBACK_SELECTORS, "labels": SENDER_LABELS},
+        "receiver": {"selectors": [receiver_selector] + RECEIVER_FALLBACK_SELECTORS, "labels": RECEIVER_LABELS},
+    }
+
+
+def extract_arg(tx_hash: str, fields: dict, timeout: float, not_found: list[str], challenge: list[str]) -> dict:
+    h = tx_hash.strip().lower()
+    return {
+        "fields": fields,
+        "timeoutMs": int(timeout * 1000),
+        "settleMs": LAYOUT_SETTLE_MS,
+        "valuePattern": EXTRACT_VALUE_PATTERN,
+        "notFound": not_found,
+        "challenge": challenge,
+        # 完整的 hash（去掉 0x，页面可能显示成大写 0X）；截断显示的由页面上像 hash 的文字兜住
+        "hash": h[2:] if h.startswith("0x") else h,
+    }
+
+
+_warned_fallbacks: set[str] = set()
+
+
+def interpret(tx_hash: str, result: dict) -> tuple[str, str]:
+    """脚本返回值 -> (sender, receiver)，或者抛对应的 FetchError"""
+    status = (result or {}).get("status")
+    if status == "ok":
+        fields = result["fields"]
+        for name, hit in fields.items():
+            if hit["via"] != "primary":
+                METRICS.incr("extract_fallback_total")
+                key = f"{name}:{hit['via']}"
+                if key not in _warned_fallbacks:
+                    # selector 开始漂移的早期信号：每种回退方式只告警一次
+                    _warned_fallbacks.add(key)
+                    logging.warning("[extract] %s found via %s, primary selector no longer matches", name, hit["via"])
+        return fields["sender"]["value"], fields["receiver"]["value"]
+
+    msg = f"tx={tx_hash} extraction ended with {status}"
+    if status == "not_found":
+        raise TxNotFound(msg)
+    if status == "throttled":
+        raise Throttled(msg)
+    if status == "layout_changed":
+        METRICS.incr("layout_changed_total")
+        raise LayoutChangedError(f"{msg}, fields found: {result.get('found')}")
+    raise NotIndexedYet(msg)
+
+
+def extract(page, tx_hash: str, fields: dict, timeout: float, not_found: list[str], challenge: list[str]):
+    result = page.evaluate(EXTRACT_JS, extract_arg(tx_hash, fields, timeout, not_found, challenge))
+    return interpret(tx_hash, result)
+
+
+async def extract_async(page, tx_hash: str, fields: dict, timeout: float, not_found: list[str], challenge: list[str]):
+    result = await page.evaluate(EXTRACT_JS, extract_arg(tx_hash, fields, timeout, not_found, challenge))
+    return interpret(tx_hash, result)
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+本地的 usdc.range.org 替身（离线测试 / benchmark 用）：
+  - 从 data/fixtures/range_transactions.json 读取录制的交易 payload
+  - GET /transactions?s=<tx_hash>
+      Accept 里带 application/json -> 直接返回 JSON payload
+      否则 -> 返回交易页 HTML：payload 放在 <script id="__NEXT_DATA__" type="application/json"> 里，
+              由 /static/ 下的 JS 渲染出和线上一致的 DOM（能被 SENDER_SELECTOR / RECEIVER_SELECTOR 命中）
+  - 没有录制的 tx 返回 404；synthetic=True 时按 tx_hash 生成一份确定性的 payload
+  - GET /api/transactions?page=&limit=&from=&to=  交易列表（批量路径）：录制的交易 + listing_hashes 生成的交易，
+      只返回 timestamp 在 [from, to] 内的（没有 timestamp 的录制交易不过滤），按页返回 JSON；时间解析不了返回 400
+  - 可配置延迟、抖动和失败率（失败返回 503，页面上没有数据）
+  - throttle_rps > 0 时模拟限流：每秒超过这么多请求的返回 429 + Retry-After: 1
+
+用法：
+    python src/fake_range_server.py --port 8765 --latency 0.2 --jitter 0.1 --failure-rate 0.05
+    RANGE_BASE_URL=http://127.0.0.1:8765 PROXY_SERVER= python src/main.py
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+from threading import Thread, Lock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from range_api import format_value, find_sender_receiver
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "fixtures", "range_transactions.json")
+
+# 静态资源（文件名带内容 hash，和线上打包产物的形式一致）
+LISTING_PATH = "/api/transactions"
+
+APP_JS_PATH = "/static/js/app.3f9a1c2e.js"
+APP_CSS_PATH = "/static/css/app.8b2d4f60.css"
+LOGO_PATH = "/static/media/logo.5e1c7a90.png"
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<title>USDC Transaction</title>
+<link rel="stylesheet" href="{css}">
+<script id="__NEXT_DATA__" type="application/json">{payload}</script>
+<script defer src="{js}"></script>
+</head>
+<body>
+<div id="__next"><img src="{logo}" alt="range"></div>
+</body>
+</html>
+"""
+
+# 两个字段外层的结构，对应 main.SENDER_SELECTOR / RECEIVER_SELECTOR
+_FIELD_HTML = (
+    '<div class="flex flex-col gap-1 w-full">'
+    '<div class="flex flex-col sm:flex-row gap-md sm:items-center w-full">'
+    '<div class="w-[250px]">LABEL</div>'
+    '<div class="flex w-full sm:w-[calc(100%-250px)] items-center">'
+    '<div><div><div>LABEL</div><div>VALUE</div></div></div>'
+    "</div></div></div>"
+)
+
+APP_JS = """
+(function () {
+  var data = JSON.parse(document.getElementById("__NEXT_DATA__").textContent);
+  var view = data.view || {};
+  var field = %s;
+  function render() {
+    var root = document.getElementById("__next");
+    root.innerHTML =
+      '<div class="mx-4 md:mx-20 flex flex-col items-center justify-center gap-4">' +
+      '<div class="flex flex-col gap-5xl w-full mt-14">' +
+      '<div class="whitespace-nowrap">' +
+      '<div class="flex flex-col gap-11 pt-3xl">' +
+      '<div class="flex flex-col gap-5xl w-full">' +
+      '<div class="flex flex-col gap-9">' +
+      '<div>' + field.replace(/LABEL/g, "Source").replace("VALUE", view.sender) + '</div>' +
+      '<div>' + field.replace(/LABEL/g, "Destination").replace("VALUE", view.receiver) + '</div>' +
+      '</div></div></div></div></div></div>';
+  }
+  if (view.sender !== undefined) {
+    setTimeout(render, view.render_ms || 0);
+  }
+})();
+""" % json.dumps(_FIELD_HTML)
+
+APP_CSS = "body{font-family:sans-serif}" + ".pad{padding:1px}" * 2000
+
+LOGO_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+def load_fixtures(path: str = FIXTURE_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return {k.lower(): v for k, v in json.load(f).items()}
+
+
+def synthetic_payload(tx_hash: str) -> dict:
+    """按 tx_hash 生成确定性的 payload（benchmark 用任意数量的 hash）"""
+    source = "0x" + hashlib.sha256(tx_hash.encode()).hexdigest()
+    return {"props": {"pageProps": {"transaction": {
+        "hash": tx_hash,
+        "status": "completed",
+        "sourceTxHash": source,
+        "destinationTxHash": tx_hash,
+    }}}}
+
+
+def synthetic_block_time(tx_hash: str) -> str:
+    """按 tx_hash 生成确定性的时间（2026-01 内），ISO 格式带 +00:00；bench 的 FakeDune 用同一个函数出 block_time"""
+    seconds = int(hashlib.sha256(tx_hash.lower().encode()).hexdigest()[:8], 16) % (30 * 86400)
+    return (datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=seconds)).isoformat()
+
+
+def _parse_time(value: str) -> datetime | None:
+    if not value:
+        return None
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+class FakeRangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # 以下由 make_handler 覆盖
+    fixtures: dict = {}
+    listing: list = []
+    synthetic = False
+    latency = 0.0
+    jitter = 0.0
+    failure_rate = 0.0
+    render_ms = 0
+    throttle_rps = 0
+    throttle_state = {"second": 0, "count": 0}
+    throttle_lock = Lock()
+
+    def log_message(self, fmt, *args):
+        logging.debug("[fake-range] " + fmt, *args)
+
+    def _send(self, status: int, body: str | bytes, content_type: str, cache: bool = False, headers: dict | None = None):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        if cache:
+            self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _throttled(self) -> bool:
+        """按整秒计数，本秒超过 throttle_rps 的请求回 429"""
+        if not self.throttle_rps:
+            return False
+        with self.throttle_lock:
+            second = int(time.time())
+            if self.throttle_state["second"] != second:
+                self.throttle_state.update(second=second, count=0)
+            self.throttle_state["count"] += 1
+            over = self.throttle_state["count"] > self.throttle_rps
+        if over:
+            self._send(429, "too many requests", "text/plain", headers={"Retry-After": "1"})
+        return over
+
+    def _delay(self):
+        wait = self.latency + random.uniform(-self.jitter, self.jitter)
+        if wait > 0:
+            time.sleep(wait)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+
+        if url.path == APP_JS_PATH:
+            self._send(200, APP_JS, "application/javascript", cache=True)
+            return
+        if url.path == APP_CSS_PATH:
+            self._send(200, APP_CSS, "text/css", cache=True)
+            return
+        if url.path == LOGO_PATH:
+            self._send(200, LOGO_PNG, "image/png", cache=True)
+            return
+        if url.path.rstrip("/") == LISTING_PATH:
+            self._listing(parse_qs(url.query))
+            return
+        if url.path.rstrip("/") != "/transactions":
+            self._send(404, "not found", "text/plain")
+            return
+
+        if self._throttled():
+            return
+        self._delay()
+        tx_hash = parse_qs(url.query).get("s", [""])[0].strip().lower()
+        payload = self.fixtures.get(tx_hash)
+        if payload is None and self.synthetic and tx_hash:
+            payload = synthetic_payload(tx_hash)
+        if payload is None:
+            self._send(404, "transaction not found", "text/plain")
+            return
+
+        if self.failure_rate and random.random() < self.failure_rate:
+            self._send(503, PAGE_TEMPLATE.format(payload="{}", css=APP_CSS_PATH, js=APP_JS_PATH, logo=LOGO_PATH),
+                       "text/html; charset=utf-8")
+            return
+
+        if "application/json" in self.headers.get("Accept", "").split(",")[0]:
+            self._send(200, json.dumps(payload), "application/json")
+            return
+
+        # 页面上显示的值（和线上一样已经格式化好），给 JS 渲染用
+        sender, receiver = find_sender_receiver(payload)
+        page_data = dict(payload, view={
+            "sender": format_value(sender),
+            "receiver": format_value(receiver),
+            "render_ms": self.render_ms,
+        })
+        body = PAGE_TEMPLATE.format(
+            payload=json.dumps(page_data), css=APP_CSS_PATH, js=APP_JS_PATH, logo=LOGO_PATH
+        )
+        self._send(200, body, "text/html; charset=utf-8")
+
+
+    def _listing(self, query: dict):
+        if self._throttled():
+            return
+        self._delay()
+        if self.failure_rate and random.random() < self.failure_rate:
+            self._send(503, "unavailable", "text/plain")
+            return
+        page = max(int(query.get("page", ["1"])[0]), 1)
+        limit = max(int(query.get("limit", ["100"])[0]), 1)
+        try:
+            start = _parse_time(query.get("from", [""])[0])
+            end = _parse_time(query.get("to", [""])[0])
+        except ValueError as e:
+            self._send(400, f"bad time window: {e}", "text/plain")
+            return
+        items = [
+            tx for tx in self.listing
+            if "timestamp" not in tx or (
+                (start is None or _parse_time(tx["timestamp"]) >= start)
+                and (end is None or _parse_time(tx["timestamp"]) <= end)
+            )
+        ]
+        items = items[(page - 1) * limit: page * limit]
+        self._send(200, json.dumps({"page": page, "transactions": items}), "application/json")
+
+
+def _listing_items(fixtures: dict, listing_hashes: list[str] | None) -> list[dict]:
+    items = [p["props"]["pageProps"]["transaction"] for p in fixtures.values()]
+    for tx in listing_hashes or []:
+        item = synthetic_payload(tx.lower())["props"]["pageProps"]["transaction"]
+        items.append(dict(item, timestamp=synthetic_block_time(tx)))
+    return items
+
+
+def make_handler(
+    fixture_path: str = FIXTURE_PATH,
+    synthetic: bool = False,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    failure_rate: float = 0.0,
+    render_ms: int = 0,
+    listing_hashes: list[str] | None = None,
+    throttle_rps: int = 0,
+):
+    fixtures = load_fixtures(fixture_path)
+    return type("Handler", (FakeRangeHandler,), {
+        "fixtures": fixtures,
+        "listing": _listing_items(fixtures, listing_hashes),
+        "synthetic": synthetic,
+        "latency": latency,
+        "jitter": jitter,
+        "failure_rate": failure_rate,
+        "render_ms": render_ms,
+        "throttle_rps": throttle_rps,
+        "throttle_state": {"second": 0, "count": 0},
+        "throttle_lock": Lock(),
+    })
+
+
+def start_fake_server(host: str = "127.0.0.1", port: int = 0, **handler_kwargs):
+    """
+    后台线程启动替身服务，返回 (server, base_url)；用完调用 server.shutdown()
+    handler_kwargs 见 make_handler
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(**handler_kwargs))
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="fake-range-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for usdc.range.org")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=FIXTURE_PATH)
+    parser.add_argument("--synthetic", action="store_true", help="answer any tx hash with a generated payload")
+    parser.add_argument("--latency", type=float, default=0.0, help="response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- random delay in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of tx pages answered with 503")
+    parser.add_argument("--render-ms", type=int, default=0, help="client-side render delay of the fields")
+    parser.add_argument("--throttle-rps", type=int, default=0, help="answer requests above this rate with 429")
+    args = parser.parse_args()
+
+    handler = make_handler(
+        args.fixtures, args.synthetic, args.latency, args.jitter, args.failure_rate, args.render_ms,
+        throttle_rps=args.throttle_rps,
+    )
+    print(f"fake usdc.range.org serving {len(handler.fixtures)} fixtures on http://{args.host}:{args.port}")
+    ThreadingHTTPServer((args.host, args.port), handler).serve_forever()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+本地的 EVM JSON-RPC 替身（离线测试 / benchmark 用，配合 rpc_resolver）：
+  - 每条链一个路径：POST /<domain>，支持单个调用和批量调用（JSON 数组）
+  - 从 data/fixtures/rpc_receipts.json 读取录制的 receipt 和 DepositForBurn 日志：
+      {"<domain>": {"receipts": {tx_hash: receipt}, "logs": [log, ...]}}
+  - 方法：eth_getTransactionReceipt / eth_getLogs（按 topics 和块范围过滤）/ eth_getBlockByNumber / eth_blockNumber / eth_chainId
+  - 所有链共用一个时钟：块 n 的出块时间是 GENESIS_TIME + n * BLOCK_SECONDS，最新块跟着当前时间走
+  - max_log_range > 0 时 eth_getLogs 的块范围超过它就报错（模拟限制查询范围的节点）
+  - synthetic=True 时任意 tx_hash 在 synthetic_domain 上都有一个 receiveMessage receipt，
+    源链交易和 fake_range_server.synthetic_payload 给出的一致；foreign_rate 比例的源链是 Solana（domain 5，交回网页解析）
+  - 可配置延迟和失败率（失败返回 503）
+
+用法：
+    python src/fake_rpc_server.py --port 8766 --synthetic
+    RPC_RESOLVER=1 RPC_ENDPOINTS=0=http://127.0.0.1:8766/0,3=http://127.0.0.1:8766/3 python src/main.py
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import logging
+from threading import Thread, Lock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from rpc_resolver import MESSAGE_RECEIVED_TOPIC, DEPOSIT_FOR_BURN_TOPIC, nonce_topic
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "fixtures", "rpc_receipts.json")
+
+SOLANA_DOMAIN = 5
+
+GENESIS_TIME = 1_600_000_000
+BLOCK_SECONDS = 1
+
+
+def latest_block() -> int:
+    return int((time.time() - GENESIS_TIME) / BLOCK_SECONDS)
+
+
+def block_tag(tag: str) -> int:
+    if tag == "earliest":
+        return 0
+    return latest_block() if tag == "latest" else int(tag, 16)
+
+
+def block(number: int) -> dict:
+    return {"number": hex(number), "timestamp": hex(GENESIS_TIME + number * BLOCK_SECONDS)}
+
+
+def load_fixtures(path: str = FIXTURE_PATH) -> dict[int, dict]:
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    chains = {}
+    for domain, chain in raw.items():
+        chains[int(domain)] = {"receipts": {k.lower(): v for k, v in chain.get("receipts", {}).items()}, "logs": {}}
+        for log in chain.get("logs", []):
+            add_log(chains[int(domain)], log)
+    return chains
+
+
+def add_log(chain: dict, log: dict):
+    """日志按 topics[1]（DepositForBurn 的 nonce）建索引，eth_getLogs 不用扫全表"""
+    key = log["topics"][1].lower() if len(log["topics"]) > 1 else ""
+    chain["logs"].setdefault(key, []).append(log)
+
+
+def _word(value: int) -> str:
+    return format(value, "064x")
+
+
+def message_received_log(tx_hash: str, source_domain: int, nonce: int) -> dict:
+    """目标链 receipt 里的 MessageReceived 日志（data: sourceDomain, sender, messageBody 的偏移和内容）"""
+    body = hashlib.sha256(b"body" + tx_hash.encode()).hexdigest() * 4
+    data = _word(source_domain) + "00" * 32 + _word(0x60) + _word(len(body) // 2) + body
+    return {
+        "address": "0x0a992d191deec32afe36203ad87d7d289a738f81",
+        "topics": [MESSAGE_RECEIVED_TOPIC, "0x" + "00" * 12 + "1" * 40, nonce_topic(nonce)],
+        "data": "0x" + data,
+        "transactionHash": tx_hash,
+        "logIndex": "0x0",
+    }
+
+
+def deposit_for_burn_log(source_tx: str, nonce: int, block_number: int, messenger: str = "0x" + "00" * 20) -> dict:
+    return {
+        "address": messenger,
+        "topics": [DEPOSIT_FOR_BURN_TOPIC, nonce_topic(nonce), "0x" + "00" * 32, "0x" + "00" * 32],
+        "data": "0x" + _word(1_000_000) + "00" * 32 + _word(3) + "00" * 64,
+        "transactionHash": source_tx,
+        "logIndex": "0x0",
+        "blockNumber": hex(block_number),
+    }
+
+
+def receipt(tx_hash: str, logs: list[dict], block_number: int) -> dict:
+    return {"transactionHash": tx_hash, "status": "0x1", "blockNumber": hex(block_number), "logs": logs}
+
+
+class FakeRpcHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # 以下由 make_handler 覆盖
+    chains: dict = {}
+    synthetic = False
+    synthetic_domain = 3
+    foreign_rate = 0.0
+    latency = 0.0
+    failure_rate = 0.0
+    max_log_range = 0
+    lock = Lock()
+
+    def log_message(self, fmt, *args):
+        logging.debug("[fake-rpc] " + fmt, *args)
+
+    def _send(self, status: int, body: str, content_type: str = "application/json"):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        try:
+            domain = int(self.path.strip("/"))
+        except ValueError:
+            self._send(404, "not found", "text/plain")
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"null")
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            self._send(503, "unavailable", "text/plain")
+            return
+
+        if isinstance(body, list):
+            self._send(200, json.dumps([self._call(domain, c) for c in body]))
+        else:
+            self._send(200, json.dumps(self._call(domain, body)))
+
+    def _call(self, domain: int, call: dict) -> dict:
+        reply = {"jsonrpc": "2.0", "id": call.get("id")}
+        method, params = call.get("method"), call.get("params") or []
+        chain = self.chains.setdefault(domain, {"receipts": {}, "logs": {}})
+        if method == "eth_getTransactionReceipt":
+            reply["result"] = self._receipt(domain, chain, str(params[0]).lower())
+        elif method == "eth_getLogs":
+            try:
+                reply["result"] = self._logs(chain, params[0])
+            except ValueError as e:
+                reply["error"] = {"code": -32005, "message": str(e)}
+        elif method == "eth_getBlockByNumber":
+            number = block_tag(params[0])
+            reply["result"] = block(number) if number <= latest_block() else None
+        elif method == "eth_blockNumber":
+            reply["result"] = hex(latest_block())
+        elif method == "eth_chainId":
+            reply["result"] = hex(domain)
+        else:
+            reply["error"] = {"code": -32601, "message": f"method {method} not found"}
+        return reply
+
+    def _receipt(self, domain: int, chain: dict, tx_hash: str) -> dict | None:
+        if tx_hash in chain["receipts"] or not self.synthetic or domain != self.synthetic_domain:
+            return chain["receipts"].get(tx_hash)
+
+        # 按 tx_hash 确定性地生成：源链交易 = sha256(tx_hash)，和 fake_range_server 的 synthetic payload 一致
+        digest = hashlib.sha256(tx_hash.encode()).hexdigest()
+        nonce = int(digest[:12], 16)
+        foreign = int(digest[12:16], 16) / 0xFFFF < self.foreign_rate
+        source_domain = SOLANA_DOMAIN if foreign else 0
+        number = latest_block()
+        with self.lock:
+            if not foreign:
+                source = self.chains.setdefault(source_domain, {"receipts": {}, "logs": {}})
+                # 源链 burn 比目标链 receive 早 20 个块
+                add_log(source, deposit_for_burn_log("0x" + digest, nonce, number - 20))
+            result = receipt(tx_hash, [message_received_log(tx_hash, source_domain, nonce)], number)
+            chain["receipts"][tx_hash] = result
+        return result
+
+    def _logs(self, chain: dict, log_filter: dict) -> list[dict]:
+        start = block_tag(log_filter.get("fromBlock", "latest"))
+        end = block_tag(log_filter.get("toBlock", "latest"))
+        if self.max_log_range and end - start > self.max_log_range:
+            raise ValueError(f"block range {end - start} exceeds the limit of {self.max_log_range}")
+        topics = [t.lower() if isinstance(t, str) else t for t in log_filter.get("topics") or []]
+        out = []
+        with self.lock:
+            if len(topics) > 1 and isinstance(topics[1], str):
+                logs = list(chain["logs"].get(topics[1], []))
+            else:
+                logs = [log for group in chain["logs"].values() for log in group]
+        for log in logs:
+            have = [t.lower() for t in log["topics"]]
+            if not start <= int(log.get("blockNumber", "0x0"), 16) <= end:
+                continue
+            if all(t is None or (i < len(have) and have[i] == t) for i, t in enumerate(topics)):
+                out.append(log)
+        return out
+
+
+def make_handler(
+    fixture_path: str = FIXTURE_PATH,
+    synthetic: bool = False,
+    synthetic_domain: int = 3,
+    foreign_rate: float = 0.0,
+    latency: float = 0.0,
+    failure_rate: float = 0.0,
+    max_log_range: int = 0,
+):
+    return type("Handler", (FakeRpcHandler,), {
+        "chains": load_fixtures(fixture_path),
+        "synthetic": synthetic,
+        "synthetic_domain": synthetic_domain,
+        "foreign_rate": foreign_rate,
+        "latency": latency,
+        "failure_rate": failure_rate,
+        "max_log_range": max_log_range,
+        "lock": Lock(),
+    })
+
+
+def start_fake_server(host: str = "127.0.0.1", port: int = 0, **handler_kwargs):
+    """
+    后台线程启动替身服务，返回 (server, base_url)；链的地址是 f"{base_url}/{domain}"
+    handler_kwargs 见 make_handler
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(**handler_kwargs))
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="fake-rpc-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for EVM JSON-RPC endpoints (CCTP logs)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--fixtures", default=FIXTURE_PATH)
+    parser.add_argument("--synthetic", action="store_true", help="answer any tx hash with a generated receipt")
+    parser.add_argument("--synthetic-domain", type=int, default=3, help="destination domain of generated receipts")
+    parser.add_argument("--foreign-rate", type=float, default=0.0, help="fraction of generated transfers from Solana")
+    parser.add_argument("--latency", type=float, default=0.0, help="response delay in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--max-log-range", type=int, default=0, help="reject eth_getLogs spanning more blocks (0 = no limit)")
+    args = parser.parse_args()
+
+    handler = make_handler(
+        args.fixtures, args.synthetic, args.synthetic_domain, args.foreign_rate, args.latency, args.failure_rate,
+        args.max_log_range,
+    )
+    print(f"fake JSON-RPC serving domains {sorted(handler.chains)} on http://{args.host}:{args.port}/<domain>")
+    ThreadingHTTPServer((args.host, args.port), handler).serve_forever()
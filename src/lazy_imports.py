@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+重依赖（pandas / httpx 等）延迟到第一次用到时才真正 import：
+    pd = lazy_import("pandas")
+模块对象立刻可用，第一次访问属性时才执行模块代码；只 import 几个辅助函数的工具不再为它们付启动时间
+"""
+import sys
+import importlib.util
+
+
+def lazy_import(name: str):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def available(name: str) -> bool:
+    """可选依赖是否已安装（不 import 它）"""
+    return name in sys.modules or importlib.util.find_spec(name) is not None
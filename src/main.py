@@ -1,18 +1,56 @@
 # -*- coding: utf-8 -*-
+from __future__ import annotations
+
 import os
+import io
 import sys
 import time
+import asyncio
 import logging
-from threading import Thread, Lock
-from queue import Queue
+import argparse
+import shutil
+import signal
+import subprocess
+from threading import Thread, Lock, Event
+from contextvars import ContextVar
+from typing import Callable, Iterable, Iterator, TYPE_CHECKING
+
+from tenacity import retry, stop_after_attempt, wait_exponential
 
-import pandas as pd
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from lazy_imports import lazy_import
+from range_api import RangeApiClient, RANGE_BASE_URL
+from rpc_resolver import RpcClient
+from resource_filter import ResourceFilter, RESOURCE_FILTER
+from asset_cache import asset_store
+from browser_session import BrowserSession, BrowserLaunchError
+from proxy_pool import ProxyPool
+from result_cache import ResultCache, RESULT_CACHE
+from output_store import ParquetStore, OUTPUT_STORE, CSV_EXPORT, normalize_frame, export_frame
+from stream_writer import StreamingWriter, STREAMING, rows_to_csv_bytes
+from concurrency import AdaptiveLimiter, ADAPTIVE
+from rate_limiter import RATE_LIMITER, parse_retry_after
+from extractor import field_specs, extract, extract_async
+from priority_queue import PriorityTaskQueue, RunDeadline, RUN_DEADLINE, block_times, priority_key
+from uploader import ChunkedUploader
+from retry_scheduler import (
+    FetchError,
+    FetchTimeout,
+    ProxyFailure,
+    Throttled,
+    NotIndexedYet,
+    TxNotFound,
+    RetryScheduler,
+    RETRY_POLICY,
+)
+from sharding import parse_shard, shard_of, filter_shard, shard_path, read_shards
+from metrics import METRICS, COUNT_BUCKETS, RUN_REPORT_PATH, PROM_TEXTFILE_PATH
 
-from dune_client.client import DuneClient
-from dune_client.query import QueryBase
-from playwright.sync_api import sync_playwright, Page
-from playwright_stealth import Stealth
+# 重依赖延迟加载：dune_client / playwright 在用到的函数里才 import，pandas 第一次访问属性时才加载
+pd = lazy_import("pandas")
+
+if TYPE_CHECKING:
+    from dune_client.query import QueryBase
+    from playwright.async_api import Page as AsyncPage
 
 # -----------------------------
 # Config
@@ -23,55 +61,340 @@ DEFAULT_DUNE_QUERY_ID = 6261537
 DUNE_API_KEY = os.getenv("DUNE_API_KEY", DEFAULT_DUNE_API_KEY)
 DUNE_QUERY_ID = int(os.getenv("DUNE_QUERY_ID", str(DEFAULT_DUNE_QUERY_ID)))
 DUNE_HASH_COLUMN = os.getenv("DUNE_HASH_COLUMN", "tx_hash")
+DUNE_MAX_AGE_HOURS = float(os.getenv("DUNE_MAX_AGE_HOURS", "12"))  # 最近一次结果比这个新就直接读，不重新执行；0 = 每次执行
+DUNE_WATERMARK_PARAM = os.getenv("DUNE_WATERMARK_PARAM", "")        # 查询接收水位（上次处理到的 block_time）的参数名，空 = 不传
+DUNE_WATERMARK_OVERLAP_HOURS = float(os.getenv("DUNE_WATERMARK_OVERLAP_HOURS", "6"))  # 水位往回退一段，防 Dune 入库延迟漏数
+WATERMARK_PATH = "data/dune_watermark.txt"
+DUNE_STREAM = os.getenv("DUNE_STREAM", "0") == "1"                # 分页读取 Dune 结果，边读边抓（不整表载入）
+DUNE_PAGE_SIZE = int(os.getenv("DUNE_PAGE_SIZE", "10000"))
+DUNE_POLL_SECONDS = float(os.getenv("DUNE_POLL_SECONDS", "2"))
+DUNE_TIME_COLUMN = os.getenv("DUNE_TIME_COLUMN", "block_time")   # 有这一列时用来确定列表查询的时间窗
+DAEMON_POLL_SECONDS = float(os.getenv("DAEMON_POLL_SECONDS", "300"))  # --daemon 模式下多久拉一次 Dune
+# 已经导出的 Dune 结果（--dump-hashes 写的 CSV）；设了就直接读，不再查询（多个分片共用一次查询）
+DUNE_HASHES_PATH = os.getenv("DUNE_HASHES_PATH", "")
+DUNE_HASHES_DUMP_PATH = "data/dune_hashes.csv"
 
 DUNE_NAMESPACE = "bitgetwallet"
 DUNE_TABLE_NAME = "cctp_tx_map"
 DUNE_TABLE_FULL = f"{DUNE_NAMESPACE}.{DUNE_TABLE_NAME}"
 
 CSV_PATH = "data/cctp_tx_mapping.csv"
+DELTA_CSV_PATH = "data/cctp_tx_mapping.delta.csv"   # 增量模式下本次新增的行（只上传这一部分）
+PENDING_CSV_PATH = "data/cctp_tx_mapping.pending.csv"  # 流式上传最终失败的行，下次运行先补传
+
+INCREMENTAL = os.getenv("INCREMENTAL", "0") == "1"              # 增量模式：跳过已解析过的 tx_hash
+INCREMENTAL_SOURCE = os.getenv("INCREMENTAL_SOURCE", "csv")     # 已有映射来源：csv / dune / both
+
+OUTPUT_COLUMNS = ["query_tx_hash", "sender_address", "receiver_address"]
 
 HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15.0"))  # 页面加载超时（秒）
 N_BROWSERS = int(os.getenv("N_BROWSERS", "5"))           # 浏览器池大小（并发度）
+TASK_QUEUE_SIZE = int(os.getenv("TASK_QUEUE_SIZE", "1000"))  # 任务队列上限，生产者超过就等 worker 消化
+WAIT_UNTIL = os.getenv("WAIT_UNTIL", "domcontentloaded")  # goto 的等待条件，selector 出现即可，不必等 networkidle
+SELECTOR_TIMEOUT = float(os.getenv("SELECTOR_TIMEOUT", "10.0"))  # 等 sender/receiver 都出现的超时（秒，两个字段合计）
+# 字段没出现时，页面上有这些文字之一就当作查无此交易（永久结果，不重试）
+NOT_FOUND_MARKERS = [m.strip().lower() for m in os.getenv(
+    "NOT_FOUND_MARKERS", "transaction not found,no results found,no transaction found"
+).split(",") if m.strip()]
+PROXY_ERROR_MARKERS = ("ERR_PROXY", "ERR_TUNNEL_CONNECTION_FAILED", "ERR_SOCKS", "407")
+# 页面上出现这些字样说明被限流 / 拦到了验证页（全局暂停，见 rate_limiter.py）
+CHALLENGE_MARKERS = [m.strip().lower() for m in os.getenv(
+    "CHALLENGE_MARKERS", "just a moment,verify you are human,attention required,too many requests"
+).split(",") if m.strip()]
 
-DUNE = DuneClient(DUNE_API_KEY)
+ENGINE = os.getenv("ENGINE", "thread")                                # thread: 一线程一浏览器 / async: asyncio 多 page
+N_ASYNC_BROWSERS = int(os.getenv("N_ASYNC_BROWSERS", "2"))            # async 引擎的浏览器数量
+ASYNC_CONCURRENCY = int(os.getenv("ASYNC_CONCURRENCY", "50"))         # async 引擎同时在查的 tx 数（= page 总数）
 
-ERROR_LOG_PATH = "logs/cctp_error.log"
-os.makedirs(os.path.dirname(ERROR_LOG_PATH), exist_ok=True)
+# rotating proxy；PROXY_SERVER 设为空字符串则不挂代理（本地 / benchmark）
+# 配了 PROXY_POOL / PROXY_POOL_FILE 时线程引擎改用代理池（见 proxy_pool.py），这里的单个代理只作默认值
+PROXY_SERVER = os.getenv("PROXY_SERVER", "http://b2bcc08abc0815ee.qzc.na.ipidea.online:2336")
+PROXY_USERNAME = os.getenv("PROXY_USERNAME", "clyderen-zone-custom")
+PROXY_PASSWORD = os.getenv("PROXY_PASSWORD", "123456")
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(threadName)s %(message)s",
-    handlers=[
-        logging.FileHandler(ERROR_LOG_PATH, encoding="utf-8"),
-        logging.StreamHandler(sys.stdout),
-    ],
-)
+BROWSER_PROXY = {
+    "server": PROXY_SERVER,
+    "username": PROXY_USERNAME,
+    "password": PROXY_PASSWORD,
+} if PROXY_SERVER else None
+# httpx 用的同一个代理（user:pass@host:port 形式）
+HTTP_PROXY_URL = PROXY_SERVER.replace(
+    "://", f"://{PROXY_USERNAME}:{PROXY_PASSWORD}@", 1
+) if PROXY_SERVER else None
+
+HTTP_RESOLVER = os.getenv("HTTP_RESOLVER", "0") == "1"          # 先走 HTTP 直连解析，失败的再交给浏览器（数据接口确认前默认关）
+HTTP_RESOLVER_PROXY = os.getenv("HTTP_RESOLVER_PROXY", "1") == "1"  # HTTP 解析是否也挂代理
+LISTING_RESOLVER = os.getenv("LISTING_RESOLVER", "0") == "1"      # 先按时间窗翻交易列表批量解析，剩下的再逐笔查
+RPC_RESOLVER = os.getenv("RPC_RESOLVER", "0") == "1"              # 先从链上 CCTP 日志解码（需要 RPC_ENDPOINTS），覆盖不到的再走网页
+
+# worker 一启动就并行拉起浏览器，不等第一笔任务：DUNE_STREAM=1 时和 Dune 分页 / HTTP 解析重叠；
+# 整表模式下浏览器池在 Dune / HTTP 阶段之后才创建，只和第一批入队重叠
+PRELAUNCH = os.getenv("PRELAUNCH", "1") == "1"
+
+DUNE = None  # 第一次用到时由 get_dune() 创建（bench 会直接替换成 FakeDune）
+
+ERROR_LOG_PATH = os.getenv("ERROR_LOG_PATH", "logs/cctp_error.log")
+
+
+def setup_logging():
+    os.makedirs(os.path.dirname(ERROR_LOG_PATH), exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(threadName)s %(message)s",
+        handlers=[
+            logging.FileHandler(ERROR_LOG_PATH, encoding="utf-8"),
+            logging.StreamHandler(sys.stdout),
+        ],
+    )
+
+
+def get_dune():
+    global DUNE
+    if DUNE is None:
+        from dune_client.client import DuneClient
+        DUNE = DuneClient(DUNE_API_KEY)
+    return DUNE
 
 # -----------------------------
 # Step 1: load tx_hash from Dune
 # -----------------------------
-def load_dune_hashes() -> pd.DataFrame:
-    query = QueryBase(
+# 本次读到的最大 block_time（运行成功后写回 WATERMARK_PATH）
+NEXT_WATERMARK: pd.Timestamp | None = None
+# 本次读到的每个 tx_hash（小写）的 block_time：还有没解析出来的时，水位只推进到其中最早的那个
+WATERMARK_TIMES: dict[str, pd.Timestamp] = {}
+
+
+def read_watermark(path: str = WATERMARK_PATH) -> pd.Timestamp | None:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        value = f.read().strip()
+    return pd.Timestamp(value) if value else None
+
+
+def save_watermark(value: pd.Timestamp, path: str = WATERMARK_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(value.isoformat() + "\n")
+    logging.info("watermark %s saved to %s", value.isoformat(), path)
+
+
+def note_watermark(hashes, values) -> None:
+    global NEXT_WATERMARK
+    ts = pd.to_datetime(pd.Series(list(values)), utc=True, errors="coerce")
+    for h, t in zip(hashes, ts):
+        if h is not None and not pd.isna(t):
+            WATERMARK_TIMES[str(h).strip().lower()] = t
+    ts = ts.dropna()
+    if not ts.empty and (NEXT_WATERMARK is None or ts.max() > NEXT_WATERMARK):
+        NEXT_WATERMARK = ts.max()
+
+
+def dune_query() -> QueryBase:
+    """
+    DUNE_WATERMARK_PARAM 配置了且是增量模式时，把上次的水位（往回退 DUNE_WATERMARK_OVERLAP_HOURS）作为参数传给查询，
+    只拉新的 CCTP 转账；回退区间里重复的 hash 会被增量去重跳过
+    """
+    from dune_client.query import QueryBase
+    from dune_client.types import QueryParameter
+
+    params = []
+    watermark = read_watermark() if DUNE_WATERMARK_PARAM else None
+    if watermark is not None and not INCREMENTAL:
+        logging.warning("watermark ignored: a full run needs every tx_hash, set INCREMENTAL=1")
+    elif watermark is not None:
+        since = watermark - pd.Timedelta(hours=DUNE_WATERMARK_OVERLAP_HOURS)
+        params.append(QueryParameter.text_type(DUNE_WATERMARK_PARAM, since.strftime("%Y-%m-%d %H:%M:%S")))
+        logging.info("Dune query with %s=%s", DUNE_WATERMARK_PARAM, params[0].value)
+
+    return QueryBase(
         name="CCTP Hash Fetcher",
         query_id=DUNE_QUERY_ID,
+        params=params,
     )
-    df = DUNE.run_query_dataframe(query, performance="medium")
+
+
+def reuse_dune_result(query: QueryBase) -> bool:
+    """带水位参数时参数值每次都不一样，不会有能复用的结果，直接执行，不去查最近一次结果"""
+    return DUNE_MAX_AGE_HOURS > 0 and not query.parameters()
+
+
+def latest_execution_id(query: QueryBase) -> str | None:
+    """
+    只取 1 行看最近一次执行的时间：不超过 DUNE_MAX_AGE_HOURS 返回它的 execution_id，否则 None
+    （dune_client 的 get_latest_result 会把整份结果一次读完，分页模式不能用）
+    """
+    from dune_client.models import ResultsResponse
+    from dune_client.util import age_in_hours
+
+    params = {f"params.{p.key}": p.to_dict()["value"] for p in query.parameters()}
+    params["limit"] = 1
+    try:
+        meta = ResultsResponse.from_dict(get_dune()._get(route=f"/query/{query.query_id}/results", params=params))
+    except Exception as e:
+        logging.info("no reusable Dune result: %s", repr(e))
+        return None
+
+    ended = meta.times.execution_ended_at
+    if ended is None or age_in_hours(ended) > DUNE_MAX_AGE_HOURS:
+        return None
+    logging.info("Reusing Dune execution %s (ended %s)", meta.execution_id, ended.isoformat())
+    return meta.execution_id
+
+
+def load_dune_hashes() -> pd.DataFrame:
+    if DUNE_HASHES_PATH:
+        df = pd.read_csv(DUNE_HASHES_PATH, dtype=str)
+        logging.info("Read Dune result from %s instead of querying", DUNE_HASHES_PATH)
+        return clean_dune_hashes(df)
+
+    query = dune_query()
+    with METRICS.timer("dune_query_seconds"):
+        df = None
+        if reuse_dune_result(query):
+            # 结果足够新就直接读（不花执行额度），太旧时 get_latest_result 内部会重新执行
+            try:
+                df = pd.DataFrame(get_dune().get_latest_result(query, max_age_hours=DUNE_MAX_AGE_HOURS).get_rows())
+            except Exception as e:
+                # 取最近一次结果失败（比如这组参数还没执行过）：照常执行查询
+                logging.info("no reusable Dune result, executing the query: %s", repr(e))
+        if df is None:
+            df = get_dune().run_query_dataframe(query, performance="medium")
+    return clean_dune_hashes(df)
+
+
+def clean_dune_hashes(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        # 带水位时没有新转账是正常的
+        logging.info("Dune returned no rows")
+        return pd.DataFrame(columns=[DUNE_HASH_COLUMN])
 
     if DUNE_HASH_COLUMN not in df.columns:
         raise KeyError(
             f"Dune result is missing column {DUNE_HASH_COLUMN}, actual columns: {df.columns}"
         )
 
-    df = df[[DUNE_HASH_COLUMN]].dropna().drop_duplicates()
+    # 时间列给列表查询定时间窗、给浏览器队列排先后用，其余地方只看 hash 列
+    cols = [DUNE_HASH_COLUMN] + ([DUNE_TIME_COLUMN] if DUNE_TIME_COLUMN in df.columns else [])
+    df = df[cols].dropna(subset=[DUNE_HASH_COLUMN])
     df[DUNE_HASH_COLUMN] = df[DUNE_HASH_COLUMN].astype(str).str.strip()
-    df = df[df[DUNE_HASH_COLUMN] != ""]
+    df = df[df[DUNE_HASH_COLUMN] != ""].drop_duplicates(subset=[DUNE_HASH_COLUMN])
+    if DUNE_TIME_COLUMN in df.columns:
+        # 每次完整加载都重新记（daemon 每轮一次），只看这次结果里的 hash
+        WATERMARK_TIMES.clear()
+        note_watermark(df[DUNE_HASH_COLUMN], df[DUNE_TIME_COLUMN])
     logging.info("Loaded %d unique tx_hash from Dune", len(df))
     return df
 
 
-class FetchError(Exception):
-    """For tenacity retries."""
-    pass
+def dump_dune_hashes(path: str = DUNE_HASHES_DUMP_PATH):
+    """
+    查一次 Dune，把 hash（和时间列）写到 path；分片用 DUNE_HASHES_PATH=path 读它，不再各查一遍
+    """
+    df = load_dune_hashes()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    df.to_csv(path, index=False)
+    print(f"Dune tx_hash written to {path} (rows={len(df)})")
+
+
+def iter_dune_hashes(page_size: int = DUNE_PAGE_SIZE) -> Iterator[list[str]]:
+    """
+    执行 Dune 查询后按 offset/limit 分页读取结果，每次产出一页去重后的 tx_hash；
+    只在页内去重（跨页重复由 cache / writer / 最终 drop_duplicates 兜住），内存只和页大小有关
+    """
+    from dune_client.models import ExecutionState
+
+    if DUNE_HASHES_PATH:
+        # 已经导出过：整份读进来再按页切（导出文件只有 hash 和时间两列）
+        hashes = load_dune_hashes()[DUNE_HASH_COLUMN].tolist()
+        for i in range(0, len(hashes), page_size):
+            yield hashes[i:i + page_size]
+        return
+
+    query = dune_query()
+    with METRICS.timer("dune_query_seconds"):
+        job_id = latest_execution_id(query) if reuse_dune_result(query) else None
+        if job_id is None:
+            job_id = get_dune().execute_query(query, performance="medium").execution_id
+            status = get_dune().get_execution_status(job_id)
+            while status.state not in ExecutionState.terminal_states():
+                time.sleep(DUNE_POLL_SECONDS)
+                status = get_dune().get_execution_status(job_id)
+            if status.state not in (ExecutionState.COMPLETED, ExecutionState.PARTIAL):
+                raise RuntimeError(f"Dune execution {job_id} ended in state {status.state}")
+
+    # 水位模式下顺带取时间列（查询必须返回 DUNE_TIME_COLUMN）
+    columns = [DUNE_HASH_COLUMN] + ([DUNE_TIME_COLUMN] if DUNE_WATERMARK_PARAM else [])
+    offset: int | None = 0
+    total = 0
+    WATERMARK_TIMES.clear()
+    while offset is not None:
+        with METRICS.timer("dune_page_seconds"):
+            res = get_dune().get_execution_results(job_id, limit=page_size, offset=offset, columns=columns)
+        rows = res.get_rows()
+        if DUNE_WATERMARK_PARAM:
+            note_watermark([row.get(DUNE_HASH_COLUMN) for row in rows], [row.get(DUNE_TIME_COLUMN) for row in rows])
+        values = (row.get(DUNE_HASH_COLUMN) for row in rows)
+        hashes = list(dict.fromkeys(str(v).strip() for v in values if v is not None))
+        hashes = [h for h in hashes if h]
+        total += len(hashes)
+        logging.info("Dune page offset=%d: %d tx_hash", offset, len(hashes))
+        yield hashes
+        offset = res.next_offset
+
+    logging.info("Streamed %d tx_hash from Dune (page size %d)", total, page_size)
+
+
+def dune_window(df_hash: pd.DataFrame) -> tuple[str, str]:
+    """
+    Dune 结果覆盖的时间窗 (start, end)，ISO 格式；没有时间列时返回 ("", "")（列表不按时间过滤）
+    """
+    if DUNE_TIME_COLUMN not in df_hash.columns:
+        return "", ""
+    ts = pd.to_datetime(df_hash[DUNE_TIME_COLUMN], utc=True, errors="coerce").dropna()
+    if ts.empty:
+        return "", ""
+    return ts.min().isoformat(), ts.max().isoformat()
+
+
+def load_existing_mapping() -> pd.DataFrame:
+    """
+    读取已经解析过的映射（增量模式用）：
+      - csv:  本地 CSV_PATH
+      - dune: Dune 上的 DUNE_TABLE_FULL 表
+      - both: 两者合并
+    """
+    frames: list[pd.DataFrame] = []
+
+    store = ParquetStore() if OUTPUT_STORE == "parquet" else None
+    if INCREMENTAL_SOURCE in ("csv", "both") and store and store.exists():
+        # 增量去重只需要 hash 列；parquet 模式写回时直接 upsert，不需要旧行的其他列
+        df_store = store.load(["query_tx_hash"]).reindex(columns=OUTPUT_COLUMNS)
+        logging.info("Loaded %d existing rows from %s", len(df_store), store.path)
+        frames.append(df_store)
+    elif INCREMENTAL_SOURCE in ("csv", "both") and os.path.exists(CSV_PATH):
+        df_csv = pd.read_csv(CSV_PATH, dtype=str)
+        logging.info("Loaded %d existing rows from %s", len(df_csv), CSV_PATH)
+        frames.append(df_csv)
+
+    if INCREMENTAL_SOURCE in ("dune", "both"):
+        try:
+            res = get_dune().run_sql(
+                query_sql=f"SELECT {', '.join(OUTPUT_COLUMNS)} FROM dune.{DUNE_TABLE_FULL}",
+                performance="medium",
+            )
+            df_dune = pd.DataFrame(res.result.rows, columns=OUTPUT_COLUMNS).astype(str)
+            logging.info("Loaded %d existing rows from dune.%s", len(df_dune), DUNE_TABLE_FULL)
+            frames.append(df_dune)
+        except Exception as e:
+            # 表不存在 / 套餐不支持 run_sql 时退回到只用本地 CSV
+            logging.warning("load existing mapping from Dune failed: %s", repr(e))
+
+    if not frames:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
+
+    df = pd.concat(frames, ignore_index=True)[OUTPUT_COLUMNS].dropna(subset=["query_tx_hash"])
+    df["query_tx_hash"] = df["query_tx_hash"].str.strip().str.lower()
+    return df.drop_duplicates(subset=["query_tx_hash"], keep="last")
 
 
 # -----------------------------
@@ -105,143 +428,765 @@ RECEIVER_SELECTOR = (
     "> div > div > div:nth-child(2)"
 )
 
+# 主 selector 之后依次试 extractor 里的备用 selector 和文本锚点
+EXTRACT_FIELDS = field_specs(SENDER_SELECTOR, RECEIVER_SELECTOR)
+
+
+def tx_page_url(tx_hash: str) -> str:
+    return f"{RANGE_BASE_URL}/transactions?s={tx_hash}"
+
+
+def make_record(tx_hash: str, sender: str, receiver: str) -> dict:
+    return {
+        "query_tx_hash": tx_hash.lower(),
+        "sender_address": sender,
+        "receiver_address": receiver,
+    }
+
+
+# 当前这笔 tx 是第几次尝试（线程引擎由 RetryScheduler 给出，async 引擎由 tenacity before 钩子写入）
+FETCH_ATTEMPT: ContextVar[int] = ContextVar("fetch_attempt", default=1)
+
+
+def _past_deadline(retry_state) -> bool:
+    """tenacity stop 条件：到了运行截止时间就不再原地重试"""
+    return RUN_DEADLINE.draining()
+
+
+def _retryable_async(retry_state) -> bool:
+    """tenacity retry 条件：查无此交易不重试；layout 按 RETRY_POLICY 的次数（默认再试一次）"""
+    e = retry_state.outcome.exception()
+    if not isinstance(e, FetchError) or e.kind == "not_found":
+        return False
+    return e.kind != "layout" or retry_state.attempt_number < RETRY_POLICY["layout"][0]
+
+
+def _note_attempt(retry_state):
+    FETCH_ATTEMPT.set(retry_state.attempt_number)
+    if retry_state.attempt_number > 1:
+        METRICS.incr("fetch_retries_total")
+
+
+def observe_tx(took: float, ok: bool):
+    """每笔 tx 结束后记录总耗时、重试次数和结果"""
+    METRICS.observe("tx_seconds", took)
+    METRICS.observe("tx_retries", FETCH_ATTEMPT.get() - 1, buckets=COUNT_BUCKETS)
+    METRICS.incr("tx_ok_total" if ok else "tx_failed_total")
+
+
+def check_status(tx_hash: str, status: int | None, headers: dict | None = None):
+    """
+    goto 的 HTTP 状态：404 查无此交易，407 代理认证失败，429（或带 Retry-After 的 503）限流，5xx 暂时性错误
+    """
+    if status is None or status < 400:
+        return
+    retry_after = parse_retry_after((headers or {}).get("retry-after"))
+    if status == 429 or (status == 503 and retry_after is not None):
+        raise Throttled(f"tx={tx_hash} throttled (HTTP {status})", retry_after)
+    if status == 404:
+        raise TxNotFound(f"tx={tx_hash} not found (HTTP 404)")
+    if status == 407:
+        raise ProxyFailure(f"proxy auth failed for tx={tx_hash} (HTTP 407)")
+    raise FetchTimeout(f"tx={tx_hash} got HTTP {status}")
+
+
+def classify_fetch_error(tx_hash: str, error: Exception, stage: str, page_text: str = "") -> FetchError:
+    """
+    把 Playwright 的异常归类：
+      - 代理相关的网络错误 -> ProxyFailure
+      - 页面打开了但字段没出现：验证页 / 限流提示 -> Throttled，页面写着查无此交易 -> TxNotFound，否则 -> NotIndexedYet
+      - 其他（导航超时、网络错误） -> FetchTimeout
+    """
+    if isinstance(error, FetchError):
+        return error
+    msg = f"fetch_sender_receiver failed for tx={tx_hash} at {stage}: {error}"
+    if any(m in str(error) for m in PROXY_ERROR_MARKERS):
+        return ProxyFailure(msg)
+    if stage == "selector":
+        text = page_text.lower()
+        if any(m in text for m in CHALLENGE_MARKERS):
+            return Throttled(msg)
+        if any(m in text for m in NOT_FOUND_MARKERS):
+            return TxNotFound(msg)
+        return NotIndexedYet(msg)
+    return FetchTimeout(msg)
+
+
+def _page_text(page) -> str:
+    try:
+        return page.inner_text("body", timeout=1000)
+    except Exception:
+        return ""
+
+
+async def _page_text_async(page: AsyncPage) -> str:
+    try:
+        return await page.inner_text("body", timeout=1000)
+    except Exception:
+        return ""
+
 
 # -----------------------------
-# Step 3: 在「已有 page」上抓一笔（有重试）
+# Step 3: 在 worker 的浏览器会话上抓一笔（单次尝试，重试由 RetryScheduler 负责）
 # -----------------------------
+def fetch_sender_receiver_on_page(tx_hash: str, session: BrowserSession) -> dict:
+    """
+    输入：一个 tx_hash 和该线程持有的 BrowserSession
+    输出：包含 query_tx_hash / sender_address / receiver_address 的 dict
+    失败时抛 FetchError 的子类（按原因分类），不在这里 sleep 重试。
+    代理 / 网络类失败 session 会回收 context（下次换 page、换代理）；
+    查无此交易 / 还没收录说明页面和代理都是好的，不回收；浏览器起不来时原样抛 BrowserLaunchError
+    """
+    tx_url = tx_page_url(tx_hash)
+    logging.info("Fetching tx=%s url=%s (attempt %d)", tx_hash, tx_url, FETCH_ATTEMPT.get())
+
+    t_nav = None
+    page = None
+    stage = "page"
+    try:
+        page = session.page()
+        RATE_LIMITER.acquire()
+        t_nav = time.perf_counter()
+        stage = "goto"
+        with METRICS.timer("goto_seconds"):
+            resp = page.goto(tx_url, wait_until=WAIT_UNTIL, timeout=HTTP_TIMEOUT * 1000)
+        check_status(tx_hash, resp.status if resp else None, resp.headers if resp else None)
+
+        # 一次 evaluate：页面里等两个字段都出现后一起返回
+        stage = "selector"
+        with METRICS.timer("selector_wait_seconds"):
+            sender_txt, receiver_txt = extract(
+                page, tx_hash, EXTRACT_FIELDS, SELECTOR_TIMEOUT, NOT_FOUND_MARKERS, CHALLENGE_MARKERS
+            )
+
+        session.mark_ok(time.perf_counter() - t_nav)
+        return make_record(tx_hash, sender_txt, receiver_txt)
+
+    except BrowserLaunchError:
+        raise
+    except Exception as e:
+        # 提取脚本已经自己看过页面文字，只有 Playwright 异常才需要再取一次
+        text = _page_text(page) if page is not None and stage == "selector" and not isinstance(e, FetchError) else ""
+        err = classify_fetch_error(tx_hash, e, stage, text)
+        logging.warning("tx=%s fetch error (%s): %s", tx_hash, err.kind, repr(e))
+        if isinstance(err, Throttled):
+            RATE_LIMITER.throttle(err.retry_after)
+        latency = time.perf_counter() - t_nav if t_nav else None
+        if err.kind in ("not_found", "not_indexed", "layout"):
+            session.mark_ok(latency)
+        else:
+            session.mark_failed(err, latency)
+        if err is e:
+            raise
+        raise err from e
+
+
 @retry(
     reraise=True,
-    stop=stop_after_attempt(5),
+    stop=stop_after_attempt(5) | _past_deadline,
     wait=wait_exponential(multiplier=0.5, min=0.5, max=5),
-    retry=retry_if_exception_type(FetchError),
+    retry=_retryable_async,
+    before=_note_attempt,
 )
-def fetch_sender_receiver_on_page(tx_hash: str, page: Page) -> dict | None:
+async def fetch_sender_receiver_on_page_async(tx_hash: str, page: AsyncPage) -> dict | None:
     """
-    输入：一个 tx_hash 和该线程持有的 page
-    输出：包含 query_tx_hash / sender_address / receiver_address 的 dict
+    fetch_sender_receiver_on_page 的 async 版本（async 引擎用），同样的失败分类；
+    page 是长期复用的，这里仍用 tenacity 原地重试，只是查无此交易不再重试、页面结构变了只再试一次
     """
-    tx_url = f"https://usdc.range.org/transactions?s={tx_hash}"
+    tx_url = tx_page_url(tx_hash)
     logging.info("Fetching tx=%s url=%s", tx_hash, tx_url)
 
+    stage = "goto"
     try:
-        page.goto(tx_url, wait_until="networkidle", timeout=HTTP_TIMEOUT * 1000)
+        await RATE_LIMITER.acquire_async()
+        with METRICS.timer("goto_seconds"):
+            resp = await page.goto(tx_url, wait_until=WAIT_UNTIL, timeout=HTTP_TIMEOUT * 1000)
+        check_status(tx_hash, resp.status if resp else None, resp.headers if resp else None)
 
-        sender_el = page.wait_for_selector(SENDER_SELECTOR, timeout=10000)
-        receiver_el = page.wait_for_selector(RECEIVER_SELECTOR, timeout=10000)
+        # 一次 evaluate：页面里等两个字段都出现后一起返回
+        stage = "selector"
+        with METRICS.timer("selector_wait_seconds"):
+            sender_txt, receiver_txt = await extract_async(
+                page, tx_hash, EXTRACT_FIELDS, SELECTOR_TIMEOUT, NOT_FOUND_MARKERS, CHALLENGE_MARKERS
+            )
 
-        sender_txt = sender_el.inner_text().strip()
-        receiver_txt = receiver_el.inner_text().strip()
-
-        return {
-            "query_tx_hash": tx_hash.lower(),
-            "sender_address": sender_txt,
-            "receiver_address": receiver_txt,
-        }
+        return make_record(tx_hash, sender_txt, receiver_txt)
 
     except Exception as e:
-        logging.warning("tx=%s fetch error (will retry if attempts left): %s", tx_hash, repr(e))
-        # 抛 FetchError 触发 tenacity 重试
-        raise FetchError(f"fetch_sender_receiver failed for tx={tx_hash}: {e}") from e
+        text = await _page_text_async(page) if stage == "selector" and not isinstance(e, FetchError) else ""
+        err = classify_fetch_error(tx_hash, e, stage, text)
+        logging.warning("tx=%s fetch error (%s): %s", tx_hash, err.kind, repr(e))
+        if isinstance(err, Throttled):
+            RATE_LIMITER.throttle(err.retry_after)
+        if err is e:
+            raise
+        raise err from e
 
 
 # -----------------------------
-# Step 4: 浏览器工作线程（每个线程一个 browser + page）
+# Step 4: 浏览器工作线程（每个线程一个 BrowserSession）
 # -----------------------------
-def browser_worker(name: str, task_queue: Queue, results: list, lock: Lock):
+def browser_worker(
+    name: str,
+    task_queue: PriorityTaskQueue,
+    results: list | None,
+    lock: Lock,
+    cache: ResultCache | None = None,
+    writer: StreamingWriter | None = None,
+    limiter: AdaptiveLimiter | None = None,
+    proxy_pool: ProxyPool | None = None,
+    scheduler: RetryScheduler | None = None,
+    prelaunch: bool = False,
+    on_done: Callable[[str, bool], None] | None = None,
+):
     """
     每个 worker 线程：
-      - 初始化自己的 Playwright + Browser + Page（挂 rotating proxy）
-      - 不断从队列中取 tx_hash，顺序处理
-      - 处理完所有任务后退出
+      - 持有一个 BrowserSession，prelaunch 时线程一启动就拉起浏览器（各 worker 并行），否则第一次拿到任务时才启动；
+        每个 context 从代理池租一个代理，page 定期回收、失败后重建（换代理），浏览器崩溃原地重启
+      - 不断从优先级队列中取 tx_hash（新的、没失败过的先来）；有 limiter 时每笔先拿并发名额
+      - 失败的 tx 交给 scheduler 延迟重排（不占着 worker 等退避），重试用完 / 查无此交易才算最终失败
+      - 浏览器起不来（本进程从没启动成功过，或崩溃后重启连续失败到上限，见 BrowserSession._launch）时关掉队列、
+        取消排队的重试：所有 worker 跳过剩下的任务（不写 cache，下次运行再查），不让每笔 tx 各自超时
+      - 每条结果 / 最终失败立刻写入 cache（如果有），结果同时交给流式 writer（如果有）；
+        有 on_done 时每笔最终结束（成功或最终失败）后回调 on_done(tx, ok)
+      - 取到哨兵后退出
     """
     logging.info("%s starting", name)
-    stealth = Stealth()
-    with stealth.use_sync(sync_playwright()) as p:
-        browser = p.chromium.launch(
-            headless=True,
-            proxy={
-                "server": "http://b2bcc08abc0815ee.qzc.na.ipidea.online:2336",
-                "username": "clyderen-zone-custom",
-                "password": "123456",
-            },
-        )
-        page = browser.new_page()
+    session = BrowserSession(name, proxy_pool=proxy_pool)
+    resource_filter = session.resource_filter
+    if prelaunch:
+        session.start()
 
-        try:
-            while True:
-                tx = task_queue.get()
-                if tx is None:
-                    # 取到哨兵值，说明没有任务了
-                    task_queue.task_done()
-                    logging.info("%s got sentinel, exiting", name)
-                    break
-
-                try:
-                    rec = fetch_sender_receiver_on_page(tx, page)
-                except Exception as e:
-                    logging.exception("%s tx=%s final failure after retries: %s", name, tx, repr(e))
-                    rec = None
+    try:
+        while True:
+            if limiter:
+                limiter.acquire()
+            t_wait = time.time()
+            tx = task_queue.get()
+            METRICS.observe("queue_wait_seconds", time.time() - t_wait)
+            if tx is None:
+                # 取到哨兵值，说明没有任务了
+                task_queue.task_done()
+                if limiter:
+                    limiter.release()
+                logging.info("%s got sentinel, exiting", name)
+                break
+            if task_queue.closed:
+                # 浏览器阶段已经停了：关队列之前刚放进来的直接跳过
+                if limiter:
+                    limiter.release()
+                task_queue.forget(tx)
+                task_queue.task_done()
+                continue
 
-                if isinstance(rec, dict):
+            FETCH_ATTEMPT.set(scheduler.attempt(tx) if scheduler else 1)
+            snap = resource_filter.snapshot() if resource_filter else None
+            t_tx = time.time()
+            rec = None
+            retrying = False
+            try:
+                rec = fetch_sender_receiver_on_page(tx, session)
+            except BrowserLaunchError as e:
+                logging.error("%s: %s, stopping the browser stage", name, e)
+                dropped = scheduler.cancel() if scheduler else 0
+                task_queue.close()
+                # dropped 是关闭以来累计丢掉的（包括别的 worker 先关掉时丢的、之后 put 进来被丢的）
+                logging.error(
+                    "[CCTP] dropped %d queued tasks so far and %d pending retries, they stay unresolved for the next run",
+                    task_queue.dropped, dropped,
+                )
+            except FetchError as e:
+                retrying = scheduler is not None and scheduler.reschedule(tx, e)
+                if not retrying:
+                    logging.error("%s tx=%s final failure (%s): %s", name, tx, e.kind, repr(e))
+                    if cache:
+                        cache.put_fail(tx, repr(e))
+            except Exception as e:
+                logging.exception("%s tx=%s unexpected failure: %s", name, tx, repr(e))
+                if cache:
+                    cache.put_fail(tx, repr(e))
+
+            took = time.time() - t_tx
+            if limiter:
+                limiter.release(took, ok=rec is not None)
+            logging.info(
+                "%s tx=%s took %.2fs, requests=%s",
+                name,
+                tx,
+                took,
+                resource_filter.delta(snap) if resource_filter else "unfiltered",
+            )
+            if retrying:
+                # 名额留给 scheduler，到期放回队列后由它 task_done
+                continue
+
+            observe_tx(took, rec is not None)
+            if scheduler:
+                scheduler.done(tx)
+            task_queue.forget(tx)
+            if on_done:
+                on_done(tx, rec is not None)
+            if isinstance(rec, dict):
+                if cache:
+                    cache.put_ok(rec)
+                if writer:
+                    writer.put(rec)
+                if results is not None:
                     with lock:
                         results.append(rec)
 
-                task_queue.task_done()
-        finally:
-            browser.close()
-            logging.info("%s browser closed", name)
+            task_queue.task_done()
+    finally:
+        session.close()
 
 
-def build_cctp_df(df_hash: pd.DataFrame) -> pd.DataFrame:
+def pending_hashes(df_hash: pd.DataFrame, known_hashes: set[str] | None = None) -> list[str]:
+    """
+    known_hashes: 已解析过的 tx_hash（小写），增量模式下这些不会再入队
+    """
     hashes = df_hash[DUNE_HASH_COLUMN].tolist()
-    total = len(hashes)
+    if known_hashes:
+        before = len(hashes)
+        hashes = [h for h in hashes if h.lower() not in known_hashes]
+        logging.info("[CCTP] incremental: skip %d known hashes, %d new", before - len(hashes), len(hashes))
+    return hashes
+
+
+def split_cached(hashes: list[str], cache: ResultCache | None) -> tuple[list[dict], list[str]]:
+    """
+    先查本地 cache：返回 (命中的结果, 还需要去抓的 tx_hash)；负缓存未过期的直接跳过
+    """
+    if cache is None or not hashes:
+        return [], hashes
+
+    cached, skip = cache.lookup(hashes)
+    done = {r["query_tx_hash"] for r in cached} | skip
+    todo = [h for h in hashes if h.lower() not in done]
+    return cached, todo
 
+
+def resolve_via_http(hashes: list[str], cache: ResultCache | None = None) -> tuple[list[dict], list[str]]:
+    """
+    HTTP 直连解析（不开浏览器），返回 (结果, 需要浏览器兜底的 tx_hash)
+    解析失败的不写负缓存，浏览器还会再试
+    """
+    t0 = time.time()
+    cached, hashes = split_cached(hashes, cache)
+    proxy_url = HTTP_PROXY_URL if HTTP_RESOLVER_PROXY else None
+    with RangeApiClient(proxy_url=proxy_url, timeout=HTTP_TIMEOUT) as client:
+        records, failed = client.resolve_many(hashes)
+
+    if cache:
+        for rec in records:
+            cache.put_ok(rec)
+    records = cached + records
+
+    elapsed = time.time() - t0
     logging.info(
-        "[CCTP] start, total=%d, browsers=%d (browser pool with rotating proxy)",
-        total,
-        N_BROWSERS,
+        "[HTTP] resolved=%d, fallback=%d, elapsed=%.2fs", len(records), len(failed), elapsed
     )
-    print(f"[CCTP] total tasks={total}, browsers={N_BROWSERS}")
+    print(f"[HTTP] resolved={len(records)}, fallback to browser={len(failed)}, elapsed={elapsed:.2f}s")
+    return records, failed
 
-    task_queue: Queue = Queue()
-    results: list[dict] = []
-    lock = Lock()
 
-    # 把任务塞进队列
-    for h in hashes:
-        task_queue.put(h)
+def resolve_via_listing(
+    hashes: list[str],
+    window: tuple[str, str],
+    cache: ResultCache | None = None,
+) -> tuple[list[dict], list[str]]:
+    """
+    批量解析：翻时间窗内的交易列表（一页多笔），在本地和 hashes join
+    返回 (结果, 列表里没找到、需要逐笔查的 tx_hash)
+    """
+    t0 = time.time()
+    cached, hashes = split_cached(hashes, cache)
+    start, end = window
+    proxy_url = HTTP_PROXY_URL if HTTP_RESOLVER_PROXY else None
+    with RangeApiClient(proxy_url=proxy_url, timeout=HTTP_TIMEOUT) as client:
+        records, leftover = client.resolve_listing(hashes, start, end)
 
-    # 加 N_BROWSERS 个哨兵 None，表示任务结束
-    for _ in range(N_BROWSERS):
-        task_queue.put(None)
+    if cache:
+        for rec in records:
+            cache.put_ok(rec)
+    records = cached + records
 
-    # 启动浏览器线程
-    threads: list[Thread] = []
-    t0 = time.time()
+    elapsed = time.time() - t0
+    logging.info(
+        "[HTTP-listing] window=[%s, %s], resolved=%d, leftover=%d, elapsed=%.2fs",
+        start or "-", end or "-", len(records), len(leftover), elapsed,
+    )
+    print(f"[HTTP-listing] resolved={len(records)}, leftover={len(leftover)}, elapsed={elapsed:.2f}s")
+    return records, leftover
 
-    for i in range(N_BROWSERS):
-        t = Thread(
-            target=browser_worker,
-            name=f"browser-worker-{i+1}",
-            args=(f"browser-worker-{i+1}", task_queue, results, lock),
-            daemon=True,
-        )
-        t.start()
-        threads.append(t)
 
-    # 阻塞直到所有任务完成
-    task_queue.join()
+def resolve_via_rpc(hashes: list[str], cache: ResultCache | None = None) -> tuple[list[dict], list[str]]:
+    """
+    链上解析：批量 JSON-RPC 取 receipt、解码 CCTP 日志，返回 (结果, 需要网页解析的 tx_hash)
+    """
+    t0 = time.time()
+    cached, hashes = split_cached(hashes, cache)
+    with RpcClient() as client:
+        records, leftover = client.resolve_many(hashes)
+
+    if cache:
+        for rec in records:
+            cache.put_ok(rec)
+    records = cached + records
 
     elapsed = time.time() - t0
-    logging.info("[CCTP] all tasks done, elapsed=%.2fs, results=%d", elapsed, len(results))
-    print(f"[CCTP] all tasks done, elapsed={elapsed:.2f}s, results={len(results)}")
+    logging.info("[RPC] resolved=%d, leftover=%d, elapsed=%.2fs", len(records), len(leftover), elapsed)
+    print(f"[RPC] resolved={len(records)}, fallback to site={len(leftover)}, elapsed={elapsed:.2f}s")
+    return records, leftover
+
+
+def resolve_without_browser(hashes: list[str], cache: ResultCache | None = None) -> tuple[list[dict], list[str]]:
+    """
+    流式 / daemon 逐页用：RPC_RESOLVER 时先链上解码，HTTP_RESOLVER 时剩下的走 HTTP，返回 (结果, 要进浏览器的)
+    """
+    if not (RPC_RESOLVER or HTTP_RESOLVER):
+        return split_cached(hashes, cache)
+
+    records: list[dict] = []
+    if RPC_RESOLVER and hashes:
+        done, hashes = resolve_via_rpc(hashes, cache)
+        records += done
+    if HTTP_RESOLVER and hashes:
+        done, hashes = resolve_via_http(hashes, cache)
+        records += done
+    return records, hashes
 
+
+def results_to_df(results: list[dict]) -> pd.DataFrame:
     if not results:
         logging.warning("[CCTP] all tasks failed or returned no result")
-        return pd.DataFrame(columns=["query_tx_hash", "sender_address", "receiver_address"])
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
 
-    df = pd.DataFrame(results).drop_duplicates()
-    return df
+    return pd.DataFrame(results).drop_duplicates()
+
+
+def build_cctp_df(
+    df_hash: pd.DataFrame,
+    known_hashes: set[str] | None = None,
+    cache: ResultCache | None = None,
+    writer: StreamingWriter | None = None,
+) -> pd.DataFrame:
+    times = block_times(df_hash, DUNE_HASH_COLUMN, DUNE_TIME_COLUMN)
+    return run_browser_pool([pending_hashes(df_hash, known_hashes)], cache=cache, writer=writer, times=times)
+
+
+def stream_cctp_df(
+    pages: Iterable[list[str]],
+    known_hashes: set[str] | None = None,
+    cache: ResultCache | None = None,
+    writer: StreamingWriter | None = None,
+) -> pd.DataFrame:
+    """
+    流式版本：pages 是 iter_dune_hashes() 这样逐页产出的 hash，
+    每页先去掉已知的，（RPC_RESOLVER / HTTP_RESOLVER 时）链上解码、走一遍 HTTP，剩下的才进浏览器队列
+    """
+    def prepared():
+        for page in pages:
+            if known_hashes:
+                page = [h for h in page if h.lower() not in known_hashes]
+            yield page
+
+    return run_browser_pool(prepared(), cache=cache, writer=writer, presolve=True)
+
+
+class BrowserPool:
+    """
+    常驻的浏览器 worker 池（批量运行和 daemon 共用）：
+        pool = BrowserPool(cache, writer)
+        pool.submit(hashes)      # cache / HTTP 先过一遍，剩下的进有界优先级队列（TASK_QUEUE_SIZE），满了就阻塞
+        pool.idle()              # 队列里（包括排队重试的）都处理完了
+        pool.broken              # 浏览器起不来，浏览器阶段已经停了
+        pool.settled()           # track=True 时：上次调用以来最终结束的 [(小写 tx_hash, 是否解析成功)]
+        df = pool.close()        # 等所有任务结束，停掉 worker
+    collect=False 时不在内存里攒结果（daemon 常驻，结果只走 cache / writer）
+    deadline 到了之后不再开始新任务（daemon 不设截止时间）
+    """
+
+    def __init__(
+        self,
+        cache: ResultCache | None = None,
+        writer: StreamingWriter | None = None,
+        collect: bool = True,
+        deadline: RunDeadline | None = RUN_DEADLINE,
+        track: bool = False,
+    ):
+        self.cache = cache
+        self.writer = writer
+        self.track = track
+        self._settled: list[tuple[str, bool]] = []
+        self.deadline = deadline if deadline is not None and deadline.enabled else None
+        # 自适应模式：起 MAX_WORKERS 个线程（浏览器按需启动），实际并发由 limiter 控制，初始为 N_BROWSERS
+        self.limiter = AdaptiveLimiter(initial=N_BROWSERS) if ADAPTIVE else None
+        self.n_workers = self.limiter.ceiling if self.limiter else N_BROWSERS
+        # 所有 worker 共用一个代理池（健康度、熔断、并发上限都是全局的）
+        self.proxy_pool = ProxyPool.from_env(default=BROWSER_PROXY)
+
+        logging.info(
+            "[CCTP] start, browsers=%d, queue size=%d (browser pool with rotating proxy, adaptive=%s)",
+            self.n_workers,
+            TASK_QUEUE_SIZE,
+            ADAPTIVE,
+        )
+        print(f"[CCTP] browsers={self.n_workers}")
+
+        self.task_queue = PriorityTaskQueue(maxsize=TASK_QUEUE_SIZE, deadline=self.deadline)
+        self.results: list[dict] | None = [] if collect else None
+        self.lock = Lock()
+        self.scheduler = RetryScheduler(self.task_queue, deadline=self.deadline)
+        self.task_queue.attempts = self.scheduler.attempt
+        self.scheduler.start()
+        if self.deadline:
+            logging.info("[CCTP] run deadline: draining in %.0fs", self.deadline.remaining())
+        self.total = 0
+        self.t0 = time.time()
+
+        # 启动浏览器线程：前 N_BROWSERS 个（初始并发）提前并行拉起浏览器（PRELAUNCH），和之后的 submit 重叠
+        self.threads: list[Thread] = []
+        for i in range(self.n_workers):
+            name = f"browser-worker-{i+1}"
+            t = Thread(
+                target=browser_worker,
+                name=name,
+                args=(
+                    name, self.task_queue, self.results, self.lock, cache, writer, self.limiter, self.proxy_pool,
+                    self.scheduler, PRELAUNCH and i < N_BROWSERS, self._on_done if track else None,
+                ),
+                daemon=True,
+            )
+            t.start()
+            self.threads.append(t)
+
+    def _on_done(self, tx: str, ok: bool):
+        with self.lock:
+            self._settled.append((tx.lower(), ok))
+
+    def settled(self) -> list[tuple[str, bool]]:
+        with self.lock:
+            out, self._settled = self._settled, []
+        return out
+
+    def submit(self, hashes: list[str], presolve: bool = False, times: dict[str, float] | None = None) -> int:
+        """
+        返回进浏览器队列的数量（cache / RPC / HTTP 已经解决的直接进结果）
+        times: {小写 tx_hash: block_time 秒}，决定队列里的先后（新的先抓）
+        """
+        if self.deadline and self.deadline.draining():
+            METRICS.incr("deadline_dropped_total", len(hashes))
+            return 0
+        offered = hashes
+        if presolve:
+            done, hashes = resolve_without_browser(hashes, self.cache)
+        else:
+            done, hashes = split_cached(hashes, self.cache)
+        if self.track:
+            # 没进浏览器队列的现在就算结束：已解析的成功，负缓存未过期跳过的算失败
+            resolved = {r["query_tx_hash"] for r in done}
+            queued = {h.lower() for h in hashes}
+            for h in offered:
+                if h.lower() not in queued:
+                    self._on_done(h, h.lower() in resolved)
+        if self.writer:
+            for rec in done:
+                self.writer.put(rec)
+        if self.results is not None:
+            with self.lock:
+                self.results.extend(done)
+
+        times = times or {}
+        failures = self.cache.failures(hashes) if self.cache and hashes else {}
+        self.task_queue.note({h.lower(): times[h.lower()] for h in hashes if h.lower() in times}, failures)
+        for h in self.task_queue.sort(hashes):
+            self.task_queue.put(h)
+        self.total += len(hashes)
+        return len(hashes)
+
+    def idle(self) -> bool:
+        return self.task_queue.unfinished_tasks == 0
+
+    @property
+    def broken(self) -> bool:
+        return self.task_queue.closed
+
+    def close(self, cancel_retries: bool = False) -> pd.DataFrame:
+        """
+        cancel_retries=True（daemon 退出）时丢掉排队中的重试和队列里还没开始的任务，只等正在抓的这几笔；
+        被丢掉的 tx 没有写 cache，下次启动会重新入队
+        """
+        if cancel_retries:
+            dropped = self.scheduler.cancel()
+            unstarted = self.task_queue.drain()
+            if dropped or unstarted:
+                logging.info(
+                    "[CCTP] dropped %d pending retries and %d queued tasks on shutdown", dropped, len(unstarted)
+                )
+
+        # 阻塞直到所有任务（包括排队重试的）完成
+        self.task_queue.join()
+        self.scheduler.stop()
+
+        # 每个线程一个哨兵 None，表示任务结束；重试可能晚于原任务入队，所以哨兵只能在 join 之后放
+        for _ in range(self.n_workers):
+            self.task_queue.put(None)
+        for t in self.threads:
+            t.join()
+
+        results = self.results or []
+        elapsed = time.time() - self.t0
+        logging.info(
+            "[CCTP] all tasks done, browser tasks=%d, elapsed=%.2fs, results=%d", self.total, elapsed, len(results)
+        )
+        print(f"[CCTP] all tasks done, browser tasks={self.total}, elapsed={elapsed:.2f}s, results={len(results)}")
+        if self.proxy_pool:
+            logging.info("[CCTP] proxy health: %s", self.proxy_pool.snapshot())
+        logging.info("[CCTP] rate limiter: %s", RATE_LIMITER.snapshot())
+        if asset_store():
+            logging.info("[CCTP] asset cache: %s", asset_store().snapshot())
+        if self.deadline and self.deadline.hit:
+            print(f"[CCTP] stopped at the run deadline, {self.task_queue.dropped} queued tasks left for the next run")
+        if self.broken:
+            print(f"[CCTP] browsers could not be launched, {self.task_queue.dropped} tasks left for the next run")
+
+        return results_to_df(results)
+
+
+def run_browser_pool(
+    pages: Iterable[list[str]],
+    cache: ResultCache | None = None,
+    writer: StreamingWriter | None = None,
+    presolve: bool = False,
+    times: dict[str, float] | None = None,
+) -> pd.DataFrame:
+    """
+    先启动 worker 线程，再边读 pages 边往有界队列（TASK_QUEUE_SIZE）里放：
+    第一页到了就开始抓，队列满了生产者阻塞，内存不随 hash 总数增长
+    """
+    pool = BrowserPool(cache=cache, writer=writer)
+    for page in pages:
+        pool.submit(page, presolve=presolve, times=times)
+    return pool.close()
+
+
+# -----------------------------
+# Step 4b: asyncio 引擎（少量 browser，每个 browser 多个 context/page）
+# -----------------------------
+async def _run_async_pool(
+    hashes: list[str],
+    cache: ResultCache | None = None,
+    writer: StreamingWriter | None = None,
+) -> list[dict]:
+    """
+    - 启动 N_ASYNC_BROWSERS 个 browser，一共开 ASYNC_CONCURRENCY 个 context/page，放进 page 池
+    - 每个 tx 一个协程，semaphore 控制同时在查的数量，查之前从池里借 page，查完还回去
+    """
+    from playwright.async_api import async_playwright
+    from playwright_stealth import Stealth
+
+    results: list[dict] = []
+    sem = asyncio.Semaphore(ASYNC_CONCURRENCY)
+    page_pool: asyncio.Queue = asyncio.Queue()
+    # 所有 page 共用一个 filter，统计是整轮累计的
+    resource_filter = ResourceFilter() if RESOURCE_FILTER else None
+    asset_cache = asset_store()
+
+    # context 是长期复用的，这里不做健康调度，只把 context 轮流分到池里的各个代理上
+    proxy_pool = ProxyPool.from_env(default=BROWSER_PROXY)
+    proxies = [pr.playwright_config() for pr in proxy_pool.proxies] if proxy_pool else [None]
+
+    async with Stealth().use_async(async_playwright()) as p:
+        t_launch = time.perf_counter()
+        browsers = await asyncio.gather(
+            *(p.chromium.launch(headless=True) for _ in range(N_ASYNC_BROWSERS))
+        )
+        METRICS.observe("browser_launch_seconds", time.perf_counter() - t_launch)
+        try:
+            for i in range(ASYNC_CONCURRENCY):
+                context = await browsers[i % len(browsers)].new_context(proxy=proxies[i % len(proxies)])
+                if asset_cache:
+                    await asset_cache.install_async(context)
+                page = await context.new_page()
+                if resource_filter:
+                    await resource_filter.install_async(page)
+                page_pool.put_nowait(page)
+            logging.info("[CCTP-async] %d browsers, %d pages ready", len(browsers), page_pool.qsize())
+
+            async def run_one(tx: str):
+                async with sem:
+                    if RUN_DEADLINE.draining():
+                        # 截止时间到了：还没开始的不再开始，下次运行再查
+                        METRICS.incr("deadline_dropped_total")
+                        return
+                    t_wait = time.time()
+                    page = await page_pool.get()
+                    METRICS.observe("queue_wait_seconds", time.time() - t_wait)
+                    t_tx = time.time()
+                    try:
+                        rec = await fetch_sender_receiver_on_page_async(tx, page)
+                    except Exception as e:
+                        logging.exception("[CCTP-async] tx=%s final failure after retries: %s", tx, repr(e))
+                        rec = None
+                        if cache and not RUN_DEADLINE.hit:
+                            cache.put_fail(tx, repr(e))
+                    finally:
+                        page_pool.put_nowait(page)
+                    observe_tx(time.time() - t_tx, rec is not None)
+
+                if isinstance(rec, dict):
+                    if cache:
+                        cache.put_ok(rec)
+                    if writer:
+                        writer.put(rec)
+                    results.append(rec)
+
+            await asyncio.gather(*(run_one(h) for h in hashes))
+        finally:
+            for browser in browsers:
+                await browser.close()
+            logging.info(
+                "[CCTP-async] browsers closed, requests=%s, asset cache=%s",
+                resource_filter.snapshot() if resource_filter else "unfiltered",
+                asset_cache.snapshot() if asset_cache else "off",
+            )
+
+    return results
+
+
+def build_cctp_df_async(
+    df_hash: pd.DataFrame,
+    known_hashes: set[str] | None = None,
+    cache: ResultCache | None = None,
+    writer: StreamingWriter | None = None,
+) -> pd.DataFrame:
+    cached, hashes = split_cached(pending_hashes(df_hash, known_hashes), cache)
+    # gather 按顺序启动协程：新的、没失败过的先查
+    times = block_times(df_hash, DUNE_HASH_COLUMN, DUNE_TIME_COLUMN)
+    failures = cache.failures(hashes) if cache and hashes else {}
+    hashes = sorted(hashes, key=lambda h: priority_key(h, times, failures))
+    total = len(hashes)
+    if writer:
+        for rec in cached:
+            writer.put(rec)
+
+    logging.info(
+        "[CCTP-async] start, total=%d, browsers=%d, concurrency=%d",
+        total,
+        N_ASYNC_BROWSERS,
+        ASYNC_CONCURRENCY,
+    )
+    print(f"[CCTP-async] total tasks={total}, browsers={N_ASYNC_BROWSERS}, concurrency={ASYNC_CONCURRENCY}")
+
+    t0 = time.time()
+    results = asyncio.run(_run_async_pool(hashes, cache, writer)) if hashes else []
+    results = cached + results
+
+    elapsed = time.time() - t0
+    logging.info("[CCTP-async] all tasks done, elapsed=%.2fs, results=%d", elapsed, len(results))
+    print(f"[CCTP-async] all tasks done, elapsed={elapsed:.2f}s, results={len(results)}")
+
+    return results_to_df(results)
 
 
 # -----------------------------
@@ -253,7 +1198,7 @@ def ensure_table():
     这里只保留三列：query_tx_hash, sender_address, receiver_address。
     """
     try:
-        DUNE.delete_table(DUNE_NAMESPACE, DUNE_TABLE_NAME)
+        get_dune().delete_table(DUNE_NAMESPACE, DUNE_TABLE_NAME)
     except Exception:
         # ignore if table does not exist
         pass
@@ -265,7 +1210,7 @@ def ensure_table():
     ]
 
     try:
-        DUNE.create_table(
+        get_dune().create_table(
             namespace=DUNE_NAMESPACE,
             table_name=DUNE_TABLE_NAME,
             description="CCTP sender/receiver address mapping",
@@ -277,35 +1222,400 @@ def ensure_table():
         pass
 
 
+def upload_chunk(data: bytes):
+    # Dune insert 只接受 CSV / NDJSON，CSV 不重复字段名，更小
+    get_dune().insert_table(DUNE_NAMESPACE, DUNE_TABLE_NAME, io.BytesIO(data), content_type="text/csv")
+
+
 def insert_csv(csv_path: str):
-    with open(csv_path, "rb") as f:
-        DUNE.insert_table(DUNE_NAMESPACE, DUNE_TABLE_NAME, f, content_type="text/csv")
+    """
+    分块上传（见 uploader.py）；彻底失败时把文件留作 PENDING_CSV_PATH，
+    下次运行 Step 0 会续传（内容相同，已确认的块直接跳过）
+    """
+    try:
+        with METRICS.timer("dune_upload_seconds"):
+            stats = ChunkedUploader(upload_chunk).upload_file(csv_path)
+    except Exception:
+        if csv_path != PENDING_CSV_PATH and not os.path.exists(PENDING_CSV_PATH):
+            shutil.copyfile(csv_path, PENDING_CSV_PATH)
+            logging.error("upload of %s failed, kept as %s for the next run", csv_path, PENDING_CSV_PATH)
+        raise
+    print(
+        f"Uploaded {csv_path}: {stats['chunks']} chunks ({stats['skipped']} resumed), "
+        f"{stats['bytes']} bytes in {stats['seconds']:.2f}s"
+    )
+
+
+def insert_rows(rows: list[dict]):
+    """流式 writer 的小批量上传"""
+    data = io.BytesIO(rows_to_csv_bytes(rows, OUTPUT_COLUMNS))
+    with METRICS.timer("dune_upload_seconds"):
+        get_dune().insert_table(DUNE_NAMESPACE, DUNE_TABLE_NAME, data, content_type="text/csv")
+
+
+def upload_pending():
+    """补传上次流式上传失败留下的行"""
+    if not os.path.exists(PENDING_CSV_PATH):
+        return
+    insert_csv(PENDING_CSV_PATH)
+    os.remove(PENDING_CSV_PATH)
+    logging.info("re-uploaded pending rows from %s", PENDING_CSV_PATH)
 
 
 # -----------------------------
 # Step 6: Main
 # -----------------------------
-def main():
-    os.makedirs(os.path.dirname(CSV_PATH), exist_ok=True)
+def write_run_report():
+    METRICS.write_report(RUN_REPORT_PATH)
+    if PROM_TEXTFILE_PATH:
+        METRICS.write_prometheus(PROM_TEXTFILE_PATH)
+    print(f"Run report written to {RUN_REPORT_PATH}")
 
-    print("Step 1) Load tx_hash from Dune")
-    df_hash = load_dune_hashes()
 
-    print("Step 2) Fetch CCTP sender/receiver via browser pool")
-    df_out = build_cctp_df(df_hash)
+def write_and_upload(df_out: pd.DataFrame, df_existing: pd.DataFrame):
+    """Step 3 ~ 5：写 CSV_PATH（增量模式合并旧行并单独写一份 delta），然后上传"""
+    if OUTPUT_STORE == "parquet":
+        write_store_and_upload(df_out, df_existing)
+        return
 
     print("Step 3) Write CSV")
-    df_out.to_csv(CSV_PATH, index=False)
-    print(f"CSV written to {CSV_PATH}")
+    t_csv = time.perf_counter()
+    if INCREMENTAL:
+        # 旧行 + 新行合并写回 CSV_PATH，新行单独写一份用于上传
+        df_merged = pd.concat([df_existing, df_out], ignore_index=True)
+        df_merged = df_merged.drop_duplicates(subset=["query_tx_hash"], keep="last")
+        df_merged.to_csv(CSV_PATH, index=False)
+        df_out.to_csv(DELTA_CSV_PATH, index=False)
+        print(f"CSV written to {CSV_PATH} (total={len(df_merged)}, new={len(df_out)})")
+    else:
+        df_out.to_csv(CSV_PATH, index=False)
+        print(f"CSV written to {CSV_PATH}")
+    METRICS.observe("csv_write_seconds", time.perf_counter() - t_csv)
 
     print("Step 4) Ensure Dune table exists (optional)")
     # ensure_table()
 
     print("Step 5) Upload CSV to Dune table")
-    insert_csv(CSV_PATH)
+    if not INCREMENTAL:
+        insert_csv(CSV_PATH)
+    elif len(df_out):
+        insert_csv(DELTA_CSV_PATH)
+    else:
+        print("No new rows, skip upload")
+
+
+def commit_watermark(resolved: set[str], shard: tuple[int, int] | None = None):
+    """
+    运行结束后推进水位；分片模式每个分片各写一份，merge 时全部分片都成功才推进（取最小）
+    resolved：已经有结果的 tx_hash（小写，含增量模式跳过的）。读到的 hash 里还有没解析出来的
+    （最终失败、负缓存跳过、截止时间丢掉的）时，水位只推进到其中最早的 block_time，下次还会查到它们
+    """
+    if not DUNE_WATERMARK_PARAM or NEXT_WATERMARK is None:
+        return
+    target = NEXT_WATERMARK
+    pending = [
+        t for h, t in WATERMARK_TIMES.items()
+        if h not in resolved and (shard is None or shard_of(h, shard[1]) == shard[0])
+    ]
+    if pending:
+        target = min(pending)
+        logging.warning(
+            "%d tx_hash still unresolved, watermark held at %s (oldest unresolved)", len(pending), target.isoformat()
+        )
+    save_watermark(target, shard_path(WATERMARK_PATH, *shard) if shard else WATERMARK_PATH)
+
+
+def upsert_store(df_out: pd.DataFrame, df_existing: pd.DataFrame | None = None):
+    """
+    按 hash upsert 到 Parquet；CSV_EXPORT=1 时再从 store 导出一份完整的 CSV_PATH（仓库里提交的那份）
+    第一次运行（store 还不存在）先用已有的 CSV_PATH / df_existing 建库，不然导出会把历史 CSV 覆盖成只剩本次的行
+    """
+    t_csv = time.perf_counter()
+    store = ParquetStore()
+    if not store.exists():
+        seed = [pd.read_csv(CSV_PATH, dtype=str)] if os.path.exists(CSV_PATH) else []
+        if df_existing is not None:
+            seed.append(df_existing)
+        seeded = store.seed(seed)
+        print(f"Parquet store {store.path} created from existing mapping (rows={seeded})")
+    total, added = store.upsert(df_out)
+    if CSV_EXPORT:
+        store.export_csv(CSV_PATH)
+    METRICS.observe("csv_write_seconds", time.perf_counter() - t_csv)
+    print(f"Parquet store {store.path} updated (total={total}, new={added}, exported csv={CSV_EXPORT})")
+
+
+def write_store_and_upload(df_out: pd.DataFrame, df_existing: pd.DataFrame | None = None):
+    """parquet 模式：upsert 到 store，本次结果只写到 delta CSV 上传"""
+    print("Step 3) Upsert Parquet store")
+    upsert_store(df_out, df_existing)
+    df_delta = export_frame(normalize_frame(df_out)) if len(df_out) else pd.DataFrame(columns=OUTPUT_COLUMNS)
+    df_delta.to_csv(DELTA_CSV_PATH, index=False)
+
+    print("Step 5) Upload CSV to Dune table")
+    if len(df_delta):
+        insert_csv(DELTA_CSV_PATH)
+    else:
+        print("No new rows, skip upload")
+
+
+def main(shard: tuple[int, int] | None = None):
+    """
+    shard=(i, K) 时只处理第 i 个分片，结果写到分片 CSV，不上传（由 merge_shards 统一上传）
+    """
+    os.makedirs(os.path.dirname(CSV_PATH), exist_ok=True)
+
+    if shard is None and os.path.exists(PENDING_CSV_PATH):
+        print("Step 0) Upload rows left over from the last run")
+        upload_pending()
+
+    df_existing = load_existing_mapping() if INCREMENTAL else pd.DataFrame(columns=OUTPUT_COLUMNS)
+    known_hashes = set(df_existing["query_tx_hash"])
+
+    cache = ResultCache() if RESULT_CACHE else None
+
+    writer = None
+    if STREAMING and shard:
+        logging.info("[shard] streaming upload disabled in shard mode, merge step uploads once")
+    elif STREAMING:
+        # 增量模式直接追加到已有 CSV；全量模式先清空
+        writer = StreamingWriter(
+            CSV_PATH,
+            OUTPUT_COLUMNS,
+            upload_fn=insert_rows,
+            pending_path=PENDING_CSV_PATH,
+            truncate=not INCREMENTAL,
+        )
+        writer.start()
+
+    if DUNE_STREAM and ENGINE == "thread":
+        # Dune 分页 -> HTTP -> 有界队列 -> 浏览器，全程流式（列表批量解析需要完整时间窗，这里不用）
+        print("Step 1+2) Stream tx_hash from Dune into the resolver pipeline")
+        pages = iter_dune_hashes()
+        if shard:
+            pages = ([h for h in page if shard_of(h, shard[1]) == shard[0]] for page in pages)
+        df_out = stream_cctp_df(pages, known_hashes=known_hashes, cache=cache, writer=writer)
+    else:
+        if DUNE_STREAM:
+            logging.warning("DUNE_STREAM only applies to ENGINE=thread, loading the full Dune result")
+        print("Step 1) Load tx_hash from Dune")
+        df_hash = load_dune_hashes()
+        if shard:
+            df_hash = filter_shard(df_hash, DUNE_HASH_COLUMN, *shard)
+            print(f"[shard] {shard[0]}/{shard[1]}: {len(df_hash)} tx_hash in this shard")
+
+        http_results: list[dict] = []
+        todo = pending_hashes(df_hash, known_hashes)
+        if RPC_RESOLVER and todo:
+            print("Step 2a) Decode CCTP logs via JSON-RPC (no site requests)")
+            http_results, todo = resolve_via_rpc(todo, cache)
+
+        if LISTING_RESOLVER and todo:
+            print("Step 2b) Resolve in batches via usdc.range.org transaction listing")
+            listing_results, todo = resolve_via_listing(todo, dune_window(df_hash), cache)
+            http_results += listing_results
 
+        if HTTP_RESOLVER and todo:
+            print("Step 2c) Resolve leftovers via usdc.range.org HTTP (no browser)")
+            single_results, _ = resolve_via_http(todo, cache)
+            http_results += single_results
+
+        if writer:
+            for rec in http_results:
+                writer.put(rec)
+
+        print(f"Step 2) Fetch CCTP sender/receiver via browser pool (engine={ENGINE})")
+        # RPC / HTTP 已经解析到的不再进浏览器
+        browser_known = known_hashes | {r["query_tx_hash"] for r in http_results}
+        if ENGINE == "async":
+            df_out = build_cctp_df_async(df_hash, known_hashes=browser_known, cache=cache, writer=writer)
+        else:
+            df_out = build_cctp_df(df_hash, known_hashes=browser_known, cache=cache, writer=writer)
+
+        if http_results:
+            df_out = pd.concat([pd.DataFrame(http_results), df_out], ignore_index=True).drop_duplicates()
+
+    resolved = known_hashes | set(df_out["query_tx_hash"].str.lower()) if len(df_out) else set(known_hashes)
+    if shard:
+        path = shard_path(CSV_PATH, *shard)
+        df_out.reindex(columns=OUTPUT_COLUMNS).to_csv(path, index=False)
+        print(f"Shard CSV written to {path} (rows={len(df_out)})")
+        commit_watermark(resolved, shard)
+        return
+
+    if writer:
+        # CSV 和上传都已经在抓取过程中流式完成，这里只需要刷完最后一批
+        print("Step 3) Flush streaming writer (CSV + Dune upload)")
+        writer.close()
+        print(f"CSV streamed to {CSV_PATH} (new={writer.written}, uploaded={writer.uploaded})")
+        if OUTPUT_STORE == "parquet":
+            # 流式已经上传过了，store 这里只补上本次的行
+            print("Step 4) Upsert Parquet store")
+            upsert_store(df_out, df_existing)
+        commit_watermark(resolved)
+        print("All done")
+        return
+
+    write_and_upload(df_out, df_existing)
+    commit_watermark(resolved)
+    print("All done")
+
+
+def merge_shards(count: int):
+    """
+    合并 K 个分片 CSV -> CSV_PATH，去重后统一上传一次，成功后删除分片文件
+    """
+    os.makedirs(os.path.dirname(CSV_PATH), exist_ok=True)
+    if os.path.exists(PENDING_CSV_PATH):
+        print("Step 0) Upload rows left over from the last run")
+        upload_pending()
+
+    print(f"Merge) Combine {count} shard outputs")
+    df_out, paths = read_shards(CSV_PATH, count, OUTPUT_COLUMNS)
+    df_existing = load_existing_mapping() if INCREMENTAL else pd.DataFrame(columns=OUTPUT_COLUMNS)
+    if INCREMENTAL:
+        # 分片各自跑的时候可能看到的是同一份旧 CSV，这里再按已有映射去一次重
+        df_out = df_out[~df_out["query_tx_hash"].str.lower().isin(set(df_existing["query_tx_hash"]))]
+
+    write_and_upload(df_out, df_existing)
+    for p in paths:
+        os.remove(p)
+
+    marks = [shard_path(WATERMARK_PATH, i, count) for i in range(count)]
+    present = [m for m in marks if os.path.exists(m)]
+    if present and len(present) == count:
+        save_watermark(min(read_watermark(m) for m in present))
+    elif present:
+        logging.warning("[shard] only %d/%d shards finished, watermark not advanced", len(present), count)
+    for m in present:
+        os.remove(m)
     print("All done")
 
 
+def run_processes(count: int):
+    """
+    本机起 K 个子进程，各跑一个分片（--shard i/K），全部结束后 merge
+    子进程各写各的 run report：logs/run_report.shard-i-of-K.json
+    Dune 只在这里查一次，子进程读导出的文件（DUNE_HASHES_PATH）
+    """
+    hashes_path = DUNE_HASHES_PATH
+    if not hashes_path:
+        hashes_path = DUNE_HASHES_DUMP_PATH
+        dump_dune_hashes(hashes_path)
+
+    procs = []
+    for i in range(count):
+        env = dict(os.environ, RUN_REPORT_PATH=shard_path(RUN_REPORT_PATH, i, count), DUNE_HASHES_PATH=hashes_path)
+        cmd = [sys.executable, os.path.abspath(__file__), "--shard", f"{i}/{count}"]
+        procs.append(subprocess.Popen(cmd, env=env))
+    logging.info("[shard] started %d shard processes", count)
+
+    failed = [i for i, p in enumerate(procs) if p.wait() != 0]
+    if failed:
+        # 失败分片的 tx 下次增量运行会重新处理，已完成的分片照常合并上传
+        logging.error("[shard] shards %s exited with errors", failed)
+    if hashes_path != DUNE_HASHES_PATH:
+        os.remove(hashes_path)
+    merge_shards(count)
+
+
+def run_daemon():
+    """
+    常驻模式：浏览器池一直开着，每 DAEMON_POLL_SECONDS 拉一次 Dune，新出现的 hash 直接交给池子；
+    结果由 StreamingWriter 追加到 CSV_PATH，并小批量（STREAM_BATCH_ROWS / STREAM_BATCH_SECONDS）插入 Dune 表。
+    收到 SIGTERM / SIGINT 后不再拉新的，等正在抓的结束、刷完最后一批再退出
+    """
+    global INCREMENTAL, DUNE_MAX_AGE_HOURS
+    # 常驻就是增量的（带水位时只拉新转账）；复用的 Dune 结果不能比一个轮询周期更旧
+    INCREMENTAL = True
+    DUNE_MAX_AGE_HOURS = min(DUNE_MAX_AGE_HOURS, DAEMON_POLL_SECONDS / 3600)
+
+    stop = Event()
+
+    def on_signal(signum, frame):
+        logging.info("[daemon] got signal %d, finishing in-flight work", signum)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    os.makedirs(os.path.dirname(CSV_PATH), exist_ok=True)
+    if os.path.exists(PENDING_CSV_PATH):
+        upload_pending()
+    if OUTPUT_STORE == "parquet":
+        logging.warning("[daemon] results are appended to %s, the parquet store is refreshed by batch runs", CSV_PATH)
+
+    known_hashes = set(load_existing_mapping()["query_tx_hash"])
+    cache = ResultCache() if RESULT_CACHE else None
+    writer = StreamingWriter(CSV_PATH, OUTPUT_COLUMNS, upload_fn=insert_rows, pending_path=PENDING_CSV_PATH)
+    writer.start()
+    pool = BrowserPool(cache=cache, writer=writer, collect=False, deadline=None, track=True)
+    # 已交给池子、还没有最终结果的；最终失败的移出这里（不进 known_hashes），之后的轮询会再交一次
+    # （有 cache 时负缓存的 retry_after 过了才会真的再查）
+    inflight: set[str] = set()
+    logging.info("[daemon] started, poll every %.0fs, %d known hashes", DAEMON_POLL_SECONDS, len(known_hashes))
+
+    try:
+        while not stop.is_set():
+            if pool.broken:
+                # 浏览器起不来，常驻下去也只是空转
+                raise RuntimeError("browsers could not be launched, daemon stopping")
+            t_poll = time.time()
+            METRICS.incr("daemon_polls_total")
+            try:
+                df_hash = load_dune_hashes()
+            except Exception as e:
+                # Dune 偶尔失败不退出，下个周期再拉
+                logging.error("[daemon] Dune poll failed: %s", repr(e))
+            else:
+                for tx, ok in pool.settled():
+                    inflight.discard(tx)
+                    if ok:
+                        known_hashes.add(tx)
+                todo = [h for h in pending_hashes(df_hash, known_hashes) if h.lower() not in inflight]
+                inflight.update(h.lower() for h in todo)
+                if todo:
+                    times = block_times(df_hash, DUNE_HASH_COLUMN, DUNE_TIME_COLUMN)
+                    queued = pool.submit(todo, presolve=True, times=times)
+                    METRICS.incr("daemon_new_hashes_total", len(todo))
+                    logging.info("[daemon] %d new hashes, %d queued for browsers", len(todo), queued)
+                if pool.idle():
+                    # 这一轮之前的都处理完了才推进水位（最终失败的把水位压在它们的 block_time 上）
+                    for tx, ok in pool.settled():
+                        inflight.discard(tx)
+                        if ok:
+                            known_hashes.add(tx)
+                    commit_watermark(known_hashes)
+            stop.wait(max(0.0, DAEMON_POLL_SECONDS - (time.time() - t_poll)))
+    finally:
+        pool.close(cancel_retries=True)
+        writer.close()
+        logging.info("[daemon] stopped (written=%d, uploaded=%d)", writer.written, writer.uploaded)
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Dune -> usdc.range.org -> CSV -> Dune table")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--shard", type=parse_shard, help="only process shard i of K (i/K), write a shard CSV")
+    group.add_argument("--merge", type=int, metavar="K", help="merge K shard CSVs into CSV_PATH and upload")
+    group.add_argument("--processes", type=int, metavar="K", help="run K shard processes locally, then merge")
+    group.add_argument("--daemon", action="store_true", help="keep running: poll Dune and resolve new hashes until SIGTERM")
+    group.add_argument(
+        "--dump-hashes", metavar="PATH", help="query Dune once and write the tx_hash list for DUNE_HASHES_PATH"
+    )
+    args = parser.parse_args()
+    setup_logging()
+
+    try:
+        if args.dump_hashes:
+            dump_dune_hashes(args.dump_hashes)
+        elif args.merge:
+            merge_shards(args.merge)
+        elif args.processes and args.processes > 1:
+            run_processes(args.processes)
+        elif args.daemon:
+            run_daemon()
+        else:
+            main(shard=args.shard)
+    finally:
+        write_run_report()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标：各阶段耗时的直方图 + 计数器，运行结束后输出
+  - JSON 报告（RUN_REPORT_PATH）：count / sum / min / max / p50 / p95 / p99 / 分桶
+  - 可选 Prometheus textfile（PROM_TEXTFILE_PATH），给 node_exporter 的 textfile collector 用
+
+用法：
+    from metrics import METRICS
+    with METRICS.timer("goto_seconds"):
+        page.goto(...)
+    METRICS.incr("fetch_retries_total")
+"""
+import os
+import json
+import math
+import time
+import random
+import logging
+from threading import Lock
+from contextlib import contextmanager
+
+RUN_REPORT_PATH = os.getenv("RUN_REPORT_PATH", "logs/run_report.json")
+PROM_TEXTFILE_PATH = os.getenv("PROM_TEXTFILE_PATH", "")
+PROM_PREFIX = "cctp_"
+# 每个直方图最多保留多少个样本算分位数（蓄水池抽样）；count / sum / min / max / 分桶始终是精确值
+HISTOGRAM_MAX_SAMPLES = int(os.getenv("HISTOGRAM_MAX_SAMPLES", "10000"))
+
+# 秒
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+# 次数（重试次数等）
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 10)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """最近秩法，q 取 0~100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[k]
+
+
+class Histogram:
+    """内存有上限（daemon 常驻也不会一直涨）：分位数来自最多 max_samples 个均匀抽样的样本"""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS, max_samples: int = HISTOGRAM_MAX_SAMPLES):
+        self.buckets = buckets
+        self.max_samples = max_samples
+        self.values: list[float] = []
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.bucket_counts = [0] * len(buckets)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.bucket_counts[i] += 1
+        if len(self.values) < self.max_samples:
+            self.values.append(value)
+        else:
+            # Algorithm R：第 count 个样本以 max_samples / count 的概率替换掉一个旧样本
+            j = random.randrange(self.count)
+            if j < self.max_samples:
+                self.values[j] = value
+
+    def summary(self) -> dict:
+        vals = self.values
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": percentile(vals, 50),
+            "p95": percentile(vals, 95),
+            "p99": percentile(vals, 99),
+            "buckets": {str(b): n for b, n in zip(self.buckets, self.bucket_counts)},
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = Lock()
+        self.started_at = time.time()
+        self.histograms: dict[str, Histogram] = {}
+        self.counters: dict[str, float] = {}
+
+    def observe(self, name: str, value: float, buckets: tuple = DEFAULT_BUCKETS):
+        with self.lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram(buckets)
+            hist.observe(value)
+
+    def incr(self, name: str, n: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def report(self) -> dict:
+        with self.lock:
+            return {
+                "started_at": self.started_at,
+                "finished_at": time.time(),
+                "elapsed_seconds": round(time.time() - self.started_at, 3),
+                "counters": dict(self.counters),
+                "histograms": {name: h.summary() for name, h in sorted(self.histograms.items())},
+            }
+
+    def write_report(self, path: str = RUN_REPORT_PATH) -> dict:
+        report = self.report()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+        for name, h in report["histograms"].items():
+            logging.info(
+                "[metrics] %s count=%d sum=%.2f p50=%.3f p95=%.3f p99=%.3f",
+                name, h["count"], h["sum"], h["p50"], h["p95"], h["p99"],
+            )
+        logging.info("[metrics] run report written to %s", path)
+        return report
+
+    def write_prometheus(self, path: str = PROM_TEXTFILE_PATH):
+        report = self.report()
+        lines: list[str] = []
+        for name, value in sorted(report["counters"].items()):
+            metric = PROM_PREFIX + name
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, h in report["histograms"].items():
+            metric = PROM_PREFIX + name
+            lines.append(f"# TYPE {metric} histogram")
+            for le, count in h["buckets"].items():
+                lines.append(f'{metric}_bucket{{le="{le}"}} {count}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {h["count"]}')
+            lines.append(f"{metric}_sum {h['sum']}")
+            lines.append(f"{metric}_count {h['count']}")
+
+        # 先写临时文件再 rename，避免 collector 读到半个文件
+        tmp = path + ".tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+
+METRICS = Metrics()
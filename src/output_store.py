@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Parquet 输出存储（OUTPUT_STORE=parquet，需要 pyarrow）：
+  - 写入时统一规范化一次：hex 值一律小写 0x...，其他值（Solana 签名、Unavailable）原样保留
+  - 列都是 32 字节 hex 时存成 fixed_size_binary(32)，否则存字符串；zstd 压缩
+  - upsert：按 query_tx_hash 合并，新行覆盖旧行
+  - 导出 CSV 时还原成页面 / Dune 表里的格式（hex 大写 0X...，query_tx_hash 小写），和已有数据保持一致
+"""
+from __future__ import annotations
+
+import os
+import re
+import logging
+
+from lazy_imports import lazy_import, available
+from range_api import format_value, UNAVAILABLE
+from metrics import METRICS
+
+pd = lazy_import("pandas")
+# OUTPUT_STORE=csv 时不需要；装了也等到真正读写 parquet 时才加载
+pa = lazy_import("pyarrow") if available("pyarrow") else None
+
+OUTPUT_STORE = os.getenv("OUTPUT_STORE", "csv")                   # csv / parquet
+PARQUET_PATH = os.getenv("PARQUET_PATH", "data/cctp_tx_mapping.parquet")
+CSV_EXPORT = os.getenv("CSV_EXPORT", "1") == "1"                  # parquet 模式下是否仍导出完整 CSV_PATH
+
+COLUMNS = ["query_tx_hash", "sender_address", "receiver_address"]
+
+_HEX_RE = re.compile(r"^0[xX][0-9a-fA-F]+$")
+_HEX32_RE = re.compile(r"^0x[0-9a-f]{64}$")
+
+
+def normalize_value(value) -> str:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return UNAVAILABLE
+    value = str(value).strip()
+    if _HEX_RE.match(value):
+        return value.lower()
+    return value or UNAVAILABLE
+
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    out = pd.DataFrame({c: [normalize_value(v) for v in df[c]] for c in COLUMNS})
+    return out.drop_duplicates(subset=["query_tx_hash"], keep="last")
+
+
+def export_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """规范化后的数据 -> CSV / Dune 表的显示格式"""
+    return pd.DataFrame({
+        "query_tx_hash": df["query_tx_hash"].str.lower(),
+        "sender_address": [format_value(v) for v in df["sender_address"]],
+        "receiver_address": [format_value(v) for v in df["receiver_address"]],
+    })
+
+
+def _encode(values: pd.Series):
+    if len(values) and values.map(lambda v: bool(_HEX32_RE.match(v))).all():
+        return pa.array([bytes.fromhex(v[2:]) for v in values], type=pa.binary(32))
+    return pa.array(values.tolist(), type=pa.string())
+
+
+def _decode(column) -> list[str]:
+    if pa.types.is_fixed_size_binary(column.type):
+        return ["0x" + v.hex() for v in column.to_pylist()]
+    return column.to_pylist()
+
+
+class ParquetStore:
+    """
+    store = ParquetStore()
+    df = store.load()                  # 规范化后的全部映射
+    total, new = store.upsert(df_out)  # 按 query_tx_hash 合并写回
+    """
+
+    def __init__(self, path: str = PARQUET_PATH):
+        if pa is None:
+            raise RuntimeError("OUTPUT_STORE=parquet needs pyarrow: pip install pyarrow")
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self, columns: list[str] | None = None) -> pd.DataFrame:
+        columns = columns or COLUMNS
+        if not self.exists():
+            return pd.DataFrame(columns=columns)
+        import pyarrow.parquet as pq
+        table = pq.read_table(self.path, columns=columns)
+        return pd.DataFrame({c: _decode(table.column(c)) for c in columns})
+
+    def known_hashes(self) -> set[str]:
+        return set(self.load(["query_tx_hash"])["query_tx_hash"])
+
+    def upsert(self, df_new: pd.DataFrame) -> tuple[int, int]:
+        """
+        返回 (合并后的总行数, 新增的行数)；先写临时文件再替换，写一半中断不会损坏已有数据
+        """
+        with METRICS.timer("store_upsert_seconds"):
+            old = self.load()
+            new = normalize_frame(df_new) if len(df_new) else pd.DataFrame(columns=COLUMNS)
+            added = len(set(new["query_tx_hash"]) - set(old["query_tx_hash"]))
+
+            merged = pd.concat([old, new], ignore_index=True)
+            merged = merged.drop_duplicates(subset=["query_tx_hash"], keep="last").sort_values("query_tx_hash")
+            table = pa.table({c: _encode(merged[c]) for c in COLUMNS})
+
+            import pyarrow.parquet as pq
+            tmp = self.path + ".tmp"
+            pq.write_table(table, tmp, compression="zstd")
+            os.replace(tmp, self.path)
+
+        logging.info("[store] %s upserted: total=%d, new=%d", self.path, len(merged), added)
+        return len(merged), added
+
+    def seed(self, frames: list[pd.DataFrame]) -> int:
+        """
+        store 还不存在时（第一次切到 parquet）用已有的映射建库，返回导入的行数；已存在时什么也不做
+        """
+        if self.exists():
+            return 0
+        frames = [f.reindex(columns=COLUMNS) for f in frames if len(f)]
+        df = pd.concat(frames, ignore_index=True).dropna(subset=["query_tx_hash"]) if frames else None
+        if df is None or df.empty:
+            return 0
+        df["query_tx_hash"] = df["query_tx_hash"].astype(str).str.strip().str.lower()
+        total, _ = self.upsert(df)
+        logging.info("[store] seeded %s with %d existing rows", self.path, total)
+        return total
+
+    def export_csv(self, csv_path: str):
+        export_frame(self.load()).to_csv(csv_path, index=False)
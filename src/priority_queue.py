@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+浏览器任务队列的优先级调度 + 整轮运行的截止时间：
+  - PriorityTaskQueue 替代 FIFO Queue（同样的 put / get / task_done / join / maxsize 语义），出队顺序：
+      尝试次数少的 -> 以前没失败过的（cache 里的失败次数少的）-> block_time 新的 -> 先入队的
+    跑到一半被 CI 时限打断时，完成的总是最新的那批转账，而不是 Dune 返回顺序里靠前的
+  - RUN_DEADLINE：从进程启动算起的运行预算（RUN_DEADLINE_SECONDS），留出 DEADLINE_RESERVE_SECONDS 写结果 / 上传；
+    到了 drain 时刻之后，队列丢掉还没开始的任务，重试到期时间晚于 drain 时刻的不再排队，
+    正在抓的那几笔做完就正常收尾。被丢掉的 tx 不写 cache，下次运行重新入队
+"""
+import os
+import time
+import heapq
+import logging
+import itertools
+from queue import Queue
+from typing import Callable
+
+from lazy_imports import lazy_import
+from metrics import METRICS
+
+pd = lazy_import("pandas")
+
+RUN_DEADLINE_SECONDS = float(os.getenv("RUN_DEADLINE_SECONDS", "0"))        # 整轮运行预算（秒），0 = 不限
+DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", "300"))  # 留给收尾（写 CSV、上传）的时间
+
+
+class RunDeadline:
+    """
+    RUN_DEADLINE.draining()      # 到了该收尾的时候：不再开始新任务
+    RUN_DEADLINE.fits(delay)     # delay 秒后开始的重试还赶得上吗
+    """
+
+    def __init__(self, budget: float = RUN_DEADLINE_SECONDS, reserve: float = DEADLINE_RESERVE_SECONDS):
+        self.started = time.time()
+        self.budget = budget
+        self.reserve = min(reserve, budget / 2) if budget > 0 else 0.0
+        self.hit = False          # 这一轮是否因为截止时间丢过任务
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    @property
+    def drain_at(self) -> float:
+        return self.started + self.budget - self.reserve if self.enabled else float("inf")
+
+    def remaining(self) -> float:
+        return self.drain_at - time.time()
+
+    def fits(self, delay: float) -> bool:
+        return time.time() + delay < self.drain_at
+
+    def draining(self) -> bool:
+        if not self.enabled or time.time() < self.drain_at:
+            return False
+        if not self.hit:
+            self.hit = True
+            logging.warning(
+                "[deadline] %.0fs run budget reached (keeping %.0fs to write results), draining the queue",
+                self.budget - self.reserve, self.reserve,
+            )
+        return True
+
+
+RUN_DEADLINE = RunDeadline()
+
+
+def block_times(df, hash_column: str, time_column: str) -> dict[str, float]:
+    """Dune 结果里的 block_time -> {小写 tx_hash: unix 秒}；没有时间列时返回空 dict"""
+    if time_column not in df.columns:
+        return {}
+    ts = pd.to_datetime(df[time_column], utc=True, errors="coerce")
+    out = {}
+    for h, t in zip(df[hash_column], ts):
+        if not pd.isna(t):
+            out[str(h).strip().lower()] = t.timestamp()
+    return out
+
+
+def priority_key(tx: str, block_times: dict[str, float], failures: dict[str, int], attempt: int = 1) -> tuple:
+    """越小越先：(尝试次数, 历史失败次数, -block_time)；没有 block_time 的排在有的后面"""
+    key = tx.lower()
+    return (attempt, failures.get(key, 0), -block_times.get(key, float("-inf")))
+
+
+class PriorityTaskQueue(Queue):
+    """
+    q = PriorityTaskQueue(maxsize, deadline=RUN_DEADLINE)
+    q.attempts = scheduler.attempt      # 当前第几次尝试（重试回到队列时排在新任务后面）
+    q.note(block_times, failures)       # 入队前登记优先级信息（没登记的排在有 block_time 的后面）
+    q.forget(tx)                        # 这笔最终结束后清掉登记信息
+    q.drain()                           # 退出时丢掉还没开始的任务
+    q.close()                           # 浏览器起不来：drain 之后不再接受新任务（worker 取到的也直接跳过）
+    哨兵 None 永远排在最后
+    """
+
+    def __init__(self, maxsize: int = 0, deadline: RunDeadline | None = None):
+        super().__init__(maxsize)
+        self.deadline = deadline
+        self.attempts: Callable[[str], int] = lambda tx: 1
+        self.block_time: dict[str, float] = {}
+        self.failures: dict[str, int] = {}
+        self.dropped = 0
+        self.closed = False
+
+    # Queue 的存储钩子（在 Queue 自己的锁里调用）
+    def _init(self, maxsize):
+        self.heap: list[tuple[tuple, str | None]] = []
+        self.seq = itertools.count()
+
+    def _qsize(self):
+        return len(self.heap)
+
+    def _put(self, entry):
+        heapq.heappush(self.heap, entry)
+
+    def _get(self):
+        return heapq.heappop(self.heap)
+
+    # 优先级信息
+    def note(self, block_times: dict[str, float] | None = None, failures: dict[str, int] | None = None):
+        self.block_time.update(block_times or {})
+        self.failures.update(failures or {})
+
+    def forget(self, tx: str):
+        key = tx.lower()
+        self.block_time.pop(key, None)
+        self.failures.pop(key, None)
+
+    def priority(self, tx: str | None) -> tuple:
+        if tx is None:
+            return (float("inf"), 0, 0.0, next(self.seq))
+        return priority_key(tx, self.block_time, self.failures, self.attempts(tx)) + (next(self.seq),)
+
+    def sort(self, hashes: list[str]) -> list[str]:
+        """入队前先排好序：队列有上限，等着入队的那部分也要先放新的"""
+        return sorted(hashes, key=self.priority)
+
+    def _drop(self) -> bool:
+        return self.deadline is not None and self.deadline.draining()
+
+    def put(self, item, block=True, timeout=None):
+        # 优先级在 Queue 的锁外面算（attempts 会拿 scheduler 的锁，避免两把锁交叉）
+        if item is not None and self.closed:
+            self.dropped += 1
+            return
+        if item is not None and self._drop():
+            self.dropped += 1
+            METRICS.incr("deadline_dropped_total")
+            return
+        super().put((self.priority(item), item), block, timeout)
+
+    def drain(self) -> list[str]:
+        """
+        取走所有还没开始的任务（哨兵留着），并替它们 task_done；返回被取走的 tx_hash
+        在 Queue 自己的锁里直接改计数：task_done 会再拿同一把锁
+        """
+        with self.mutex:
+            dropped = [item for _, item in self.heap if item is not None]
+            self.heap = [entry for entry in self.heap if entry[1] is None]
+            heapq.heapify(self.heap)
+            self.unfinished_tasks -= len(dropped)
+            if self.unfinished_tasks <= 0:
+                self.all_tasks_done.notify_all()
+            self.not_full.notify_all()
+        return dropped
+
+    def close(self) -> list[str]:
+        self.closed = True
+        dropped = self.drain()
+        self.dropped += len(dropped)
+        return dropped
+
+    def get(self, block=True, timeout=None):
+        while True:
+            _, item = super().get(block, timeout)
+            if item is None or not self._drop():
+                return item
+            self.dropped += 1
+            METRICS.incr("deadline_dropped_total")
+            self.task_done()
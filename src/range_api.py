@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+usdc.range.org 的 HTTP 解析路径（不开浏览器）：
+  - 直接请求页面自己用的数据（JSON 接口，或 HTML 里内嵌的 SSR payload）
+  - 用一个带连接池的 HTTP/2 httpx.Client 并发查询
+  - 解析失败的 tx 交回给 Playwright 兜底
+  - 批量路径：按 Dune 的时间窗翻交易列表（一页多笔），在本地和 hash 集合 join，剩下的再逐笔查
+"""
+import os
+import re
+import json
+import logging
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_imports import lazy_import
+
+httpx = lazy_import("httpx")
+
+from metrics import METRICS
+from rate_limiter import RATE_LIMITER, parse_retry_after
+
+# -----------------------------
+# Config
+# -----------------------------
+RANGE_BASE_URL = os.getenv("RANGE_BASE_URL", "https://usdc.range.org").rstrip("/")
+# 数据地址模板：默认就是交易页本身（解析其中的 SSR payload），抓到 XHR 接口后可以直接换成接口地址
+RANGE_API_URL = os.getenv("RANGE_API_URL", "{base}/transactions?s={tx_hash}")
+
+# payload 里 sender / receiver 可能使用的字段名（按优先级）；只认明确是 tx hash 的字段，
+# 泛泛的 sender / receiver / *Address 在别的结构里多半是钱包地址，会解析出错的值
+RANGE_SENDER_KEYS = tuple(
+    os.getenv("RANGE_SENDER_KEYS", "sourceTxHash,source_tx_hash").split(",")
+)
+RANGE_RECEIVER_KEYS = tuple(
+    os.getenv("RANGE_RECEIVER_KEYS", "destinationTxHash,destination_tx_hash").split(",")
+)
+
+# 交易列表接口（批量路径）：一页返回多笔交易，page 从 1 开始；start / end 为 ISO 时间，可以为空
+# （填进模板前会做 URL 编码：+00:00 里的 + 不编码会被服务端解成空格）
+RANGE_LISTING_URL = os.getenv(
+    "RANGE_LISTING_URL", "{base}/api/transactions?page={page}&limit={limit}&from={start}&to={end}"
+)
+LISTING_PAGE_SIZE = int(os.getenv("LISTING_PAGE_SIZE", "100"))
+LISTING_MAX_PAGES = int(os.getenv("LISTING_MAX_PAGES", "500"))   # 防止时间窗过大时无限翻页
+
+HTTP_CONCURRENCY = int(os.getenv("HTTP_CONCURRENCY", "32"))   # HTTP 解析的并发数（= 连接池大小）
+
+# 页面上缺失的字段显示为 Unavailable，这里保持一致
+UNAVAILABLE = "Unavailable"
+
+_HEX_RE = re.compile(r"^(0x)?[0-9a-fA-F]+$")
+_JSON_SCRIPT_RE = re.compile(
+    r"<script[^>]*type=\"application/json\"[^>]*>(.*?)</script>",
+    re.S | re.I,
+)
+
+
+class RangeApiError(Exception):
+    """HTTP 路径解析失败（交给浏览器兜底）"""
+    pass
+
+
+def _check_throttle(resp):
+    """429（或带 Retry-After 的 503）：通知全局限速器暂停，浏览器那边也一起停"""
+    retry_after = parse_retry_after(resp.headers.get("retry-after"))
+    if resp.status_code == 429 or (resp.status_code == 503 and retry_after is not None):
+        RATE_LIMITER.throttle(retry_after)
+
+
+# -----------------------------
+# 解析
+# -----------------------------
+def format_value(value) -> str:
+    """
+    和页面上显示的格式对齐：hex 值全大写（0X...），空值显示 Unavailable，其他（如 Solana 签名）原样
+    """
+    if value is None:
+        return UNAVAILABLE
+    value = str(value).strip()
+    if not value:
+        return UNAVAILABLE
+    if _HEX_RE.match(value):
+        return value.upper()
+    return value
+
+
+def _pick(obj: dict, keys: tuple) -> tuple[bool, object]:
+    for k in keys:
+        if k in obj:
+            return True, obj[k]
+    return False, None
+
+
+def find_sender_receiver(obj) -> tuple[object, object] | None:
+    """
+    在任意嵌套的 JSON 里找第一个同时带有 sender 字段和 receiver 字段的 dict
+    """
+    if isinstance(obj, dict):
+        has_s, sender = _pick(obj, RANGE_SENDER_KEYS)
+        has_r, receiver = _pick(obj, RANGE_RECEIVER_KEYS)
+        if has_s and has_r:
+            return sender, receiver
+        children = obj.values()
+    elif isinstance(obj, list):
+        children = obj
+    else:
+        return None
+
+    for child in children:
+        found = find_sender_receiver(child)
+        if found is not None:
+            return found
+    return None
+
+
+def find_all_sender_receiver(obj) -> list[tuple[object, object]]:
+    """
+    列表页用：找出所有同时带 sender / receiver 字段的 dict（每笔交易一个）
+    """
+    if isinstance(obj, dict):
+        has_s, sender = _pick(obj, RANGE_SENDER_KEYS)
+        has_r, receiver = _pick(obj, RANGE_RECEIVER_KEYS)
+        if has_s and has_r:
+            return [(sender, receiver)]
+        children = obj.values()
+    elif isinstance(obj, list):
+        children = obj
+    else:
+        return []
+
+    found = []
+    for child in children:
+        found.extend(find_all_sender_receiver(child))
+    return found
+
+
+def extract_payloads(text: str, content_type: str = "") -> list:
+    """
+    JSON 响应直接解析；HTML 响应取出所有 <script type="application/json">（如 __NEXT_DATA__）
+    """
+    if "json" in content_type:
+        return [json.loads(text)]
+
+    payloads = []
+    for raw in _JSON_SCRIPT_RE.findall(text):
+        try:
+            payloads.append(json.loads(raw))
+        except ValueError:
+            continue
+    return payloads
+
+
+def parse_sender_receiver(text: str, content_type: str = "") -> tuple[str, str]:
+    for payload in extract_payloads(text, content_type):
+        found = find_sender_receiver(payload)
+        if found is not None:
+            sender, receiver = found
+            return format_value(sender), format_value(receiver)
+    raise RangeApiError("no sender/receiver in payload")
+
+
+# -----------------------------
+# Client
+# -----------------------------
+class RangeApiClient:
+    """
+    线程安全，内部一个 HTTP/2 连接池；用法：
+
+        with RangeApiClient(proxy_url) as client:
+            records, failed = client.resolve_many(hashes)
+    """
+
+    def __init__(
+        self,
+        proxy_url: str | None = None,
+        timeout: float = 15.0,
+        concurrency: int = HTTP_CONCURRENCY,
+        base_url: str = RANGE_BASE_URL,
+        api_url: str = RANGE_API_URL,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_url = api_url
+        self.concurrency = concurrency
+        self.client = httpx.Client(
+            http2=True,
+            timeout=timeout,
+            proxy=proxy_url,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            headers={"Accept": "application/json, text/html;q=0.9"},
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.client.close()
+
+    def url_for(self, tx_hash: str) -> str:
+        return self.api_url.format(base=self.base_url, tx_hash=tx_hash)
+
+    def resolve(self, tx_hash: str) -> dict:
+        try:
+            RATE_LIMITER.acquire()
+            with METRICS.timer("http_resolve_seconds"):
+                resp = self.client.get(self.url_for(tx_hash))
+            _check_throttle(resp)
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            raise RangeApiError(f"request failed for tx={tx_hash}: {e}") from e
+
+        sender, receiver = parse_sender_receiver(resp.text, resp.headers.get("content-type", ""))
+        return {
+            "query_tx_hash": tx_hash.lower(),
+            "sender_address": sender,
+            "receiver_address": receiver,
+        }
+
+    def _resolve_or_none(self, tx_hash: str) -> dict | None:
+        try:
+            return self.resolve(tx_hash)
+        except Exception as e:
+            logging.info("[HTTP] tx=%s not resolved via HTTP, fallback to browser: %s", tx_hash, repr(e))
+            return None
+
+    def resolve_many(self, hashes: list[str]) -> tuple[list[dict], list[str]]:
+        """
+        返回 (解析成功的记录, 需要浏览器兜底的 tx_hash)
+        """
+        records: list[dict] = []
+        failed: list[str] = []
+        if not hashes:
+            return records, failed
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="http-resolver") as pool:
+            for tx, rec in zip(hashes, pool.map(self._resolve_or_none, hashes)):
+                if rec is None:
+                    failed.append(tx)
+                else:
+                    records.append(rec)
+
+        return records, failed
+
+    # ---------- 批量：交易列表 ----------
+    def listing_page(
+        self,
+        page: int,
+        start: str = "",
+        end: str = "",
+        page_size: int = LISTING_PAGE_SIZE,
+        listing_url: str = RANGE_LISTING_URL,
+    ) -> list[tuple[str, str]]:
+        """
+        取列表的第 page 页，返回 [(sender, receiver), ...]（已格式化成页面上的样子）
+        """
+        url = listing_url.format(
+            base=self.base_url, page=page, limit=page_size, start=quote(start, safe=""), end=quote(end, safe="")
+        )
+        try:
+            RATE_LIMITER.acquire()
+            with METRICS.timer("listing_page_seconds"):
+                resp = self.client.get(url)
+            _check_throttle(resp)
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            raise RangeApiError(f"listing page {page} failed: {e}") from e
+
+        rows = []
+        for payload in extract_payloads(resp.text, resp.headers.get("content-type", "")):
+            rows.extend(find_all_sender_receiver(payload))
+        return [(format_value(s), format_value(r)) for s, r in rows]
+
+    def resolve_listing(
+        self,
+        hashes: list[str],
+        start: str = "",
+        end: str = "",
+        page_size: int = LISTING_PAGE_SIZE,
+        max_pages: int = LISTING_MAX_PAGES,
+    ) -> tuple[list[dict], list[str]]:
+        """
+        翻 [start, end] 时间窗内的交易列表，按 receiver（= 目标链 tx hash = query_tx_hash）和 hashes join；
+        每批并发取 concurrency 页，出现不满一页 / 全部找到 / 翻到 max_pages / 某页失败时停止
+        返回 (命中的记录, 没找到的 tx_hash)
+        """
+        wanted = {h.lower(): h for h in hashes}
+        found: dict[str, dict] = {}
+        if not wanted:
+            return [], []
+
+        page, fetched = 1, 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="http-listing") as pool:
+            while page <= max_pages and len(found) < len(wanted):
+                batch = list(range(page, min(page + self.concurrency, max_pages + 1)))
+                futures = [pool.submit(self.listing_page, p, start, end, page_size) for p in batch]
+                last = False
+                for p, fut in zip(batch, futures):
+                    try:
+                        rows = fut.result()
+                    except Exception as e:
+                        logging.warning("[HTTP-listing] stop at page %d: %s", p, repr(e))
+                        last = True
+                        continue
+                    fetched += 1
+                    METRICS.incr("listing_pages_total")
+                    for sender, receiver in rows:
+                        key = receiver.lower()
+                        if key in wanted and key not in found:
+                            found[key] = {
+                                "query_tx_hash": key,
+                                "sender_address": sender,
+                                "receiver_address": receiver,
+                            }
+                    if len(rows) < page_size:
+                        last = True
+                if last:
+                    break
+                page += len(batch)
+
+        leftover = [h for k, h in wanted.items() if k not in found]
+        logging.info(
+            "[HTTP-listing] pages=%d, matched=%d, leftover=%d", fetched, len(found), len(leftover)
+        )
+        return list(found.values()), leftover
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+全进程共用的站点请求限速（浏览器导航 + HTTP 解析都要先拿令牌）：
+  - 令牌桶：速率 RATE_LIMIT_RPS（0 = 不限速），突发 RATE_LIMIT_BURST
+  - 任何一个 worker 遇到限流（429 / 带 Retry-After 的 503 / 验证页）就全局暂停：
+    有 Retry-After 按它，没有按 RATE_LIMIT_PAUSE；同时速率乘以 RATE_LIMIT_BACKOFF（一次限流只降一次）
+  - 之后每 RATE_LIMIT_WINDOW 秒没再被限流，速率加 RATE_LIMIT_STEP，回到配置值为止
+    （乘性减、缓慢加性增：稳定在站点能接受的最高速率附近，而不是在高低之间来回跳）
+"""
+import os
+import time
+import asyncio
+import logging
+from threading import Lock
+from email.utils import parsedate_to_datetime
+
+from metrics import METRICS
+
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "0"))              # 每秒请求数上限，0 = 不限速（限流暂停照样生效）
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_MIN_RPS = float(os.getenv("RATE_LIMIT_MIN_RPS", "0.2"))
+RATE_LIMIT_BACKOFF = float(os.getenv("RATE_LIMIT_BACKOFF", "0.7"))
+RATE_LIMIT_STEP = float(os.getenv("RATE_LIMIT_STEP", "0.2"))
+RATE_LIMIT_WINDOW = float(os.getenv("RATE_LIMIT_WINDOW", "60"))
+RATE_LIMIT_PAUSE = float(os.getenv("RATE_LIMIT_PAUSE", "30"))          # 没有 Retry-After 时暂停多久
+RATE_LIMIT_MAX_PAUSE = float(os.getenv("RATE_LIMIT_MAX_PAUSE", "600"))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After 可以是秒数，也可以是 HTTP 日期"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    RATE_LIMITER.acquire()                # 每次请求站点前（async 里用 await acquire_async()）
+    RATE_LIMITER.throttle(retry_after)    # 看到限流响应 / 验证页
+    """
+
+    def __init__(
+        self,
+        rate: float = RATE_LIMIT_RPS,
+        burst: float = RATE_LIMIT_BURST,
+        min_rate: float = RATE_LIMIT_MIN_RPS,
+        backoff: float = RATE_LIMIT_BACKOFF,
+        step: float = RATE_LIMIT_STEP,
+        window: float = RATE_LIMIT_WINDOW,
+        pause: float = RATE_LIMIT_PAUSE,
+    ):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.min_rate = min(min_rate, rate) if rate > 0 else 0.0
+        self.backoff = backoff
+        self.step = step
+        self.window = window
+        self.pause = pause
+
+        self.lock = Lock()
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_change = self.updated
+
+    def reserve(self) -> float:
+        """拿到令牌返回 0；否则返回还要等多久（没有扣令牌，等完再来）"""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.rate <= 0:
+                return 0.0
+
+            if self.rate < self.max_rate and now - self.last_change >= self.window:
+                self.rate = min(self.max_rate, self.rate + self.step)
+                self.last_change = now
+                logging.info("[rate] no throttling for %.0fs, rate -> %.2f/s", self.window, self.rate)
+
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        t0 = time.perf_counter()
+        while (wait := self.reserve()) > 0:
+            time.sleep(wait)
+        METRICS.observe("rate_limit_wait_seconds", time.perf_counter() - t0)
+
+    async def acquire_async(self):
+        t0 = time.perf_counter()
+        while (wait := self.reserve()) > 0:
+            await asyncio.sleep(wait)
+        METRICS.observe("rate_limit_wait_seconds", time.perf_counter() - t0)
+
+    def throttle(self, retry_after: float | None = None):
+        pause = min(retry_after if retry_after is not None else self.pause, RATE_LIMIT_MAX_PAUSE)
+        with self.lock:
+            now = time.monotonic()
+            METRICS.incr("throttled_total")
+            if now + pause <= self.paused_until:
+                # 同一次限流被多个 worker 同时看到，只算一次
+                return
+            already_paused = now < self.paused_until
+            self.paused_until = now + pause
+            # 暂停结束时桶是空的，从那一刻开始重新攒令牌
+            self.tokens = 0.0
+            self.updated = self.paused_until
+            if self.rate > 0 and not already_paused:
+                self.rate = max(self.min_rate, self.rate * self.backoff)
+                self.last_change = now
+            METRICS.incr("rate_limit_pauses_total")
+        logging.warning("[rate] throttled by the site, pausing all requests for %.0fs (rate %.2f/s)", pause, self.rate)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "rate": round(self.rate, 3),
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 1),
+            }
+
+
+RATE_LIMITER = RateLimiter()
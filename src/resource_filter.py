@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+抓取页面上的资源过滤（page.route）：
+  - 按资源类型拦截（图片 / 字体 / CSS / 媒体）
+  - 按域名拦截（统计、埋点），或只放行允许列表里的域名
+  - 统计放行 / 拦截的请求数和响应字节数，方便按 tx 对比省下的流量
+"""
+import os
+import logging
+from threading import Lock
+from urllib.parse import urlparse
+
+
+def _csv_env(name: str, default: str) -> tuple[str, ...]:
+    return tuple(x.strip().lower() for x in os.getenv(name, default).split(",") if x.strip())
+
+
+RESOURCE_FILTER = os.getenv("RESOURCE_FILTER", "1") == "1"
+BLOCK_RESOURCE_TYPES = _csv_env("BLOCK_RESOURCE_TYPES", "image,media,font,stylesheet")
+# 设置后只放行这些域名（及其子域名），其他一律拦截
+ALLOWED_DOMAINS = _csv_env("ALLOWED_DOMAINS", "")
+BLOCKED_DOMAINS = _csv_env(
+    "BLOCKED_DOMAINS",
+    "google-analytics.com,googletagmanager.com,doubleclick.net,segment.io,segment.com,"
+    "mixpanel.com,hotjar.com,amplitude.com,intercom.io,sentry.io,clarity.ms",
+)
+
+
+def _domain_match(host: str, domains: tuple[str, ...]) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+class ResourceFilter:
+    """
+    一个 page 一个实例：
+
+        flt = ResourceFilter()
+        flt.install(page)            # sync page
+        await flt.install_async(page)  # async page
+        snap = flt.snapshot(); ...; flt.delta(snap)
+    """
+
+    def __init__(
+        self,
+        block_types: tuple[str, ...] = BLOCK_RESOURCE_TYPES,
+        allowed_domains: tuple[str, ...] = ALLOWED_DOMAINS,
+        blocked_domains: tuple[str, ...] = BLOCKED_DOMAINS,
+    ):
+        self.block_types = set(block_types)
+        self.allowed_domains = allowed_domains
+        self.blocked_domains = blocked_domains
+        self.lock = Lock()
+        self.stats = {"allowed": 0, "blocked": 0, "bytes": 0}
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.block_types:
+            return True
+        host = (urlparse(url).hostname or "").lower()
+        if not host:
+            return False
+        if self.allowed_domains and not _domain_match(host, self.allowed_domains):
+            return True
+        return _domain_match(host, self.blocked_domains)
+
+    def _count(self, key: str, n: int = 1):
+        with self.lock:
+            self.stats[key] += n
+
+    def _on_response(self, response):
+        # content-length 没有的（chunked）不计，所以字节数是下限
+        try:
+            self._count("bytes", int(response.headers.get("content-length", 0)))
+        except ValueError:
+            pass
+
+    def _handle(self, route):
+        req = route.request
+        if self.should_block(req.resource_type, req.url):
+            self._count("blocked")
+            route.abort()
+        else:
+            self._count("allowed")
+            route.fallback()
+
+    async def _handle_async(self, route):
+        req = route.request
+        if self.should_block(req.resource_type, req.url):
+            self._count("blocked")
+            await route.abort()
+        else:
+            self._count("allowed")
+            await route.fallback()
+
+    def install(self, page):
+        page.route("**/*", self._handle)
+        page.on("response", self._on_response)
+        logging.debug("resource filter installed: block_types=%s", sorted(self.block_types))
+
+    async def install_async(self, page):
+        await page.route("**/*", self._handle_async)
+        page.on("response", self._on_response)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+    def delta(self, snap: dict) -> dict:
+        now = self.snapshot()
+        return {k: now[k] - snap.get(k, 0) for k in now}
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+按 tx_hash 存的本地结果缓存（SQLite，WAL 模式）：
+  - worker 每拿到一条结果就写入（status=ok），中途崩溃也不丢已完成的部分
+  - 失败 / 还没被索引的 tx 写负缓存（status=fail），在 retry_after 之前不会再查
+  - 负缓存的 TTL 随失败次数指数增长，上限 CACHE_NEGATIVE_TTL_MAX
+"""
+import os
+import time
+import sqlite3
+import logging
+from threading import Lock
+
+RESULT_CACHE = os.getenv("RESULT_CACHE", "1") == "1"
+CACHE_PATH = os.getenv("CACHE_PATH", "data/cctp_cache.sqlite")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "0"))                              # 正缓存有效期（秒），0 = 永久
+CACHE_NEGATIVE_TTL = float(os.getenv("CACHE_NEGATIVE_TTL", "3600"))         # 第一次失败后多久再试（秒）
+CACHE_NEGATIVE_TTL_MAX = float(os.getenv("CACHE_NEGATIVE_TTL_MAX", "86400"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tx_cache (
+    tx_hash          TEXT PRIMARY KEY,
+    status           TEXT NOT NULL,
+    sender_address   TEXT,
+    receiver_address TEXT,
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    error            TEXT,
+    updated_at       REAL NOT NULL,
+    retry_after      REAL
+)
+"""
+
+_LOOKUP_CHUNK = 500
+
+
+class ResultCache:
+    """
+    线程安全（一个连接 + 锁），worker 线程直接共用一个实例
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = Lock()
+        # --processes 时多个进程共用同一个库，写锁最多等 30s
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(_SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def lookup(self, hashes: list[str]) -> tuple[list[dict], set[str]]:
+        """
+        返回 (命中的结果, 负缓存未过期需要跳过的 tx_hash)；tx_hash 都是小写
+        """
+        now = time.time()
+        hits: list[dict] = []
+        skip: set[str] = set()
+        keys = list({h.lower() for h in hashes})
+
+        with self.lock:
+            for i in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[i:i + _LOOKUP_CHUNK]
+                rows = self.conn.execute(
+                    "SELECT tx_hash, status, sender_address, receiver_address, updated_at, retry_after "
+                    f"FROM tx_cache WHERE tx_hash IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for tx, status, sender, receiver, updated_at, retry_after in rows:
+                    if status == "ok":
+                        if CACHE_TTL <= 0 or now - updated_at < CACHE_TTL:
+                            hits.append({
+                                "query_tx_hash": tx,
+                                "sender_address": sender,
+                                "receiver_address": receiver,
+                            })
+                    elif retry_after and retry_after > now:
+                        skip.add(tx)
+
+        logging.info("[cache] lookup=%d, hits=%d, negative=%d", len(keys), len(hits), len(skip))
+        return hits, skip
+
+    def failures(self, hashes: list[str]) -> dict[str, int]:
+        """以前失败过（负缓存已过期、这次会重新入队）的 tx_hash -> 失败次数，给任务队列排优先级用"""
+        out: dict[str, int] = {}
+        keys = list({h.lower() for h in hashes})
+        with self.lock:
+            for i in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[i:i + _LOOKUP_CHUNK]
+                rows = self.conn.execute(
+                    "SELECT tx_hash, attempts FROM tx_cache "
+                    f"WHERE status = 'fail' AND tx_hash IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                out.update(rows)
+        return out
+
+    def put_ok(self, rec: dict):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO tx_cache (tx_hash, status, sender_address, receiver_address, attempts, updated_at) "
+                "VALUES (?, 'ok', ?, ?, 0, ?) "
+                "ON CONFLICT(tx_hash) DO UPDATE SET status='ok', sender_address=excluded.sender_address, "
+                "receiver_address=excluded.receiver_address, error=NULL, updated_at=excluded.updated_at, "
+                "retry_after=NULL",
+                (rec["query_tx_hash"].lower(), rec["sender_address"], rec["receiver_address"], time.time()),
+            )
+
+    def put_fail(self, tx_hash: str, error: str = ""):
+        now = time.time()
+        tx = tx_hash.lower()
+        with self.lock:
+            row = self.conn.execute("SELECT status, attempts FROM tx_cache WHERE tx_hash = ?", (tx,)).fetchone()
+            if row and row[0] == "ok":
+                # 已经有结果的不用负缓存覆盖
+                return
+            attempts = (row[1] if row else 0) + 1
+            ttl = min(CACHE_NEGATIVE_TTL * 2 ** (attempts - 1), CACHE_NEGATIVE_TTL_MAX)
+            self.conn.execute(
+                "INSERT INTO tx_cache (tx_hash, status, attempts, error, updated_at, retry_after) "
+                "VALUES (?, 'fail', ?, ?, ?, ?) "
+                "ON CONFLICT(tx_hash) DO UPDATE SET status='fail', attempts=excluded.attempts, "
+                "error=excluded.error, updated_at=excluded.updated_at, retry_after=excluded.retry_after",
+                (tx, attempts, error[:500], now, now + ttl),
+            )
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+失败分类 + 延迟重试队列（线程引擎用）：
+  - 抓取失败按原因分成 timeout / proxy / throttled / not_indexed / not_found / layout，每类有自己的重试次数和退避
+  - worker 不再原地 sleep 重试：失败的 tx 交给 RetryScheduler，到期后放回任务队列末尾，worker 立刻去抓下一笔
+  - not_found 是永久结果，只记一次（写负缓存），不重试
+  - layout（页面渲染了但 selector / 文本锚点都对不上）多半是页面结构变了，但也可能只是渲染慢：默认只再试一次，之后直接报出来
+  - 有运行截止时间（priority_queue.RUN_DEADLINE）时，到期时间赶不上的重试不再排队（不写 cache，下次运行再查）
+
+队列计数：重排的 tx 不调用 task_done（它的名额一直占着），到期放回队列后由 scheduler 补一个 task_done，
+所以 task_queue.join() 会一直等到所有重试都结束。
+"""
+import os
+import time
+import heapq
+import logging
+from threading import Thread, Condition
+from queue import Queue
+
+from metrics import METRICS
+from priority_queue import RunDeadline
+
+
+class FetchError(Exception):
+    """For retries. kind 决定重试策略"""
+    kind = "timeout"
+
+
+class FetchTimeout(FetchError):
+    """导航超时、网络错误、5xx"""
+    kind = "timeout"
+
+
+class ProxyFailure(FetchError):
+    """代理连不上 / 隧道失败 / 407"""
+    kind = "proxy"
+
+
+class Throttled(FetchError):
+    """站点限流（429 / 验证页）；retry_after 为站点给的等待秒数（没有则为 None），由 RATE_LIMITER 全局暂停"""
+    kind = "throttled"
+
+    def __init__(self, msg: str, retry_after: float | None = None):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+class NotIndexedYet(FetchError):
+    """页面正常打开但字段没渲染出来：range.org 还没收录这笔，过一会儿再查"""
+    kind = "not_indexed"
+
+
+class TxNotFound(FetchError):
+    """站点明确返回查无此交易，永久结果"""
+    kind = "not_found"
+
+
+class LayoutChangedError(FetchError):
+    """页面已经渲染出这笔交易，但所有 selector / 文本锚点都取不到字段：页面结构变了，要改 selector"""
+    kind = "layout"
+
+
+def _policy(kind: str, attempts: str, delay: str) -> tuple[int, float]:
+    prefix = f"RETRY_{kind.upper()}"
+    return int(os.getenv(f"{prefix}_ATTEMPTS", attempts)), float(os.getenv(f"{prefix}_DELAY", delay))
+
+
+# kind -> (最多尝试次数, 第一次重试前的等待秒数)；之后每次翻倍，不超过 RETRY_MAX_DELAY
+RETRY_POLICY: dict[str, tuple[int, float]] = {
+    "timeout": _policy("timeout", "4", "5"),
+    "proxy": _policy("proxy", "5", "1"),            # 换个代理马上再试
+    "throttled": _policy("throttled", "6", "1"),    # 真正的等待由 RATE_LIMITER 的全局暂停控制
+    "not_indexed": _policy("not_indexed", "3", "120"),
+    "not_found": _policy("not_found", "1", "0"),
+    "layout": _policy("layout", "2", "10"),         # 渲染慢也会表现成 layout，再给一次机会
+}
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "600"))
+
+
+def retry_delay(kind: str, attempt: int) -> float | None:
+    """
+    第 attempt 次尝试失败后要等多久再试；None 表示不再重试
+    """
+    max_attempts, base = RETRY_POLICY.get(kind, RETRY_POLICY["timeout"])
+    if attempt >= max_attempts:
+        return None
+    return min(base * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+
+
+class RetryScheduler(Thread):
+    """
+    scheduler = RetryScheduler(task_queue, deadline=RUN_DEADLINE); scheduler.start()
+    attempt = scheduler.attempt(tx)               # 这笔 tx 当前是第几次尝试
+    if scheduler.reschedule(tx, error): ...        # True: 已排队重试（不要 task_done）；False: 最终失败
+    scheduler.cancel()                             # 退出时：丢掉排队中和之后的重试（不写 cache，下次运行再查）
+    scheduler.stop()                               # task_queue.join() 之后调用
+    """
+
+    def __init__(self, task_queue: Queue, deadline: RunDeadline | None = None):
+        super().__init__(name="retry-scheduler", daemon=True)
+        self.task_queue = task_queue
+        self.deadline = deadline
+        self.cond = Condition()
+        self.heap: list[tuple[float, int, str]] = []
+        self.attempts: dict[str, int] = {}
+        self.seq = 0
+        self.stopped = False
+        self.cancelled = False
+
+    def attempt(self, tx: str) -> int:
+        with self.cond:
+            return self.attempts.get(tx, 1)
+
+    def reschedule(self, tx: str, error: FetchError) -> bool:
+        with self.cond:
+            attempt = self.attempts.get(tx, 1)
+            delay = retry_delay(error.kind, attempt)
+            METRICS.incr(f"fetch_failures_{error.kind}_total")
+            if delay is None:
+                self.attempts.pop(tx, None)
+                return False
+
+            late = self.deadline is not None and not self.deadline.fits(delay)
+            if self.cancelled or late:
+                # 正在退出 / 赶不上截止时间：不再排队，名额直接释放（worker 看到 True 不会 task_done）
+                self.attempts.pop(tx, None)
+                self.task_queue.task_done()
+                if late:
+                    METRICS.incr("deadline_skipped_retries_total")
+                    logging.info("tx=%s %s, retry in %.0fs would miss the run deadline, left for next run",
+                                 tx, error.kind, delay)
+                return True
+
+            self.attempts[tx] = attempt + 1
+            self.seq += 1
+            heapq.heappush(self.heap, (time.time() + delay, self.seq, tx))
+            self.cond.notify()
+        METRICS.incr("fetch_retries_total")
+        logging.info("tx=%s %s, retry #%d in %.0fs", tx, error.kind, attempt, delay)
+        return True
+
+    def done(self, tx: str):
+        with self.cond:
+            self.attempts.pop(tx, None)
+
+    def pending(self) -> int:
+        with self.cond:
+            return len(self.heap)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.stopped and (not self.heap or self.heap[0][0] > time.time()):
+                    timeout = self.heap[0][0] - time.time() if self.heap else None
+                    self.cond.wait(timeout)
+                if self.stopped:
+                    return
+                _, _, tx = heapq.heappop(self.heap)
+
+            # 先放回队列再释放原来的名额，中间 unfinished_tasks 不会掉到 0
+            self.task_queue.put(tx)
+            self.task_queue.task_done()
+
+    def cancel(self) -> int:
+        """返回丢掉的重试数"""
+        with self.cond:
+            self.cancelled = True
+            dropped = len(self.heap)
+            for _, _, tx in self.heap:
+                self.attempts.pop(tx, None)
+                self.task_queue.task_done()
+            self.heap = []
+            self.cond.notify()
+        return dropped
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+链上解析路径（不访问 usdc.range.org，不开浏览器、不走代理）：
+  - query_tx_hash 是目标链上的 receiveMessage 交易：批量 eth_getTransactionReceipt（一个 HTTP 请求里多个调用），
+    从 MessageTransmitter 的 MessageReceived 日志里取出 (sourceDomain, nonce)
+  - 源链 TokenMessenger 的 DepositForBurn 日志按 nonce 建了索引：批量 eth_getLogs 按 nonce 过滤，
+    日志所在的交易就是 sender_address（源链 tx hash）
+  - 只覆盖配置了 RPC 的 EVM 链和 CCTP v1 的消息格式；Solana / Noble 等源链、v2 消息、没查到的交易都交回给网页解析
+
+配置：RPC_ENDPOINTS="0=https://eth.example,3=https://arb.example,6=https://base.example"（CCTP domain=RPC 地址）
+      eth_getLogs 的块范围见 RPC_LOG_LOOKBACK_HOURS / RPC_LOG_FROM_BLOCK_<domain>
+"""
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_imports import lazy_import
+from range_api import format_value
+from metrics import METRICS
+
+httpx = lazy_import("httpx")
+
+# -----------------------------
+# Config
+# -----------------------------
+def _domain_map(value: str) -> dict[int, str]:
+    """'0=a,3=b' -> {0: 'a', 3: 'b'}"""
+    out = {}
+    for item in value.split(","):
+        if "=" in item:
+            domain, target = item.split("=", 1)
+            out[int(domain.strip())] = target.strip()
+    return out
+
+
+RPC_ENDPOINTS = _domain_map(os.getenv("RPC_ENDPOINTS", ""))
+RPC_BATCH_SIZE = int(os.getenv("RPC_BATCH_SIZE", "100"))          # 一个 HTTP 请求里最多几个 JSON-RPC 调用
+RPC_CONCURRENCY = int(os.getenv("RPC_CONCURRENCY", "8"))          # 每条链同时在途的批量请求数
+RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "20.0"))
+# eth_getLogs 的块范围：很多节点拒绝 earliest~latest 这种全历史查询
+#   - 按目标链 receipt 的出块时间往前 RPC_LOG_LOOKBACK_HOURS 小时，换算成源链块号（0 = 不按时间收窄）
+#   - 算不出窗口时退回 LOG_FROM_BLOCKS[domain]~latest；比窗口更早的源链交易交回给网页解析
+RPC_LOG_LOOKBACK_HOURS = float(os.getenv("RPC_LOG_LOOKBACK_HOURS", "24"))
+RPC_BLOCK_SAMPLE = int(os.getenv("RPC_BLOCK_SAMPLE", "10000"))    # 估算源链出块间隔时往回取样的块数
+
+# CCTP v1 TokenMessenger（DepositForBurn 的发出方），RPC_TOKEN_MESSENGERS 可以覆盖 / 补充
+TOKEN_MESSENGERS = {
+    0: "0xBd3fa81B58Ba92a82136038B25aDec7066af3155",   # Ethereum
+    1: "0x6B25532e1060CE10cc3B0A99e5683b91BFDe6982",   # Avalanche
+    2: "0x2B4069517957735bE00ceE0fadAE88a26365528f",   # OP Mainnet
+    3: "0x19330d10D9Cc8751218eaf51E8885D058642E08A",   # Arbitrum
+    6: "0x1682Ae6375C4E4A97e4B583BC394c861A46D8962",   # Base
+    7: "0x9daF8c91AEFAE50b9c0E69629D3F6Ca40cA3B3FE",   # Polygon PoS
+}
+TOKEN_MESSENGERS.update(_domain_map(os.getenv("RPC_TOKEN_MESSENGERS", "")))
+
+# 各链 TokenMessenger 部署之前的块号（保守的下界，不是精确的部署块），RPC_LOG_FROM_BLOCK_<domain>=<块号> 可以覆盖
+LOG_FROM_BLOCKS = {
+    0: 16_000_000,
+    1: 24_000_000,
+    2: 100_000_000,
+    3: 50_000_000,
+    6: 5_000_000,
+    7: 40_000_000,
+}
+LOG_FROM_BLOCKS.update({
+    int(key[len("RPC_LOG_FROM_BLOCK_"):]): int(value, 0)
+    for key, value in os.environ.items()
+    if key.startswith("RPC_LOG_FROM_BLOCK_") and value
+})
+
+# keccak256 事件签名
+# MessageReceived(address indexed caller, uint32 sourceDomain, uint64 indexed nonce, bytes32 sender, bytes messageBody)
+MESSAGE_RECEIVED_TOPIC = "0x58200b4c34ae05ee816d710053fff3fb75af4395915d3d2a771b24aa10e3cc5d"
+# DepositForBurn(uint64 indexed nonce, address indexed burnToken, uint256 amount, address indexed depositor,
+#                bytes32 mintRecipient, uint32 destinationDomain, bytes32 destinationTokenMessenger, bytes32 destinationCaller)
+DEPOSIT_FOR_BURN_TOPIC = "0x2fa9ca894982930190727e75500a97d8dc500233a5065e0f3126c48fbe0343c0"
+
+
+class RpcError(Exception):
+    """JSON-RPC 请求失败（整批交回给网页解析）"""
+    pass
+
+
+# -----------------------------
+# 解码
+# -----------------------------
+def is_evm_hash(tx_hash: str) -> bool:
+    h = tx_hash.strip().lower()
+    return len(h) == 66 and h.startswith("0x") and all(c in "0123456789abcdef" for c in h[2:])
+
+
+def decode_message_received(receipt: dict) -> tuple[int, int] | None:
+    """
+    receipt 里第一个 CCTP v1 MessageReceived 日志 -> (sourceDomain, nonce)；没有返回 None
+    data 的第一个 32 字节是 sourceDomain，nonce 在 topics[2]
+    """
+    for log in receipt.get("logs") or []:
+        topics = log.get("topics") or []
+        if len(topics) < 3 or topics[0].lower() != MESSAGE_RECEIVED_TOPIC:
+            continue
+        data = log.get("data", "0x")[2:]
+        if len(data) < 64:
+            continue
+        return int(data[:64], 16), int(topics[2], 16)
+    return None
+
+
+def nonce_topic(nonce: int) -> str:
+    return "0x" + format(nonce, "064x")
+
+
+def log_window(clock: tuple[int, int, float], since: int, until: int, floor: int = 0) -> tuple[int, int]:
+    """
+    时间区间 [since, until]（unix 秒）-> 源链块号区间；clock 是 (最新块号, 最新块时间, 平均出块秒数)
+    出块间隔按平均值估算，离现在越远误差越大，两头各留 10% 的距离再加 10 分钟
+    """
+    number, timestamp, block_seconds = clock
+    pad = (timestamp - since) * 0.1 + 600
+
+    def at(t: float) -> int:
+        return number - int((timestamp - t) / block_seconds)
+
+    return max(at(since - pad), floor, 0), min(at(until + pad), number)
+
+
+# -----------------------------
+# Client
+# -----------------------------
+class RpcClient:
+    """
+    线程安全，所有链共用一个连接池；用法：
+
+        with RpcClient() as client:
+            records, leftover = client.resolve_many(hashes)
+    """
+
+    def __init__(
+        self,
+        endpoints: dict[int, str] | None = None,
+        timeout: float = RPC_TIMEOUT,
+        batch_size: int = RPC_BATCH_SIZE,
+        concurrency: int = RPC_CONCURRENCY,
+        lookback_hours: float = RPC_LOG_LOOKBACK_HOURS,
+    ):
+        self.endpoints = RPC_ENDPOINTS if endpoints is None else endpoints
+        self.lookback = lookback_hours * 3600
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        size = concurrency * max(len(self.endpoints), 1)
+        self.client = httpx.Client(
+            http2=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+            headers={"Content-Type": "application/json"},
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.client.close()
+
+    # ---------- JSON-RPC ----------
+    def batch(self, url: str, calls: list[tuple[str, list]]) -> list:
+        """
+        一个 HTTP 请求发多个调用，按 id 对回结果；单个调用报错时那一项为 None
+        """
+        body = [{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p) in enumerate(calls)]
+        try:
+            with METRICS.timer("rpc_batch_seconds"):
+                resp = self.client.post(url, content=json.dumps(body))
+            resp.raise_for_status()
+            replies = resp.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise RpcError(f"batch of {len(calls)} calls to {url} failed: {e}") from e
+        METRICS.incr("rpc_calls_total", len(calls))
+
+        if isinstance(replies, dict):
+            # 有的节点对整批的错误只回一个对象
+            raise RpcError(f"batch rejected by {url}: {replies.get('error')}")
+        results: list = [None] * len(calls)
+        for reply in replies:
+            i = reply.get("id")
+            if not isinstance(i, int) or not 0 <= i < len(calls):
+                continue
+            if "error" in reply:
+                logging.info("[RPC] %s %s failed: %s", calls[i][0], calls[i][1], reply["error"])
+                continue
+            results[i] = reply.get("result")
+        return results
+
+    def batch_many(self, url: str, calls: list[tuple[str, list]]) -> list:
+        """按 batch_size 切成多批并发发出；失败的批次对应的结果为 None"""
+        chunks = [calls[i:i + self.batch_size] for i in range(0, len(calls), self.batch_size)]
+
+        def run(chunk):
+            try:
+                return self.batch(url, chunk)
+            except RpcError as e:
+                logging.warning("[RPC] %s", e)
+                return [None] * len(chunk)
+
+        results: list = []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="rpc") as pool:
+            for part in pool.map(run, chunks):
+                results.extend(part)
+        return results
+
+    # ---------- 解析 ----------
+    def receipts(self, domain: int, hashes: list[str]) -> dict[str, dict]:
+        calls = [("eth_getTransactionReceipt", [h]) for h in hashes]
+        results = self.batch_many(self.endpoints[domain], calls)
+        return {h: r for h, r in zip(hashes, results) if r}
+
+    def block_times(self, domain: int, numbers: list[str]) -> dict[str, int]:
+        """块号（hex）-> 出块时间（unix 秒）"""
+        calls = [("eth_getBlockByNumber", [n, False]) for n in numbers]
+        results = self.batch_many(self.endpoints[domain], calls)
+        return {n: int(b["timestamp"], 16) for n, b in zip(numbers, results) if b}
+
+    def block_clock(self, domain: int) -> tuple[int, int, float] | None:
+        """(最新块号, 最新块时间, 最近 RPC_BLOCK_SAMPLE 个块的平均出块秒数)；查不到返回 None"""
+        url = self.endpoints[domain]
+        try:
+            latest = self.batch(url, [("eth_getBlockByNumber", ["latest", False])])[0]
+            if not latest:
+                return None
+            number, timestamp = int(latest["number"], 16), int(latest["timestamp"], 16)
+            past = max(number - RPC_BLOCK_SAMPLE, 0)
+            old = self.batch(url, [("eth_getBlockByNumber", [hex(past), False])])[0]
+        except RpcError as e:
+            logging.warning("[RPC] %s", e)
+            return None
+        if not old or timestamp <= int(old["timestamp"], 16):
+            return None
+        return number, timestamp, (timestamp - int(old["timestamp"], 16)) / (number - past)
+
+    def source_txs(self, domain: int, nonces: list[int], received: dict[int, int] | None = None) -> dict[int, str]:
+        """
+        源链上 nonce -> DepositForBurn 所在的交易 hash
+        received: nonce -> 目标链 receive 的出块时间，有的话只查它之前 lookback 内的块
+        """
+        floor = LOG_FROM_BLOCKS.get(domain, 0)
+        clock = self.block_clock(domain) if received and self.lookback > 0 else None
+        calls = []
+        for n in nonces:
+            log_filter = {"fromBlock": hex(floor), "toBlock": "latest"}
+            if clock and n in received:
+                start, end = log_window(clock, received[n] - self.lookback, received[n], floor)
+                if start <= end:
+                    log_filter = {"fromBlock": hex(start), "toBlock": hex(end)}
+            if domain in TOKEN_MESSENGERS:
+                log_filter["address"] = TOKEN_MESSENGERS[domain]
+            calls.append(("eth_getLogs", [dict(log_filter, topics=[DEPOSIT_FOR_BURN_TOPIC, nonce_topic(n)])]))
+        results = self.batch_many(self.endpoints[domain], calls)
+        return {n: logs[0]["transactionHash"] for n, logs in zip(nonces, results) if logs}
+
+    def resolve_many(self, hashes: list[str]) -> tuple[list[dict], list[str]]:
+        """
+        返回 (解析成功的记录, 需要网页解析的 tx_hash)
+        目标链未知：依次在每条配置了 RPC 的链上查 receipt，查到的就不再往下查
+        """
+        pending = {h.lower(): h for h in hashes if is_evm_hash(h)}
+        messages: dict[str, tuple[int, int]] = {}
+        blocks: dict[int, dict[str, list[str]]] = {}     # 目标链 -> 块号 -> tx_hash
+        found = 0
+        for domain in self.endpoints:
+            if not pending:
+                break
+            for h, receipt in self.receipts(domain, list(pending)).items():
+                pending.pop(h, None)
+                found += 1
+                msg = decode_message_received(receipt)
+                if msg is not None:
+                    messages[h] = msg
+                    if receipt.get("blockNumber"):
+                        blocks.setdefault(domain, {}).setdefault(receipt["blockNumber"], []).append(h)
+                else:
+                    METRICS.incr("rpc_not_cctp_total")
+
+        # 目标链 receive 的出块时间，用来收窄源链 eth_getLogs 的块范围
+        received: dict[str, int] = {}
+        if self.lookback > 0:
+            for domain, numbers in blocks.items():
+                for number, timestamp in self.block_times(domain, list(numbers)).items():
+                    received.update(dict.fromkeys(numbers[number], timestamp))
+
+        # 按源链分组查 DepositForBurn
+        by_source: dict[int, dict[int, list[str]]] = {}
+        times: dict[int, dict[int, int]] = {}
+        for h, (source, nonce) in messages.items():
+            by_source.setdefault(source, {}).setdefault(nonce, []).append(h)
+            if h in received:
+                times.setdefault(source, {})[nonce] = received[h]
+
+        records: list[dict] = []
+        for source, nonces in by_source.items():
+            if source not in self.endpoints:
+                METRICS.incr("rpc_unsupported_source_total", sum(len(v) for v in nonces.values()))
+                continue
+            for nonce, src_tx in self.source_txs(source, list(nonces), times.get(source)).items():
+                for h in nonces[nonce]:
+                    records.append({
+                        "query_tx_hash": h,
+                        "sender_address": format_value(src_tx),
+                        "receiver_address": format_value(h),
+                    })
+
+        resolved = {r["query_tx_hash"] for r in records}
+        leftover = [h for h in hashes if h.lower() not in resolved]
+        logging.info(
+            "[RPC] receipts=%d, cctp messages=%d, resolved=%d, leftover=%d",
+            found, len(messages), len(records), len(leftover),
+        )
+        return records, leftover
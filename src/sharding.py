@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+分片执行：
+  - tx_hash 按 sha1 确定性地分到 K 个分片（和顺序、运行机器无关，同一个 hash 永远落在同一个分片）
+  - 每个分片单独一个进程（--processes K）或一个 CI matrix job（--shard i/K），只写自己的分片 CSV，不上传
+  - --merge K 把所有分片 CSV 合并成 CSV_PATH，去重后统一上传一次
+"""
+from __future__ import annotations
+
+import os
+import hashlib
+import logging
+
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """'i/K' -> (i, K)，i 从 0 开始"""
+    try:
+        index, count = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"shard must look like i/K, got {spec!r}") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"shard index out of range: {spec!r}")
+    return index, count
+
+
+def shard_of(tx_hash: str, count: int) -> int:
+    digest = hashlib.sha1(tx_hash.strip().lower().encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def filter_shard(df: pd.DataFrame, column: str, index: int, count: int) -> pd.DataFrame:
+    mask = df[column].map(lambda h: shard_of(str(h), count) == index)
+    return df[mask]
+
+
+def shard_path(path: str, index: int, count: int) -> str:
+    """data/x.csv -> data/x.shard-0-of-4.csv"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{index}-of-{count}{ext}"
+
+
+def read_shards(path: str, count: int, columns: list[str]) -> tuple[pd.DataFrame, list[str]]:
+    """
+    读取所有分片 CSV，返回 (合并去重后的结果, 读到的文件)；缺失的分片只告警（对应 job 失败，下次增量会补上）
+    """
+    frames, found = [], []
+    for i in range(count):
+        p = shard_path(path, i, count)
+        if not os.path.exists(p):
+            logging.warning("[shard] missing shard output %s", p)
+            continue
+        frames.append(pd.read_csv(p, dtype=str))
+        found.append(p)
+
+    if not frames:
+        return pd.DataFrame(columns=columns), found
+
+    df = pd.concat(frames, ignore_index=True)[columns].dropna(subset=["query_tx_hash"])
+    df = df.drop_duplicates(subset=["query_tx_hash"], keep="last")
+    logging.info("[shard] merged %d rows from %d/%d shards", len(df), len(found), count)
+    return df, found
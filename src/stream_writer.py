@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+流式写出：worker 每拿到一条结果就丢进队列，由一个后台线程
+  - 立刻追加写入 CSV（每行 flush）
+  - 攒够 STREAM_BATCH_ROWS 行或过了 STREAM_BATCH_SECONDS 秒，就把这一批上传到 Dune
+上传和抓取并行，后面失败也不会丢前面的结果；
+最终仍然上传失败的行写进 pending 文件，下次运行先补传。
+"""
+import os
+import io
+import csv
+import time
+import logging
+from queue import Queue, Empty
+from threading import Thread
+
+STREAMING = os.getenv("STREAMING", "0") == "1"
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "500"))
+STREAM_BATCH_SECONDS = float(os.getenv("STREAM_BATCH_SECONDS", "30"))
+STREAM_SEEN_MAX = int(os.getenv("STREAM_SEEN_MAX", "200000"))   # 去重集合的上限，超过后丢掉最早的一半（daemon 常驻）
+
+
+def rows_to_csv_bytes(rows: list[dict], columns: list[str]) -> bytes:
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=columns, extrasaction="ignore")
+    w.writeheader()
+    w.writerows(rows)
+    return buf.getvalue().encode("utf-8")
+
+
+class StreamingWriter(Thread):
+    """
+    writer = StreamingWriter(csv_path, columns, upload_fn=...)
+    writer.start()
+    writer.put(rec)   # 任意线程 / 协程里调用
+    writer.close()    # 刷完剩余的批次并等待线程退出
+    """
+
+    def __init__(
+        self,
+        csv_path: str,
+        columns: list[str],
+        upload_fn=None,
+        pending_path: str | None = None,
+        truncate: bool = False,
+        batch_rows: int = STREAM_BATCH_ROWS,
+        batch_seconds: float = STREAM_BATCH_SECONDS,
+    ):
+        super().__init__(name="stream-writer", daemon=True)
+        self.csv_path = csv_path
+        self.columns = columns
+        self.upload_fn = upload_fn
+        self.pending_path = pending_path
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self.queue: Queue = Queue()
+        # 按写入顺序的去重表（dict 当有序集合用），超过 STREAM_SEEN_MAX 时丢掉最早的一半
+        self.seen: dict[str, None] = {}
+        self.batch: list[dict] = []
+        self.last_flush = time.time()
+        self.failing = False
+        self.written = 0
+        self.uploaded = 0
+
+        os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+        need_header = truncate or not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+        self.fh = open(csv_path, "w" if truncate else "a", newline="", encoding="utf-8")
+        self.csv = csv.DictWriter(self.fh, fieldnames=columns, extrasaction="ignore")
+        if need_header:
+            self.csv.writeheader()
+            self.fh.flush()
+
+    def put(self, rec: dict):
+        self.queue.put(rec)
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        logging.info("[stream] closed, written=%d, uploaded=%d", self.written, self.uploaded)
+
+    def _flush_upload(self):
+        self.last_flush = time.time()
+        if not self.batch or self.upload_fn is None:
+            self.batch = []
+            return
+        try:
+            t0 = time.time()
+            self.upload_fn(self.batch)
+            self.uploaded += len(self.batch)
+            logging.info("[stream] uploaded batch of %d rows in %.2fs", len(self.batch), time.time() - t0)
+            self.batch = []
+            self.failing = False
+        except Exception as e:
+            # 保留这一批，下一次 flush 连同新行一起重试
+            self.failing = True
+            logging.warning("[stream] upload of %d rows failed, will retry: %s", len(self.batch), repr(e))
+
+    def _save_pending(self):
+        if not self.batch or self.upload_fn is None or not self.pending_path:
+            return
+        exists = os.path.exists(self.pending_path)
+        with open(self.pending_path, "a", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=self.columns, extrasaction="ignore")
+            if not exists:
+                w.writeheader()
+            w.writerows(self.batch)
+        logging.error("[stream] %d rows not uploaded, saved to %s", len(self.batch), self.pending_path)
+
+    def run(self):
+        try:
+            while True:
+                timeout = max(0.0, self.batch_seconds - (time.time() - self.last_flush))
+                try:
+                    rec = self.queue.get(timeout=timeout)
+                except Empty:
+                    self._flush_upload()
+                    continue
+
+                if rec is None:
+                    break
+
+                key = rec["query_tx_hash"]
+                if key in self.seen:
+                    continue
+                self.seen[key] = None
+                if len(self.seen) > STREAM_SEEN_MAX:
+                    for old in list(self.seen)[:len(self.seen) // 2]:
+                        del self.seen[old]
+
+                self.csv.writerow(rec)
+                self.fh.flush()
+                self.written += 1
+                self.batch.append(rec)
+
+                # 上传失败后不再按行数触发，等下一个时间窗口再重试
+                if len(self.batch) >= self.batch_rows and not self.failing:
+                    self._flush_upload()
+
+            self._flush_upload()
+            self._save_pending()
+        finally:
+            self.fh.close()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+分块上传到 Dune 表：
+  - CSV 按 UPLOAD_CHUNK_BYTES 切块（按行切，每块都带表头），UPLOAD_PARALLELISM 个并发上传，每块 tenacity 重试
+  - 每块确认后写 checkpoint（按文件内容的 sha1 记录已确认的块号），同一份文件重传时跳过已确认的块
+  - 上传彻底失败时抛异常，checkpoint 保留，下次续传
+  - checkpoint 是本地文件：CI 里由 workflow 的 merge job 和 PENDING_CSV_PATH 一起用 actions/cache 存取（if: always()），
+    其他环境要续传得保留 data/ 目录
+"""
+import io
+import os
+import csv
+import json
+import time
+import hashlib
+import logging
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+from metrics import METRICS
+
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_PARALLELISM = int(os.getenv("UPLOAD_PARALLELISM", "2"))
+UPLOAD_ATTEMPTS = int(os.getenv("UPLOAD_ATTEMPTS", "5"))
+UPLOAD_CHECKPOINT_PATH = os.getenv("UPLOAD_CHECKPOINT_PATH", "data/upload_checkpoint.json")
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def split_csv(path: str, chunk_bytes: int = UPLOAD_CHUNK_BYTES) -> list[bytes]:
+    """按行切成不超过 chunk_bytes 的块（单行超过上限时该行单独成块），每块都带表头"""
+    chunks: list[bytes] = []
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return chunks
+
+        def encode(rows: list[list[str]]) -> bytes:
+            buf = io.StringIO()
+            writer = csv.writer(buf, lineterminator="\n")
+            writer.writerow(header)
+            writer.writerows(rows)
+            return buf.getvalue().encode("utf-8")
+
+        header_size = len(encode([]))
+        rows: list[list[str]] = []
+        size = header_size
+        for row in reader:
+            row_size = sum(len(v) for v in row) + len(row)
+            if rows and size + row_size > chunk_bytes:
+                chunks.append(encode(rows))
+                rows, size = [], header_size
+            rows.append(row)
+            size += row_size
+        if rows:
+            chunks.append(encode(rows))
+    return chunks
+
+
+class Checkpoint:
+    """{文件 sha1: [已确认的块号]}，每次确认后原子写回"""
+
+    def __init__(self, path: str = UPLOAD_CHECKPOINT_PATH):
+        self.path = path
+        self.lock = Lock()
+        self.data: dict[str, list[int]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.data = json.load(f)
+            except ValueError:
+                logging.warning("[upload] unreadable checkpoint %s, starting over", path)
+
+    def done(self, digest: str) -> set[int]:
+        with self.lock:
+            return set(self.data.get(digest, []))
+
+    def ack(self, digest: str, index: int):
+        with self.lock:
+            self.data.setdefault(digest, []).append(index)
+            self._save()
+
+    def finish(self, digest: str):
+        with self.lock:
+            self.data.pop(digest, None)
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+
+
+class ChunkedUploader:
+    """
+    uploader = ChunkedUploader(upload_fn)   # upload_fn(bytes) 上传一块 CSV
+    stats = uploader.upload_file(path)
+    """
+
+    def __init__(
+        self,
+        upload_fn: Callable[[bytes], None],
+        checkpoint_path: str = UPLOAD_CHECKPOINT_PATH,
+        chunk_bytes: int = UPLOAD_CHUNK_BYTES,
+        parallelism: int = UPLOAD_PARALLELISM,
+        attempts: int = UPLOAD_ATTEMPTS,
+    ):
+        self.upload_fn = upload_fn
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.chunk_bytes = chunk_bytes
+        self.parallelism = parallelism
+        self._send = retry(
+            reraise=True,
+            stop=stop_after_attempt(attempts),
+            wait=wait_exponential(multiplier=1, min=1, max=30),
+        )(self._send_once)
+
+    def _send_once(self, index: int, data: bytes):
+        with METRICS.timer("dune_chunk_upload_seconds"):
+            self.upload_fn(data)
+
+    def _upload_chunk(self, digest: str, index: int, data: bytes):
+        self._send(index, data)
+        self.checkpoint.ack(digest, index)
+        METRICS.incr("upload_chunks_total")
+        METRICS.incr("upload_bytes_total", len(data))
+
+    def upload_file(self, path: str) -> dict:
+        t0 = time.perf_counter()
+        digest = file_digest(path)
+        chunks = split_csv(path, self.chunk_bytes)
+        done = self.checkpoint.done(digest)
+        todo = [(i, c) for i, c in enumerate(chunks) if i not in done]
+        if done:
+            logging.info("[upload] resuming %s: %d/%d chunks already acknowledged", path, len(done), len(chunks))
+
+        with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="dune-upload") as pool:
+            futures = [pool.submit(self._upload_chunk, digest, i, c) for i, c in todo]
+            errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            raise RuntimeError(f"{len(errors)}/{len(todo)} chunks of {path} failed, last error: {errors[-1]!r}")
+
+        self.checkpoint.finish(digest)
+        stats = {
+            "chunks": len(chunks),
+            "skipped": len(chunks) - len(todo),
+            "bytes": sum(len(c) for _, c in todo),
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
+        logging.info("[upload] %s uploaded: %s", path, stats)
+        return stats
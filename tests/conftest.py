@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""src/ 下的模块互相按顶层模块导入，测试也一样"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""range_api 对 fake_range_server：单笔解析和交易列表（批量路径）的时间窗过滤"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import fake_range_server
+from range_api import RangeApiClient, format_value
+
+
+@pytest.fixture
+def range_base():
+    def start(**kwargs):
+        server, base = fake_range_server.start_fake_server(**kwargs)
+        servers.append(server)
+        return base
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def synthetic_hashes(n: int) -> list[str]:
+    return ["0x" + hashlib.sha256(f"tx{i}".encode()).hexdigest() for i in range(n)]
+
+
+def source_of(tx_hash: str) -> str:
+    return format_value("0x" + hashlib.sha256(tx_hash.lower().encode()).hexdigest())
+
+
+def test_resolve_fixtures(range_base):
+    fixtures = fake_range_server.load_fixtures()
+    with RangeApiClient(base_url=range_base()) as client:
+        records, failed = client.resolve_many(list(fixtures) + ["0x" + "ab" * 32])
+
+    assert failed == ["0x" + "ab" * 32]
+    by_hash = {r["query_tx_hash"]: r for r in records}
+    assert set(by_hash) == set(fixtures)
+    for h, payload in fixtures.items():
+        tx = payload["props"]["pageProps"]["transaction"]
+        assert by_hash[h]["sender_address"] == format_value(tx["sourceTxHash"])
+        assert by_hash[h]["receiver_address"] == format_value(tx["destinationTxHash"])
+
+
+def test_resolve_synthetic(range_base):
+    hashes = synthetic_hashes(30)
+    with RangeApiClient(base_url=range_base(synthetic=True)) as client:
+        records, failed = client.resolve_many(hashes)
+
+    assert not failed
+    assert {r["query_tx_hash"]: r["sender_address"] for r in records} == {h: source_of(h) for h in hashes}
+
+
+def test_listing_matches_receivers(range_base):
+    hashes = synthetic_hashes(250)
+    base = range_base(listing_hashes=hashes)
+    with RangeApiClient(base_url=base, concurrency=4) as client:
+        records, leftover = client.resolve_listing(hashes[:40] + ["0x" + "cd" * 32], page_size=50)
+
+    assert leftover == ["0x" + "cd" * 32]
+    assert {r["query_tx_hash"]: r["sender_address"] for r in records} == {h: source_of(h) for h in hashes[:40]}
+
+
+def test_listing_time_window(range_base):
+    """时间窗外的交易列表里没有，交回给单笔解析"""
+    hashes = synthetic_hashes(200)
+    times = {h: datetime.fromisoformat(fake_range_server.synthetic_block_time(h)) for h in hashes}
+    start = datetime(2026, 1, 10, tzinfo=timezone.utc)
+    end = start + timedelta(days=10)
+    inside = {h for h, t in times.items() if start <= t <= end}
+    assert inside and len(inside) < len(hashes)
+
+    with RangeApiClient(base_url=range_base(listing_hashes=hashes)) as client:
+        records, leftover = client.resolve_listing(hashes, start=start.isoformat(), end=end.isoformat(), page_size=20)
+
+    assert {r["query_tx_hash"] for r in records} == inside
+    assert set(leftover) == set(hashes) - inside
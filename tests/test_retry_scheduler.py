@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""RETRY_POLICY 按错误类型走 RetryScheduler：重试次数、退避、回到队列的顺序、截止时间"""
+import pytest
+
+from priority_queue import PriorityTaskQueue, RunDeadline
+from retry_scheduler import (
+    RETRY_MAX_DELAY, RETRY_POLICY, FetchTimeout, LayoutChangedError, NotIndexedYet, ProxyFailure,
+    RetryScheduler, Throttled, TxNotFound, retry_delay,
+)
+
+ERRORS = [FetchTimeout, ProxyFailure, Throttled, NotIndexedYet, TxNotFound, LayoutChangedError]
+
+
+@pytest.fixture
+def scheduler():
+    queue = PriorityTaskQueue()
+    sched = RetryScheduler(queue)
+    queue.attempts = sched.attempt
+    yield sched
+    sched.stop()
+
+
+@pytest.mark.parametrize("error_cls", ERRORS, ids=lambda cls: cls.kind)
+def test_attempts_per_kind(scheduler, error_cls):
+    """每种错误最多尝试 RETRY_POLICY 里的次数，之后 reschedule 返回 False（最终失败）"""
+    max_attempts, _ = RETRY_POLICY[error_cls.kind]
+    retried = 0
+    while scheduler.reschedule("0xabc", error_cls("boom")):
+        retried += 1
+        assert scheduler.attempt("0xabc") == retried + 1
+    assert retried == max_attempts - 1
+    assert scheduler.pending() == retried
+    # 最终失败后尝试次数清掉
+    assert scheduler.attempt("0xabc") == 1
+
+
+@pytest.mark.parametrize("kind", sorted(RETRY_POLICY))
+def test_backoff_doubles(kind):
+    max_attempts, base = RETRY_POLICY[kind]
+    delays = [retry_delay(kind, a) for a in range(1, max_attempts + 1)]
+    assert delays[-1] is None
+    assert delays[:-1] == [min(base * 2 ** i, RETRY_MAX_DELAY) for i in range(max_attempts - 1)]
+
+
+def test_unknown_kind_uses_timeout_policy():
+    assert retry_delay("whatever", 1) == retry_delay("timeout", 1)
+
+
+def test_retry_goes_behind_new_tasks(monkeypatch, scheduler):
+    """到期的重试放回队列，排在还没尝试过的任务后面；计数不丢，join 能返回"""
+    monkeypatch.setitem(RETRY_POLICY, "timeout", (3, 0.05))
+    queue = scheduler.task_queue
+    scheduler.start()
+    queue.put("0xa")
+    queue.put("0xb")
+
+    assert queue.get(timeout=1) == "0xa"
+    assert scheduler.reschedule("0xa", FetchTimeout("slow"))
+    queue.put("0xc")
+
+    order = [queue.get(timeout=1) for _ in range(3)]
+    assert order == ["0xb", "0xc", "0xa"]
+    for _ in order:
+        queue.task_done()
+    queue.join()
+
+
+def test_retry_past_deadline_is_released():
+    """重试赶不上截止时间：不排队，名额直接释放"""
+    queue = PriorityTaskQueue()
+    sched = RetryScheduler(queue, deadline=RunDeadline(budget=60, reserve=30))
+    queue.put("0xa")
+    queue.get()
+
+    assert sched.reschedule("0xa", NotIndexedYet("not yet"))     # 120 秒后才重试
+    assert sched.pending() == 0
+    assert queue.unfinished_tasks == 0
+
+
+def test_cancel_drops_pending_retries(scheduler):
+    queue = scheduler.task_queue
+    for tx in ("0xa", "0xb"):
+        queue.put(tx)
+        queue.get()
+        assert scheduler.reschedule(tx, NotIndexedYet("not yet"))
+
+    assert scheduler.cancel() == 2
+    assert queue.unfinished_tasks == 0
+    # 取消之后的失败也不再排队
+    queue.put("0xc")
+    queue.get()
+    assert scheduler.reschedule("0xc", FetchTimeout("slow"))
+    assert scheduler.pending() == 0 and queue.unfinished_tasks == 0
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""rpc_resolver 对 fake_rpc_server：录制的 receipt、合成的 receipt、eth_getLogs 的块范围"""
+import json
+import hashlib
+
+import pytest
+
+import fake_rpc_server
+from rpc_resolver import RpcClient, decode_message_received, log_window
+
+
+@pytest.fixture
+def rpc():
+    def start(**kwargs):
+        server, base = fake_rpc_server.start_fake_server(**kwargs)
+        servers.append(server)
+        return {d: f"{base}/{d}" for d in (0, 3, 6)}
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def synthetic_hashes(n: int) -> list[str]:
+    return ["0x" + hashlib.sha256(f"tx{i}".encode()).hexdigest() for i in range(n)]
+
+
+def fixture_expected() -> dict[str, str]:
+    """录制数据里能解析的交易：目标链 tx hash -> 源链 tx hash"""
+    chains = fake_rpc_server.load_fixtures()
+    sources = {}
+    for domain, chain in chains.items():
+        for logs in chain["logs"].values():
+            for log in logs:
+                sources[(domain, int(log["topics"][1], 16))] = log["transactionHash"]
+    expected = {}
+    for chain in chains.values():
+        for h, receipt in chain["receipts"].items():
+            msg = decode_message_received(receipt)
+            if msg in sources:
+                expected[h] = sources[msg]
+    return expected
+
+
+def test_resolve_fixtures(rpc):
+    expected = fixture_expected()
+    assert expected
+    with open(fake_rpc_server.FIXTURE_PATH, encoding="utf-8") as f:
+        hashes = [h for chain in json.load(f).values() for h in chain["receipts"]]
+
+    with RpcClient(rpc()) as client:
+        records, leftover = client.resolve_many(hashes)
+
+    assert {r["query_tx_hash"]: r["sender_address"].lower() for r in records} == expected
+    assert sorted(leftover) == sorted(h for h in hashes if h.lower() not in expected)
+
+
+def test_resolve_synthetic_with_foreign_sources(rpc):
+    hashes = synthetic_hashes(200)
+    with RpcClient(rpc(synthetic=True, synthetic_domain=3, foreign_rate=0.2)) as client:
+        records, leftover = client.resolve_many(hashes + ["not-a-hash"])
+
+    for r in records:
+        assert r["sender_address"].lower() == "0x" + hashlib.sha256(r["query_tx_hash"].encode()).hexdigest()
+    # Solana 源链和不是 EVM hash 的交回网页解析
+    assert "not-a-hash" in leftover
+    assert len(records) + len(leftover) == len(hashes) + 1
+    assert 0 < len(leftover) < len(hashes)
+
+
+def test_window_fits_providers_limiting_log_range(rpc):
+    """节点限制 eth_getLogs 的块范围时，按 receive 时间收窄的窗口能查到；不收窄就全部查不到"""
+    endpoints = rpc(synthetic=True, synthetic_domain=3, max_log_range=200_000)
+    hashes = synthetic_hashes(20)
+
+    with RpcClient(endpoints, lookback_hours=24) as client:
+        records, leftover = client.resolve_many(hashes)
+    assert len(records) == len(hashes) and not leftover
+
+    with RpcClient(endpoints, lookback_hours=0) as client:
+        records, leftover = client.resolve_many(hashes)
+    assert not records and len(leftover) == len(hashes)
+
+
+def test_log_window():
+    clock = (1_000_000, 2_000_000, 2.0)           # 最新块 100 万，2 秒一个块
+    start, end = log_window(clock, since=2_000_000 - 3600, until=2_000_000 - 600)
+    assert start < 1_000_000 - 1800 and end <= 1_000_000
+    assert end >= 1_000_000 - 300
+    # 不早于起始块
+    assert log_window(clock, since=0, until=10, floor=900_000)[0] == 900_000
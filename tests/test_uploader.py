@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""ChunkedUploader：切块、部分失败后按 checkpoint 续传"""
+import csv
+import io
+import json
+
+import pytest
+
+from uploader import ChunkedUploader, file_digest, split_csv
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "results.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["query_tx_hash", "sender_address", "receiver_address"])
+        for i in range(200):
+            writer.writerow([f"0x{i:064x}", f"0X{i:064X}", f"0X{i + 1:064X}"])
+    return str(path)
+
+
+def rows_of(chunk: bytes) -> list[list[str]]:
+    return list(csv.reader(io.StringIO(chunk.decode("utf-8"))))
+
+
+def test_split_keeps_header_and_rows(csv_path):
+    chunks = split_csv(csv_path, chunk_bytes=4096)
+    assert len(chunks) > 3
+    assert all(len(c) <= 4096 for c in chunks)
+    header = rows_of(chunks[0])[0]
+    body = []
+    for c in chunks:
+        rows = rows_of(c)
+        assert rows[0] == header
+        body.extend(rows[1:])
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        assert body == list(csv.reader(f))[1:]
+
+
+def test_resume_after_partial_failure(csv_path, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    chunks = split_csv(csv_path, chunk_bytes=4096)
+    broken = chunks[2]
+    sent: list[bytes] = []
+
+    def flaky(data: bytes):
+        if data == broken:
+            raise ConnectionError("reset by peer")
+        sent.append(data)
+
+    with pytest.raises(RuntimeError, match="1/"):
+        ChunkedUploader(flaky, checkpoint, chunk_bytes=4096, attempts=1).upload_file(csv_path)
+    assert len(sent) == len(chunks) - 1
+    with open(checkpoint, encoding="utf-8") as f:
+        assert sorted(json.load(f)[file_digest(csv_path)]) == [i for i in range(len(chunks)) if i != 2]
+
+    # 重新运行（新的进程 = 新的 uploader）：只补传失败的那一块
+    resent: list[bytes] = []
+    stats = ChunkedUploader(resent.append, checkpoint, chunk_bytes=4096, attempts=1).upload_file(csv_path)
+    assert resent == [broken]
+    assert stats["chunks"] == len(chunks) and stats["skipped"] == len(chunks) - 1
+    # 全部确认后 checkpoint 清掉，同一份文件再传就是完整的一遍
+    with open(checkpoint, encoding="utf-8") as f:
+        assert json.load(f) == {}
+
+
+def test_checkpoint_is_per_file_content(csv_path, tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    chunks = split_csv(csv_path, chunk_bytes=4096)
+
+    def fail_last(data: bytes):
+        if data == chunks[-1]:
+            raise ConnectionError("reset by peer")
+
+    with pytest.raises(RuntimeError):
+        ChunkedUploader(fail_last, checkpoint, chunk_bytes=4096, attempts=1).upload_file(csv_path)
+
+    # 文件内容变了（追加了新结果）：旧的 checkpoint 不适用，全部重传
+    with open(csv_path, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow(["0x" + "f" * 64, "0X" + "E" * 64, "0X" + "D" * 64])
+    sent: list[bytes] = []
+    stats = ChunkedUploader(sent.append, checkpoint, chunk_bytes=4096, attempts=1).upload_file(csv_path)
+    assert stats["skipped"] == 0 and len(sent) == stats["chunks"]